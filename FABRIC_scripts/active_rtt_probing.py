@@ -1,60 +1,334 @@
+import asyncio
+import collections
 import subprocess
 import time
 import csv
 import argparse
 import os
+import socket
+import struct
 
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct('!BBHHH')
+# Kernel software timestamps (linux/net_tstamp.h, linux/errqueue.h). socket.SO_TIMESTAMPING is missing from older
+# Pythons; the values are the same on all Linux architectures we run.
+SO_TIMESTAMPING = getattr(socket, 'SO_TIMESTAMPING', 37)
+SOF_TIMESTAMPING_TX_SOFTWARE = 1 << 1
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_OPT_ID = 1 << 7
+SOF_TIMESTAMPING_TX_SCHED = 1 << 8
+SOF_TIMESTAMPING_OPT_TSONLY = 1 << 11
+TIMESTAMPING_FLAGS = (SOF_TIMESTAMPING_TX_SOFTWARE | SOF_TIMESTAMPING_TX_SCHED | SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE
+                      | SOF_TIMESTAMPING_OPT_ID | SOF_TIMESTAMPING_OPT_TSONLY)
+SCM_TSTAMP_SND = 0
+SCM_TSTAMP_SCHED = 1
+IP_RECVERR = 11
+SO_EE_ORIGIN_TIMESTAMPING = 4
+SOCK_EXTENDED_ERR = struct.Struct('=IBBBBII')
+TIMESPEC = struct.Struct('=qq')
+ANCILLARY_SIZE = 512
+PAYLOAD = bytes(range(56))  # Same payload size as ping
+REPLY_TIMEOUT = 1.0  # Seconds to wait for a reply, as ping -W 1
+RECEIVE_SIZE = 2048
 
-def ping_and_record(src_ip, dst_ip, run_time, interval, output_directory):
+FIELDNAMES = ["original_time_stamp", "time_stamp", "src_ip", "dst_ip", "rtt_ms", "seq", "lost"]
+
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def software_timestamp(ancdata):
+    # The software timestamp (the first of the three timespecs) of an SCM_TIMESTAMPING control message, in ns
+    for level, cmsg_type, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMPING and len(cmsg_data) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(cmsg_data)
+            if seconds or nanoseconds:
+                return seconds * 1000000000 + nanoseconds
+    return None
+
+
+class IcmpProber:
+    # Sends ICMP echo requests to one destination and times them with kernel software timestamps on both sides
+    # (SO_TIMESTAMPING): the send time of a request is read back from the socket's error queue, where the kernel
+    # reports when the packet was handed to the device (or, failing that, queued for it), and the receive time
+    # comes with the reply. Where the kernel provides neither, both ends are read from the clock in userspace
+    # instead, so the RTT also includes the send syscall and the wakeup of the event loop (typically tens of us).
+    # Uses an unprivileged ICMP datagram socket where net.ipv4.ping_group_range allows it, where the kernel picks
+    # the identifier and only delivers our replies, and a raw socket (root) otherwise.
+
+    def __init__(self, dst_ip):
+        self.dst_ip = dst_ip
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING, TIMESTAMPING_FLAGS)
+            self.kernel_timestamps = True
+        except OSError:
+            self.kernel_timestamps = False
+        self.sock.setblocking(False)
+        self.ident = os.getpid() & 0xFFFF
+        self.sent = {}  # seq mod 2^16 -> [userspace send ns, kernel SCHED ns, kernel SND ns, timestamp key]
+        self.tskeys = {}  # Timestamp key -> seq mod 2^16; with OPT_ID the kernel numbers the sent packets from 0
+        self.next_tskey = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, seq):
+        # Sends echo request `seq` (mod 2^16) and returns the CLOCK_REALTIME send time in ns read in userspace
+        seq &= 0xFFFF
+        header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, self.ident, seq)
+        packet = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, icmp_checksum(header + PAYLOAD), self.ident, seq) + PAYLOAD
+        send_ns = time.time_ns()
+        self.sock.sendto(packet, (self.dst_ip, 0))
+        self.sent[seq] = [send_ns, None, None, self.next_tskey]
+        if self.kernel_timestamps:
+            self.tskeys[self.next_tskey] = seq
+            self.next_tskey = (self.next_tskey + 1) & 0xFFFFFFFF
+        return send_ns
+
+    def forget(self, seq):
+        # Drops a probe that will not be answered any more (timed out)
+        entry = self.sent.pop(seq & 0xFFFF, None)
+        if entry is not None:
+            self.tskeys.pop(entry[3], None)
+
+    def read_send_timestamps(self):
+        # Collects the send timestamps the kernel queued on the error queue since the last call
+        while True:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(1, ANCILLARY_SIZE, socket.MSG_ERRQUEUE)
+            except BlockingIOError:
+                return
+            timestamp_ns = software_timestamp(ancdata)
+            for level, cmsg_type, cmsg_data in ancdata:
+                if level != socket.SOL_IP or cmsg_type != IP_RECVERR or len(cmsg_data) < SOCK_EXTENDED_ERR.size:
+                    continue
+                _, origin, _, _, _, stamp_type, tskey = SOCK_EXTENDED_ERR.unpack_from(cmsg_data)
+                entry = self.sent.get(self.tskeys.get(tskey))
+                if origin == SO_EE_ORIGIN_TIMESTAMPING and entry is not None and timestamp_ns is not None:
+                    if stamp_type == SCM_TSTAMP_SND:
+                        entry[2] = timestamp_ns
+                    elif stamp_type == SCM_TSTAMP_SCHED:
+                        entry[1] = timestamp_ns
+
+    def rtt_ns(self, seq, kernel_receive_ns, receive_ns):
+        # RTT of a replied probe: kernel send (preferably SND, else SCHED) to kernel receive timestamp when both
+        # exist, userspace send to userspace receive time otherwise, so a sample never pairs a kernel timestamp
+        # with a userspace one
+        entry = self.sent.pop(seq)
+        self.tskeys.pop(entry[3], None)
+        send_ns, sched_ns, snd_ns, _ = entry
+        kernel_send_ns = snd_ns if snd_ns is not None else sched_ns
+        if kernel_receive_ns is not None and kernel_send_ns is not None:
+            return kernel_receive_ns - kernel_send_ns
+        return receive_ns - send_ns
+
+    def receive(self):
+        # Returns (seq, RTT in ns) of the echo replies to our probes waiting on the socket
+        if self.kernel_timestamps:
+            self.read_send_timestamps()
+        replies = []
+        while True:
+            try:
+                data, ancdata, _, address = self.sock.recvmsg(RECEIVE_SIZE, ANCILLARY_SIZE)
+            except BlockingIOError:
+                return replies
+            receive_ns = time.time_ns()
+            # A raw socket sees the IP header and every ICMP message of the host
+            offset = (data[0] & 0x0F) * 4 if self.raw else 0
+            if len(data) < offset + ICMP_HEADER.size or address[0] != self.dst_ip:
+                continue
+            icmp_type, _, _, ident, seq = ICMP_HEADER.unpack_from(data, offset)
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident) or seq not in self.sent:
+                continue
+            if self.kernel_timestamps and self.sent[seq][2] is None:
+                self.read_send_timestamps()  # The send timestamp was queued after the error queue was read
+            replies.append((seq, self.rtt_ns(seq, software_timestamp(ancdata), receive_ns)))
+
+
+class ProbeTarget:
+    # Probes of one destination that are waiting for their reply or their timeout. Results are written in the
+    # order the probes were sent, so a reply that never comes delays the rows after it by at most REPLY_TIMEOUT.
+
+    def __init__(self, prober, src_ip, writer, start_time):
+        self.prober = prober
+        self.src_ip = src_ip
+        self.writer = writer
+        self.start_time = start_time
+        self.pending = collections.deque()  # [seq, CLOCK_REALTIME send ns, CLOCK_MONOTONIC send ns, rtt_ms]
+        self.by_seq = {}  # seq mod 2^16 -> pending entry
+        self.sent = 0
+        self.lost = 0
+
+    def send(self):
+        now = time.monotonic_ns()
+        entry = [self.sent, self.prober.send(self.sent), now, None]
+        self.pending.append(entry)
+        self.by_seq[self.sent & 0xFFFF] = entry
+        self.sent += 1
+        self.flush(now)
+
+    def on_readable(self):
+        for seq, rtt_ns in self.prober.receive():
+            entry = self.by_seq.pop(seq, None)
+            if entry is not None:
+                entry[3] = round(rtt_ns / 1e6, 3)
+        self.flush(time.monotonic_ns())
+
+    def flush(self, now, timeout_ns=int(REPLY_TIMEOUT * 1000000000)):
+        # Writes the leading probes that got a reply or timed out; a timeout is written as a loss row
+        while self.pending and (self.pending[0][3] is not None or now - self.pending[0][2] > timeout_ns):
+            seq, send_ns, _, rtt_ms = self.pending.popleft()
+            lost = rtt_ms is None
+            if lost:
+                self.by_seq.pop(seq & 0xFFFF, None)
+                self.prober.forget(seq)
+                self.lost += 1
+            original_time_stamp = send_ns / 1e9
+            self.writer.writerow(
+                {
+                    "original_time_stamp": original_time_stamp,
+                    "time_stamp": "{:.3f}".format(original_time_stamp - self.start_time),
+                    "src_ip": self.src_ip,
+                    "dst_ip": self.prober.dst_ip,
+                    "rtt_ms": "" if lost else rtt_ms,
+                    "seq": seq,
+                    "lost": int(lost),
+                }
+            )
+
+
+async def probe_target(target, interval_ns, start_ns, end_ns):
+    # Sends probes on absolute deadlines without waiting for replies, so many probes can be outstanding,
+    # then waits for the last replies or their timeouts
+    loop = asyncio.get_running_loop()
+    loop.add_reader(target.prober.fileno(), target.on_readable)
+    try:
+        next_send = start_ns
+        while next_send < end_ns:
+            delay = next_send - time.monotonic_ns()
+            if delay > 0:
+                await asyncio.sleep(delay / 1e9)
+            target.send()
+            next_send += interval_ns
+            now = time.monotonic_ns()
+            if now - next_send > interval_ns:
+                # Fell behind by more than an interval: skip the missed deadlines instead of bursting
+                next_send = now + interval_ns
+        while target.pending:
+            await asyncio.sleep(max(0, target.pending[0][2] + int(REPLY_TIMEOUT * 1000000000) - time.monotonic_ns()) / 1e9 + 0.001)
+            target.flush(time.monotonic_ns())
+    finally:
+        loop.remove_reader(target.prober.fileno())
+
+
+async def probe_targets(targets, run_time, interval):
+    start_ns = time.monotonic_ns()
+    await asyncio.gather(*(probe_target(target, int(interval * 1000000), start_ns, start_ns + run_time * 1000000000)
+                           for target in targets))
+
+
+def ping_and_record(src_ip, dst_ips, run_time, interval, output_directory):
+    # Probes every destination in dst_ips (a list or a comma-separated string) concurrently, one probe every
+    # `interval` ms each for run_time seconds. RTTs come from replies matched by sequence number; probes without
+    # a reply within REPLY_TIMEOUT are written as loss rows (lost=1, empty rtt_ms).
+    if isinstance(dst_ips, str):
+        dst_ips = dst_ips.split(",")
+    try:
+        probers = [IcmpProber(dst_ip) for dst_ip in dst_ips]
+    except OSError as e:
+        print(f"ICMP sockets are not available ({e}), probing with ping")
+        return ping_and_record_subprocess(src_ip, dst_ips, run_time, interval, output_directory)
+
+    file_path = f"{output_directory}/ping_active_rtt.csv"
+    start_time = time.time()
+    with open(file_path, mode="w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        targets = [ProbeTarget(prober, src_ip, writer, start_time) for prober in probers]
+        try:
+            asyncio.run(probe_targets(targets, run_time, interval))
+        finally:
+            for prober in probers:
+                prober.close()
+
+    for target in targets:
+        print(f"{target.prober.dst_ip}: {target.sent} probes, {target.lost} lost")
+    print(f"Ping and recording completed for {run_time} seconds.")
+
+
+def ping_and_record_subprocess(src_ip, dst_ips, run_time, interval, output_directory):
+    # Fallback for hosts without ICMP socket access: one ping process per target and sample, parsing time= from
+    # its output. Targets are pinged in turn, so a lost reply holds up the others for the -W 1 timeout.
     start_time = time.time()
     end_time = start_time + run_time
     file_path = f"{output_directory}/ping_active_rtt.csv"
 
     with open(file_path, mode="w", newline="") as csv_file:
-        fieldnames = ["original_time_stamp", "time_stamp", "src_ip", "dst_ip", "rtt_ms"]
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
         writer.writeheader()
 
+        # First ping to warm up the connection
+        for dst_ip in dst_ips:
+            subprocess.run(["ping", "-c", "1", "-W", "1", dst_ip], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        seq = 0
+        next_sample = time.monotonic()
         while time.time() < end_time:
-            original_time_stamp = time.time()
-
-            # First ping to warm up the connection
-            subprocess.run(
-                ["ping", "-c", "1", "-W", "1", dst_ip],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
+            for dst_ip in dst_ips:
+                original_time_stamp = time.time()
 
-            # Second ping to measure RTT
-            response = subprocess.run(
-                ["ping", "-c", "1", "-W", "1", dst_ip],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
+                response = subprocess.run(
+                    ["ping", "-c", "1", "-W", "1", dst_ip],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                )
+
+                rtt = ""
+                if response.returncode == 0:
+                    for line in response.stdout.split('\n'):
+                        if "time=" in line:
+                            rtt = float(line.split("time=")[1].split()[0])
+                writer.writerow(
+                    {
+                        "original_time_stamp": original_time_stamp,
+                        "time_stamp": "{:.3f}".format(original_time_stamp - start_time),
+                        "src_ip": src_ip,
+                        "dst_ip": dst_ip,
+                        "rtt_ms": rtt,
+                        "seq": seq,
+                        "lost": int(rtt == ""),
+                    }
+                )
+            seq += 1
 
-            #print("Ping output:", response.stdout)
-            #print("Ping error:", response.stderr)
-
-            if response.returncode == 0:
-                time_stamp = "{:.3f}".format(original_time_stamp - start_time)
-                output_lines = response.stdout.split('\n')
-                for line in output_lines:
-                    if "time=" in line:
-                        rtt_str = line.split("time=")[1].split()[0]
-                        rtt = float(rtt_str)
-                        writer.writerow(
-                            {
-                                "original_time_stamp": original_time_stamp,
-                                "time_stamp": time_stamp,
-                                "src_ip": src_ip,
-                                "dst_ip": dst_ip,
-                                "rtt_ms": rtt,
-                            }
-                        )
-
-            time.sleep(interval / 1000)  # Convert interval to seconds
+            next_sample += interval / 1000  # Convert interval to seconds
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
 
     print(f"Ping and recording completed for {run_time} seconds.")
 
@@ -62,9 +336,9 @@ def ping_and_record(src_ip, dst_ip, run_time, interval, output_directory):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ping and record RTT")
     parser.add_argument("src_ip", type=str, help="Source IP address")
-    parser.add_argument("dst_ip", type=str, help="Destination IP address")
+    parser.add_argument("dst_ip", type=str, help="Destination IP address, or a comma-separated list of addresses to probe concurrently")
     parser.add_argument("run_time", type=int, help="Run time in seconds")
-    parser.add_argument("interval", type=int, help="Interval in milliseconds")
+    parser.add_argument("interval", type=float, help="Interval in milliseconds")
     parser.add_argument("bw", type=str, help="Bandwidth")
     parser.add_argument("cca1", type=str, help="CCA1")
     parser.add_argument("cca2", type=str, help="CCA2")
@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+# Binary sample log: LOG_MAGIC, a little-endian uint32 header length, a JSON header (CSV columns, the run's
+# min_timestamp and min_monotonic_ns), then fixed-width records
+LOG_MAGIC = b'BUFLOG01'
+LOG_SUFFIX = '.bin'
+# Samples collected in memory before they are written with a single write()
+BATCH_RECORDS = 1024
+# Columns that are not stored: time_stamp_sec is derived from the monotonic timestamp when converting
+DERIVED_FIELDS = ('time_stamp_sec',)
+
+
+def record_dtype(fields):
+    # original_timestamp (CLOCK_REALTIME) as float64 and the paired CLOCK_MONOTONIC time in ns, followed by one
+    # uint64 per counter column
+    return np.dtype([('original_timestamp', '<f8'), ('monotonic_ns', '<i8')] +
+                    [(name, '<u8') for name in fields if name != 'original_timestamp' and name not in DERIVED_FIELDS])
+
+
+class BufferStatusLog:
+    # Append-only binary log of buffer_status samples. Samples go into a preallocated batch that is written out
+    # every BATCH_RECORDS samples, so the sampling loop does no per-sample open/write/close on the router.
+    # log_to_csv converts a log into the buffer_status CSV layout.
+
+    def __init__(self, log_file, fields, min_timestamp, min_monotonic_ns=0, expected_records=0, batch_records=BATCH_RECORDS):
+        self.log_file = log_file
+        self.fields = list(fields)
+        self.dtype = record_dtype(self.fields)
+        self.counter_names = self.dtype.names[2:]
+        self.batch = np.zeros(batch_records, dtype=self.dtype)
+        self.pending = 0
+        self.records = 0
+
+        self.file = open(log_file, 'wb')
+        header = json.dumps({'fields': self.fields, 'min_timestamp': min_timestamp, 'min_monotonic_ns': min_monotonic_ns}).encode()
+        self.file.write(LOG_MAGIC + struct.pack('<I', len(header)) + header)
+        self.data_offset = self.file.tell()
+        if expected_records and hasattr(os, 'posix_fallocate'):
+            # Reserve the space for the whole run up front so blocks are not allocated while sampling
+            self.file.flush()
+            os.posix_fallocate(self.file.fileno(), self.data_offset, expected_records * self.dtype.itemsize)
+
+    def append(self, original_timestamp, monotonic_ns, buffer_status):
+        self.batch[self.pending] = (original_timestamp, monotonic_ns) + tuple(buffer_status.get(name, 0) for name in self.counter_names)
+        self.pending += 1
+        if self.pending == len(self.batch):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.batch[:self.pending].tobytes())
+            self.file.flush()
+            self.records += self.pending
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        # Drop the part of the preallocated space that was not used
+        self.file.truncate(self.data_offset + self.records * self.dtype.itemsize)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_log(log_file):
+    # Returns (header, records) of a log. A log left behind by a killed sampler may end in a partial record or in
+    # preallocated zeros; both are dropped.
+    with open(log_file, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"Not a buffer status log: {log_file}")
+        header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]))
+        dtype = record_dtype(header['fields'])
+        data = f.read()
+    records = np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+    written = np.flatnonzero(records['original_timestamp'] != 0)
+    return header, records[:written[-1] + 1 if len(written) else 0]
+
+
+def log_to_csv(log_file, csv_file):
+    # Writes a log in the buffer_status CSV layout, with the same formatting the sampler used to write directly.
+    # Returns the number of rows.
+    header, records = read_log(log_file)
+    columns = []
+    for name in header['fields']:
+        if name == 'time_stamp_sec':
+            # Time since the start of the run on CLOCK_MONOTONIC, which NTP cannot step
+            elapsed = (records['monotonic_ns'] - header['min_monotonic_ns']) / 1e9
+            columns.append(["{:.3f}".format(value) for value in elapsed.tolist()])
+        else:
+            columns.append(records[name].tolist())
+    with open(csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header['fields'])
+        writer.writerows(zip(*columns))
+    return len(records)
+
+
+def convert_logs(logs, write_empty=True):
+    # Closes the logs of a sampler run, converts each one to the CSV next to it and removes the binary log.
+    # With write_empty=False a log without samples produces no CSV, as when the sampler wrote rows directly.
+    for log in logs:
+        log.close()
+        if log.records or write_empty:
+            log_to_csv(log.log_file, os.path.splitext(log.log_file)[0] + '.csv')
+        os.remove(log.log_file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python buffer_log.py <log_file> [<csv_file>]")
+    else:
+        log_file = sys.argv[1]
+        csv_file = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(log_file)[0] + '.csv'
+        print(f"Wrote {log_to_csv(log_file, csv_file)} rows to {csv_file}")
@@ -1,52 +1,19 @@
-import subprocess
-import csv
-import time
 import sys
 import os
-import pandas as pd
 
-def get_buffer_status(interface, output_file, min_timestamp):
-    cmd = f"tc -s qdisc show dev {interface}"
-    output = subprocess.check_output(cmd, shell=True, universal_newlines=True)
+import buffer_log
+import qdisc_stats
+import sample_scheduler
+import tc_netlink
 
-    # Parse the output to extract the buffer status
-    lines = output.split('\n')
-    buffer_status = {}
-    for line in lines:
-        if "Sent" in line or "backlog" in line:
-            tokens = line.strip().split()
-            if tokens[0] == "Sent":
-                buffer_status['sent_pkts'] = int(tokens[3])
-                dropped_index = tokens.index('(dropped')
-                dropped_value = tokens[dropped_index + 1]
-                dropped_value = dropped_value.replace(',', '')  # Remove the comma
-                buffer_status['dropped_pkts'] = int(dropped_value)
-                overlimits_index = tokens.index('overlimits')
-                buffer_status['overlimits_pkts'] = int(tokens[overlimits_index + 1])
-            elif tokens[0] == "backlog":
-                buffer_status['backlog_pkts'] = int(tokens[4])  # Update the index to 4
-                requeues_index = tokens.index('requeues')
-                requeues_value = tokens[requeues_index + 1]
-                requeues_value = requeues_value.rstrip(')')
-                buffer_status['requeues_pkts'] = int(requeues_value)
-    
-    if buffer_status:
-        original_timestamp = time.time()
-        timestamp = "{:.3f}".format(original_timestamp - min_timestamp)
-    
-        with open(output_file, 'a', newline='') as csvfile:
-            fieldnames = ['original_timestamp', 'time_stamp_sec', 'sent_pkts', 'dropped_pkts', 'overlimits_pkts', 'backlog_pkts', 'requeues_pkts']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-    
-            writer.writerow({
-                'original_timestamp': original_timestamp,
-                'time_stamp_sec': timestamp,
-                'sent_pkts': buffer_status.get('sent_pkts', 0),
-                'dropped_pkts': buffer_status.get('dropped_pkts', 0),
-                'overlimits_pkts': buffer_status.get('overlimits_pkts', 0),
-                'backlog_pkts': buffer_status.get('backlog_pkts', 0),
-                'requeues_pkts': buffer_status.get('requeues_pkts', 0)
-            })
+SAMPLE_INTERVAL = 0.001  # Seconds between samples
+
+def get_buffer_status(interface, log, sampler=None):
+    # Reads the qdiscs (over rtnetlink when a sampler is given, otherwise from tc) and logs the last one
+    qdisc = qdisc_stats.last_qdisc(qdisc_stats.sample_qdiscs(interface, sampler))
+    if qdisc is not None:
+        monotonic_ns, original_timestamp = sample_scheduler.paired_now()
+        log.append(original_timestamp, monotonic_ns, qdisc_stats.buffer_status(qdisc))
 
 if __name__ == '__main__':
     if len(sys.argv) < 8:
@@ -65,18 +32,27 @@ if __name__ == '__main__':
         output_directory = f"output/{bw}_{cca1}_{cca2}_{aqm}_{bdp}_{run}_buffer"
         os.makedirs(output_directory, exist_ok=True)
 
-        start_time = time.time()
-        end_time = start_time + runtime
+        start_monotonic_ns, start_time = sample_scheduler.paired_now()
         output_file = os.path.join(output_directory, output_filename)
         
         min_timestamp = start_time
 
-        # Create and write the header to the CSV file
-        with open(output_file, 'w', newline='') as csvfile:
-            fieldnames = ['original_timestamp', 'time_stamp_sec', 'sent_pkts', 'dropped_pkts', 'overlimits_pkts', 'backlog_pkts', 'requeues_pkts']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+        # Samples are logged in binary during the run and converted to the CSV file (header included) at the end
+        log = buffer_log.BufferStatusLog(os.path.splitext(output_file)[0] + buffer_log.LOG_SUFFIX, qdisc_stats.buffer_status_fields(),
+                                         min_timestamp, start_monotonic_ns, int(runtime / SAMPLE_INTERVAL))
+
+        # Read qdisc statistics over one rtnetlink socket; fall back to forking tc where that is not available
+        try:
+            sampler = tc_netlink.QdiscSampler(interface)
+        except (OSError, AttributeError):
+            sampler = None
+            print("rtnetlink is not available, sampling with tc")
+
+        # Sample at absolute 1 ms deadlines on CLOCK_MONOTONIC and report the achieved rate and jitter of the run
+        scheduler = sample_scheduler.DeadlineScheduler(SAMPLE_INTERVAL)
+        stats = scheduler.run(lambda: get_buffer_status(interface, log, sampler), runtime)
+        sample_scheduler.report(stats, os.path.splitext(output_file)[0] + '_sampling.json')
 
-        while time.time() < end_time:
-            get_buffer_status(interface, output_file, min_timestamp)
-            time.sleep(0.001)  # Sleep for 1 millisecond
+        log.close()
+        buffer_log.log_to_csv(log.log_file, output_file)
+        os.remove(log.log_file)
@@ -1,85 +1,25 @@
-import subprocess
-import csv
-import time
 import sys
 import os
 
-def get_buffer_status(interface, output_directory, min_timestamp):
-    cmd = f"tc -s qdisc show dev {interface}"
-    output = subprocess.check_output(cmd, shell=True, universal_newlines=True)
+import buffer_log
+import qdisc_stats
+import sample_scheduler
+import tc_netlink
 
-    # Parse the output to extract the buffer status
-    lines = output.split('\n')
-    buffer_status_tbf = {}
-    buffer_status_fq_codel = {}
-    processing = 0
-    for line in lines:
-        if "qdisc tbf" in line:
-            processing = 1
-            continue
-        elif "qdisc fq_codel" in line:
-            processing = 2
-            continue
-        elif "Sent" in line or "backlog" in line:
-            tokens = line.strip().split()
-            if processing == 1:
-                if tokens[0] == "Sent":
-                    buffer_status_tbf['sent_pkts'] = int(tokens[3])
-                    dropped_index = tokens.index('(dropped')
-                    dropped_value = tokens[dropped_index + 1]
-                    dropped_value = dropped_value.replace(',', '')  # Remove the comma
-                    buffer_status_tbf['dropped_pkts'] = int(dropped_value)
-                    overlimits_index = tokens.index('overlimits')
-                    buffer_status_tbf['overlimits_pkts'] = int(tokens[overlimits_index + 1])
-                elif tokens[0] == "backlog":
-                    buffer_status_tbf['backlog_pkts'] = int(tokens[4])  # Update the index to 4
-                    requeues_index = tokens.index('requeues')
-                    requeues_value = tokens[requeues_index + 1]
-                    requeues_value = requeues_value.rstrip(')')
-                    buffer_status_tbf['requeues_pkts'] = int(requeues_value)
-            elif processing == 2:
-                if tokens[0] == "Sent":
-                    buffer_status_fq_codel['sent_pkts'] = int(tokens[3])
-                    dropped_index = tokens.index('(dropped')
-                    dropped_value = tokens[dropped_index + 1]
-                    dropped_value = dropped_value.replace(',', '')  # Remove the comma
-                    buffer_status_fq_codel['dropped_pkts'] = int(dropped_value)
-                    overlimits_index = tokens.index('overlimits')
-                    buffer_status_fq_codel['overlimits_pkts'] = int(tokens[overlimits_index + 1])
-                elif tokens[0] == "backlog":
-                    buffer_status_fq_codel['backlog_pkts'] = int(tokens[4])  # Update the index to 4
-                    requeues_index = tokens.index('requeues')
-                    requeues_value = tokens[requeues_index + 1]
-                    requeues_value = requeues_value.rstrip(')')
-                    buffer_status_fq_codel['requeues_pkts'] = int(requeues_value)
-            else:
-                continue
+SAMPLE_INTERVAL = 0.001  # Seconds between samples
 
-    save_buffer_status_to_csv(buffer_status_tbf, output_directory, min_timestamp, 'buffer_status_tbf.csv')
-    save_buffer_status_to_csv(buffer_status_fq_codel, output_directory, min_timestamp, 'buffer_status_fq_codel.csv')
+# Qdisc kinds sampled and the buffer_status files they are written to
+BUFFER_FILES = (('tbf', 'buffer_status_tbf.csv'), ('fq_codel', 'buffer_status_fq_codel.csv'))
 
-def save_buffer_status_to_csv(buffer_status, output_directory, min_timestamp, filename):
-    if buffer_status:
-        original_timestamp = time.time()
-        timestamp = "{:.3f}".format(original_timestamp - min_timestamp)
-
-        with open(os.path.join(output_directory, filename), 'a', newline='') as csvfile:
-            fieldnames = ['original_timestamp', 'time_stamp_sec', 'sent_pkts', 'dropped_pkts', 'overlimits_pkts', 'backlog_pkts', 'requeues_pkts']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            # Check if the file is empty and write the header if needed
-            if os.stat(os.path.join(output_directory, filename)).st_size == 0:
-                writer.writeheader()
-
-            writer.writerow({
-                'original_timestamp': original_timestamp,
-                'time_stamp_sec': timestamp,
-                'sent_pkts': buffer_status.get('sent_pkts', 0),
-                'dropped_pkts': buffer_status.get('dropped_pkts', 0),
-                'overlimits_pkts': buffer_status.get('overlimits_pkts', 0),
-                'backlog_pkts': buffer_status.get('backlog_pkts', 0),
-                'requeues_pkts': buffer_status.get('requeues_pkts', 0)
-            })
+def get_buffer_status(interface, logs, sampler=None):
+    # Reads the tbf and fq_codel qdiscs (over rtnetlink when a sampler is given, otherwise from tc)
+    # and appends a sample to the log of each one that exists
+    qdiscs = qdisc_stats.sample_qdiscs(interface, sampler)
+    monotonic_ns, original_timestamp = sample_scheduler.paired_now()
+    for kind, log in logs.items():
+        qdisc = qdisc_stats.last_qdisc(qdiscs, kind)
+        if qdisc is not None:
+            log.append(original_timestamp, monotonic_ns, qdisc_stats.buffer_status(qdisc))
 
 if __name__ == '__main__':
     if len(sys.argv) < 8:
@@ -97,10 +37,24 @@ if __name__ == '__main__':
         output_directory = f"output/{bw}_{cca1}_{cca2}_{aqm}_{bdp}_{run}_buffer"
         os.makedirs(output_directory, exist_ok=True)
 
-        start_time = time.time()
-        end_time = start_time + runtime
+        start_monotonic_ns, start_time = sample_scheduler.paired_now()
 
         min_timestamp = start_time
-        while time.time() < end_time:
-            get_buffer_status(interface, output_directory, min_timestamp)
-            time.sleep(0.001)  # Sleep for 1 millisecond
+        # Samples are logged in binary during the run and converted to the CSV files at the end
+        logs = {kind: buffer_log.BufferStatusLog(os.path.join(output_directory, os.path.splitext(filename)[0] + buffer_log.LOG_SUFFIX),
+                                                 qdisc_stats.buffer_status_fields(kind), min_timestamp, start_monotonic_ns, int(runtime / SAMPLE_INTERVAL))
+                for kind, filename in BUFFER_FILES}
+        # Read qdisc statistics over one rtnetlink socket; fall back to forking tc where that is not available
+        try:
+            sampler = tc_netlink.QdiscSampler(interface)
+        except (OSError, AttributeError):
+            sampler = None
+            print("rtnetlink is not available, sampling with tc")
+
+        # Sample at absolute 1 ms deadlines on CLOCK_MONOTONIC and report the achieved rate and jitter of the run
+        scheduler = sample_scheduler.DeadlineScheduler(SAMPLE_INTERVAL)
+        stats = scheduler.run(lambda: get_buffer_status(interface, logs, sampler), runtime)
+        sample_scheduler.report(stats, os.path.join(output_directory, 'buffer_sampling.json'))
+
+        # As before, a qdisc that never showed up gets no CSV file
+        buffer_log.convert_logs(logs.values(), write_empty=False)
@@ -0,0 +1,93 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import pcap_reader
+import tcp_analysis
+
+# tshark fields reproduced by the builtin TCP tracker (see tcp_analysis.py), per table of process_pcap.py
+TSHARK_FIELDS = {'retx': 'tcp.analysis.retransmission', 'rtt': 'tcp.analysis.ack_rtt'}
+
+
+def tshark_output(pcap_file, field):
+    # Frame number and value of every packet tshark flags with the field, as tab-separated text
+    cmd = ['tshark', '-r', pcap_file, '-Y', field, '-T', 'fields', '-e', 'frame.number', '-e', field]
+    return subprocess.check_output(cmd).decode("utf-8")
+
+
+def parse_tshark_output(text, name):
+    # Maps frame numbers to the value of the table: 1 per retransmission, the ACK RTT in ms (rounded as in rtt.csv)
+    values = {}
+    for line in text.strip().split("\n"):
+        fields = line.split("\t")
+        if not fields[0]:
+            continue
+        values[int(fields[0])] = round(float(fields[1]) * 1000, 3) if name == 'rtt' else 1
+    return values
+
+
+def builtin_values(pcap_file):
+    # The same mapping from the builtin tracker, run over the whole capture in one pass
+    packets = pcap_reader.read_pcap_columns(pcap_file)
+    retx_index, rtt_index, rtt_ns = tcp_analysis.analyze_packets(packets)
+    pkt_num = packets['pkt_num']
+    return {
+        'retx': dict.fromkeys(pkt_num[retx_index].tolist(), 1),
+        'rtt': dict(zip(pkt_num[rtt_index].tolist(), [round(rtt / 1e6, 3) for rtt in rtt_ns.tolist()])),
+    }
+
+
+def expected_file(pcap_file, expected_directory, name):
+    return os.path.join(expected_directory, os.path.basename(pcap_file) + '.' + name + '.tsv')
+
+
+def tshark_values(pcap_file, expected_directory=None):
+    # tshark's values, from the recorded outputs in expected_directory if given, by running tshark otherwise
+    values = {}
+    for name, field in TSHARK_FIELDS.items():
+        if expected_directory is None:
+            text = tshark_output(pcap_file, field)
+        else:
+            with open(expected_file(pcap_file, expected_directory, name)) as f:
+                text = f.read()
+        values[name] = parse_tshark_output(text, name)
+    return values
+
+
+def compare(pcap_file, expected_directory=None):
+    # Returns one line per frame where the builtin tracker and tshark disagree
+    builtin = builtin_values(pcap_file)
+    tshark = tshark_values(pcap_file, expected_directory)
+    differences = []
+    for name in TSHARK_FIELDS:
+        for frame in sorted(set(builtin[name]) | set(tshark[name])):
+            if builtin[name].get(frame) != tshark[name].get(frame):
+                differences.append(f"{name} frame {frame}: builtin {builtin[name].get(frame)}, tshark {tshark[name].get(frame)}")
+    return differences
+
+
+def record(pcap_file, expected_directory):
+    # Saves tshark's output for the capture, so the comparison can run where tshark is not installed
+    for name, field in TSHARK_FIELDS.items():
+        with open(expected_file(pcap_file, expected_directory, name), 'w') as f:
+            f.write(tshark_output(pcap_file, field))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the builtin retransmission and ACK RTT analysis with tshark on a capture")
+    parser.add_argument("pcap_file", type=str, help="Capture to analyze (pcap or pcapng)")
+    parser.add_argument("--expected", type=str, default=None,
+                        help="Directory of recorded tshark outputs (<capture>.retx.tsv, <capture>.rtt.tsv) to use instead of running tshark")
+    parser.add_argument("--record", action='store_true', help="Run tshark and save its outputs to the --expected directory")
+    args = parser.parse_args()
+    if args.record:
+        if args.expected is None:
+            parser.error("--record needs --expected")
+        record(args.pcap_file, args.expected)
+
+    differences = compare(args.pcap_file, args.expected)
+    for difference in differences:
+        print(difference)
+    print(f"{len(differences)} differences between the builtin analysis and tshark")
+    sys.exit(1 if differences else 0)
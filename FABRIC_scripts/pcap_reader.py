@@ -0,0 +1,495 @@
+import gzip
+import io
+import mmap
+import os
+import socket
+import struct
+
+import numpy as np
+
+# Link-layer header types that tcpdump writes for the captures we take
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+RAW_LINKTYPES = (12, 14, LINKTYPE_RAW, LINKTYPE_IPV4)
+VECTORIZED_LINKTYPES = (LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2) + RAW_LINKTYPES
+
+ETHERTYPE_IPV4 = 0x0800
+VLAN_ETHERTYPES = (0x8100, 0x88a8, 0x9100)
+
+# Classic pcap magic numbers -> (byte order, multiplier from the fraction field to nanoseconds)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1000),
+    b'\xa1\xb2\xc3\xd4': ('>', 1000),
+    b'\x4d\x3c\xb2\xa1': ('<', 1),
+    b'\xa1\xb2\x3c\x4d': ('>', 1),
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_OBSOLETE_PACKET = 0x00000002
+PCAPNG_ENHANCED_PACKET = 0x00000006
+PCAPNG_IF_TSRESOL = 9
+
+NS_PER_SEC = 1000000000
+
+# Header-only archives: compressed classic pcap files with nanosecond timestamps. Frames are cut after the TCP header;
+# anything that is not IPv4/TCP keeps at most ARCHIVE_SNAPLEN bytes.
+COMPRESSED_SUFFIXES = ('.zst', '.gz')
+ARCHIVE_MAGIC = b'\x4d\x3c\xb2\xa1'
+ARCHIVE_SNAPLEN = 128
+
+# Fixed-layout headers, viewed in bulk over gathered header bytes by the vectorized decoder
+IPV4_HEADER_DTYPE = np.dtype([('version_ihl', 'u1'), ('tos', 'u1'), ('total_length', '>u2'), ('id', '>u2'), ('fragment', '>u2'),
+                              ('ttl', 'u1'), ('protocol', 'u1'), ('checksum', '>u2'), ('src', '>u4'), ('dst', '>u4')])
+TCP_HEADER_DTYPE = np.dtype([('src_port', '>u2'), ('dst_port', '>u2'), ('seq', '>u4'), ('ack', '>u4'), ('offset_flags', '>u2'),
+                             ('window', '>u2'), ('checksum', '>u2'), ('urgent', '>u2')])
+
+# Decoded packet columns yielded by iter_pcap_columns and iter_packet_batches
+# (in the field order returned by decode_ipv4_tcp, after pkt_num and ts_ns)
+PACKET_DTYPES = {
+    'pkt_num': np.int64, 'ts_ns': np.int64, 'src_ip': np.uint32, 'dst_ip': np.uint32, 'src_port': np.uint16, 'dst_port': np.uint16,
+    'seq': np.uint32, 'ack': np.uint32, 'flags': np.uint16, 'window': np.uint16, 'payload_length': np.int64, 'segment_size': np.int64,
+}
+
+# Records decoded per vectorized step and handed to the caller as one batch
+DECODE_BLOCK_SIZE = 262144
+# Packets decoded by the streaming decoder before a column batch is handed to the caller
+STREAM_BATCH_SIZE = 100000
+
+# TCP flag letters in bit order, the same way scapy prints tcp.flags (e.g. 'PA', 'SEC')
+TCP_FLAG_LETTERS = 'FSRPAUECN'
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+TCP_FLAG_STRINGS = [''.join(letter for bit, letter in enumerate(TCP_FLAG_LETTERS) if value & (1 << bit))
+                    for value in range(1 << len(TCP_FLAG_LETTERS))]
+
+
+def ns_to_seconds(ts_ns):
+    # Converts an integer nanosecond timestamp to float seconds, rounded the same way as float(packet.time) in scapy
+    return (ts_ns // NS_PER_SEC) + (ts_ns % NS_PER_SEC) / 1e9
+
+
+def ns_to_seconds_array(ts_ns):
+    # Vectorized ns_to_seconds, producing bit-identical floats
+    return (ts_ns // NS_PER_SEC).astype(np.float64) + (ts_ns % NS_PER_SEC) / 1e9
+
+
+def ipv4_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+
+def format_ipv4(addresses):
+    # Formats uint32 addresses as dotted quads, converting each distinct address only once
+    unique, inverse = np.unique(addresses, return_inverse=True)
+    names = np.array([socket.inet_ntoa(struct.pack('!I', int(address))) for address in unique], dtype=object)
+    return names[inverse.reshape(-1)]
+
+
+def open_capture(pcap_file):
+    # Opens a capture for reading, decompressing .zst (needs the zstandard package) and .gz archives on the fly
+    if pcap_file.endswith('.zst'):
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(pcap_file, 'rb'), closefd=True))
+    if pcap_file.endswith('.gz'):
+        return gzip.open(pcap_file, 'rb')
+    return open(pcap_file, 'rb')
+
+
+def archive_suffix():
+    # zstd when the zstandard package is installed, gzip otherwise
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return '.gz'
+    return '.zst'
+
+
+def open_archive_writer(archive_file):
+    if archive_file.endswith('.zst'):
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(archive_file, 'wb'), closefd=True)
+    return gzip.open(archive_file, 'wb', compresslevel=6)
+
+
+def iter_pcap_records(pcap_file):
+    # Yields (timestamp_ns, linktype, wire_length, frame_bytes) for every record of a pcap or pcapng file,
+    # reading one record at a time so the capture is never held in memory
+    with open_capture(pcap_file) as f:
+        magic = f.read(4)
+        if magic in PCAP_MAGIC:
+            yield from _iter_classic_records(f, magic)
+        elif magic == PCAPNG_MAGIC:
+            yield from _iter_pcapng_records(f, magic)
+        else:
+            raise ValueError(f"Unknown capture file format: {pcap_file}")
+
+
+def _iter_classic_records(f, magic):
+    endian, frac_to_ns = PCAP_MAGIC[magic]
+    header = f.read(20)
+    if len(header) < 20:
+        return
+    linktype = struct.unpack(endian + 'I', header[16:20])[0] & 0x0FFFFFFF
+    record_header = struct.Struct(endian + 'IIII')
+    while True:
+        raw_header = f.read(16)
+        if len(raw_header) < 16:
+            return
+        ts_sec, ts_frac, caplen, wirelen = record_header.unpack(raw_header)
+        data = f.read(caplen)
+        if len(data) < caplen:
+            return  # Truncated last record (tcpdump still writing or killed)
+        yield ts_sec * NS_PER_SEC + ts_frac * frac_to_ns, linktype, wirelen, data
+
+
+def _tsresol_to_ns(tsresol):
+    # if_tsresol is a power of 10 unless the top bit is set, in which case it is a power of 2.
+    # Returned as (multiplier, divisor) so 64-bit timestamps convert without float rounding.
+    if tsresol & 0x80:
+        return NS_PER_SEC, 1 << (tsresol & 0x7F)
+    if tsresol <= 9:
+        return 10 ** (9 - tsresol), 1
+    return 1, 10 ** (tsresol - 9)
+
+
+def _iter_pcapng_options(body, endian):
+    offset = 0
+    while offset + 4 <= len(body):
+        code, length = struct.unpack(endian + 'HH', body[offset:offset + 4])
+        if code == 0:
+            return
+        yield code, body[offset + 4:offset + 4 + length]
+        offset += 4 + ((length + 3) & ~3)
+
+
+def _iter_pcapng_records(f, magic):
+    endian = '<'
+    interfaces = []  # (linktype, (multiplier, divisor) to nanoseconds) per interface id
+    block_start = magic
+    while True:
+        raw_header = block_start + f.read(8 - len(block_start))
+        block_start = b''
+        if len(raw_header) < 8:
+            return
+        if raw_header[:4] == PCAPNG_MAGIC:
+            # A section header carries its own byte order, so read the byte-order magic before the length
+            bom = f.read(4)
+            endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+            block_length = struct.unpack(endian + 'I', raw_header[4:8])[0]
+            f.read(block_length - 12)
+            interfaces = []
+            continue
+
+        block_type, block_length = struct.unpack(endian + 'II', raw_header)
+        body = f.read(block_length - 8)
+        if len(body) < block_length - 8:
+            return
+        body = body[:-4]  # Trailing copy of the block length
+
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+            linktype = struct.unpack(endian + 'H', body[:2])[0]
+            ts_unit_ns = (1000, 1)
+            for code, value in _iter_pcapng_options(body[8:], endian):
+                if code == PCAPNG_IF_TSRESOL and value:
+                    ts_unit_ns = _tsresol_to_ns(value[0])
+            interfaces.append((linktype, ts_unit_ns))
+        elif block_type == PCAPNG_ENHANCED_PACKET:
+            interface_id, ts_high, ts_low, caplen, wirelen = struct.unpack(endian + 'IIIII', body[:20])
+            linktype, ts_unit_ns = interfaces[interface_id]
+            ts_ns = ((ts_high << 32) | ts_low) * ts_unit_ns[0] // ts_unit_ns[1]
+            yield ts_ns, linktype, wirelen, body[20:20 + caplen]
+        elif block_type == PCAPNG_OBSOLETE_PACKET:
+            interface_id, _, ts_high, ts_low, caplen, wirelen = struct.unpack(endian + 'HHIIII', body[:20])
+            linktype, ts_unit_ns = interfaces[interface_id]
+            ts_ns = ((ts_high << 32) | ts_low) * ts_unit_ns[0] // ts_unit_ns[1]
+            yield ts_ns, linktype, wirelen, body[20:20 + caplen]
+        # Simple packet blocks carry no timestamp and the remaining block types carry no packets
+
+
+def network_offset(linktype, data):
+    # Returns the offset of the IPv4 header inside a captured frame, or None if the frame is not IPv4
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        ethertype = (data[offset] << 8) | data[offset + 1] if len(data) >= 14 else None
+        while ethertype in VLAN_ETHERTYPES and len(data) >= offset + 8:
+            offset += 4
+            ethertype = (data[offset] << 8) | data[offset + 1]
+        return offset + 2 if ethertype == ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16 if len(data) >= 16 and (data[14] << 8) | data[15] == ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20 if len(data) >= 20 and (data[0] << 8) | data[1] == ETHERTYPE_IPV4 else None
+    if linktype in RAW_LINKTYPES:
+        return 0 if data and data[0] >> 4 == 4 else None
+    if linktype == LINKTYPE_NULL:
+        # BSD loopback stores the address family in host byte order
+        return 4 if len(data) >= 4 and (data[0] == socket.AF_INET or data[3] == socket.AF_INET) else None
+    return None
+
+
+def decode_ipv4_tcp(linktype, data, wirelen):
+    # Decodes the IPv4/TCP header fields of one frame without building any packet objects, with the
+    # addresses as integers (see format_ipv4). Returns None for anything that is not an unfragmented IPv4 TCP segment.
+    ip = network_offset(linktype, data)
+    if ip is None or len(data) < ip + 20:
+        return None
+    ihl = (data[ip] & 0x0F) * 4
+    if data[ip + 9] != socket.IPPROTO_TCP or (((data[ip + 6] << 8) | data[ip + 7]) & 0x1FFF):
+        return None
+    tcp = ip + ihl
+    if len(data) < tcp + 20:
+        return None
+
+    ip_total_length = (data[ip + 2] << 8) | data[ip + 3]
+    src_port, dst_port, seq, ack, offset_flags, window = struct.unpack_from('!HHIIHH', data, tcp)
+    tcp_header_length = (offset_flags >> 12) * 4
+    flags = offset_flags & 0x01FF
+
+    # Bytes carried by the segment according to the IP header, which is what the sequence space advances by
+    payload_length = max(ip_total_length - ihl - tcp_header_length, 0)
+    # Everything after the TCP header on the wire (includes link padding), which is what len(tcp.payload) gives in scapy.
+    # The wire length is used instead of the captured length so header-only captures decode identically.
+    segment_size = max(wirelen - tcp - tcp_header_length, 0)
+
+    src_ip, dst_ip = struct.unpack_from('!II', data, ip + 12)
+    return src_ip, dst_ip, src_port, dst_port, seq, ack, flags, window, payload_length, segment_size
+
+
+def is_ipv4_tcp(linktype, data):
+    # Whether a frame holds an unfragmented IPv4 TCP segment with its whole TCP header captured: the frames the
+    # decoders turn into packet rows, decided without decoding any field
+    ip = network_offset(linktype, data)
+    if ip is None or len(data) < ip + 20 or data[ip + 9] != socket.IPPROTO_TCP:
+        return False
+    if struct.unpack_from('!H', data, ip + 6)[0] & 0x1FFF:
+        return False
+    return len(data) >= ip + (data[ip] & 0x0F) * 4 + 20
+
+
+def count_ipv4_tcp_records(pcap_file):
+    # Counts the IPv4/TCP records of a capture by walking its record headers one at a time, separately from the
+    # decoders, so the tables written from the decoded packets can be checked against the capture itself
+    return sum(1 for _, linktype, _, data in iter_pcap_records(pcap_file) if is_ipv4_tcp(linktype, data))
+
+
+def header_length(linktype, data):
+    # Number of bytes of a frame needed to decode it again: up to the end of the TCP header for IPv4/TCP,
+    # at most ARCHIVE_SNAPLEN bytes of anything else
+    ip = network_offset(linktype, data)
+    if ip is None or len(data) < ip + 20 or data[ip + 9] != socket.IPPROTO_TCP:
+        return min(len(data), ARCHIVE_SNAPLEN)
+    tcp = ip + (data[ip] & 0x0F) * 4
+    if len(data) < tcp + 20:
+        return min(len(data), ARCHIVE_SNAPLEN)
+    return min(len(data), tcp + (data[tcp + 12] >> 4) * 4)
+
+
+def write_header_archive(pcap_file, archive_file):
+    # Rewrites a pcap or pcapng capture as a compressed classic pcap keeping only the headers of every frame.
+    # Timestamps (ns) and wire lengths are kept, so the decoders produce the same packet columns from the archive.
+    # Returns the number of records written.
+    linktype = None
+    records = 0
+    record_header = struct.Struct('<IIII')
+    with open_archive_writer(archive_file) as out:
+        for ts_ns, record_linktype, wirelen, data in iter_pcap_records(pcap_file):
+            if linktype is None:
+                linktype = record_linktype
+                out.write(ARCHIVE_MAGIC + struct.pack('<HHiIII', 2, 4, 0, 0, 262144, linktype))
+            elif record_linktype != linktype:
+                raise ValueError(f"Capture mixes link types {linktype} and {record_linktype}: {pcap_file}")
+            data = data[:header_length(linktype, data)]
+            out.write(record_header.pack(ts_ns // NS_PER_SEC, ts_ns % NS_PER_SEC, len(data), wirelen))
+            out.write(data)
+            records += 1
+        if linktype is None:
+            out.write(ARCHIVE_MAGIC + struct.pack('<HHiIII', 2, 4, 0, 0, 262144, LINKTYPE_ETHERNET))
+    return records
+
+
+def _empty_packet_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in PACKET_DTYPES.items()}
+
+
+def _packet_columns_from_rows(rows):
+    if not rows:
+        return _empty_packet_columns()
+    return {name: np.array(values, dtype=PACKET_DTYPES[name]) for name, values in zip(PACKET_DTYPES, zip(*rows))}
+
+
+def iter_packet_batches(pcap_file, batch_size=STREAM_BATCH_SIZE):
+    # Streams the records of a pcap or pcapng file and yields the decoded IPv4/TCP fields as column batches
+    # keyed like PACKET_DTYPES, so memory is bounded by the batch size instead of the size of the capture
+    rows = []
+    for pkt_num, (ts_ns, linktype, wirelen, data) in enumerate(iter_pcap_records(pcap_file), start=1):
+        fields = decode_ipv4_tcp(linktype, data, wirelen)
+        if fields is not None:
+            rows.append((pkt_num, ts_ns) + fields)
+            if len(rows) >= batch_size:
+                yield _packet_columns_from_rows(rows)
+                rows = []
+    if rows:
+        yield _packet_columns_from_rows(rows)
+
+
+def concat_packet_columns(batches):
+    # Joins column batches into the columns of the whole capture (for callers that need all of it at once)
+    batches = list(batches)
+    if not batches:
+        return _empty_packet_columns()
+    return {name: np.concatenate([batch[name] for batch in batches]).astype(dtype, copy=False) for name, dtype in PACKET_DTYPES.items()}
+
+
+def read_pcap_columns_streaming(pcap_file):
+    # All packet columns of a capture from the record-by-record decoder, held in memory at once
+    return concat_packet_columns(iter_packet_batches(pcap_file))
+
+
+def index_pcap_records(buf, endian):
+    # Walks the record headers of a classic pcap buffer and returns the offset of every complete record header
+    offsets = []
+    caplen_at = struct.Struct(endian + 'I').unpack_from
+    position = 24
+    size = len(buf)
+    while position + 16 <= size:
+        next_position = position + 16 + caplen_at(buf, position + 8)[0]
+        if next_position > size:
+            break  # Truncated last record (tcpdump still writing or killed)
+        offsets.append(position)
+        position = next_position
+    return np.array(offsets, dtype=np.int64)
+
+
+def _gather(buf, positions, width):
+    # Gathers `width` bytes at each position into an (n, width) array; positions past the end read the last byte
+    # and are always masked out by the caller's length checks
+    index = positions[:, None] + np.arange(width, dtype=np.int64)
+    np.minimum(index, len(buf) - 1, out=index)
+    return buf[index]
+
+
+def _be16(buf, positions):
+    pair = _gather(buf, positions, 2).astype(np.uint16)
+    return (pair[:, 0] << 8) | pair[:, 1]
+
+
+def _network_offsets(linktype, buf, data, caplen):
+    # Vectorized network_offset for VECTORIZED_LINKTYPES: returns (offset of the IPv4 header from the frame start, is-IPv4 mask)
+    if linktype == LINKTYPE_ETHERNET:
+        offset = np.full(len(data), 12, dtype=np.int64)
+        ethertype = _be16(buf, data + offset)
+        for _ in range(2):  # Up to two stacked VLAN tags (802.1ad)
+            tagged = np.isin(ethertype, VLAN_ETHERTYPES) & (caplen >= offset + 8)
+            offset[tagged] += 4
+            ethertype[tagged] = _be16(buf, data[tagged] + offset[tagged])
+        return offset + 2, (ethertype == ETHERTYPE_IPV4) & (caplen >= 14)
+    if linktype == LINKTYPE_LINUX_SLL:
+        return np.full(len(data), 16, dtype=np.int64), (_be16(buf, data + 14) == ETHERTYPE_IPV4) & (caplen >= 16)
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return np.full(len(data), 20, dtype=np.int64), (_be16(buf, data) == ETHERTYPE_IPV4) & (caplen >= 20)
+    if linktype in RAW_LINKTYPES:
+        return np.zeros(len(data), dtype=np.int64), ((buf[np.minimum(data, len(buf) - 1)] >> 4) == 4) & (caplen >= 1)
+    # LINKTYPE_NULL: BSD loopback stores the address family in host byte order
+    family = _gather(buf, data, 4)
+    return np.full(len(data), 4, dtype=np.int64), ((family[:, 0] == socket.AF_INET) | (family[:, 3] == socket.AF_INET)) & (caplen >= 4)
+
+
+def _decode_block(buf, record_dtype, frac_to_ns, linktype, offsets, first_pkt_num):
+    records = _gather(buf, offsets, 16).view(record_dtype).reshape(-1)
+    caplen = records['caplen'].astype(np.int64)
+    data = offsets + 16
+
+    l3, is_ipv4 = _network_offsets(linktype, buf, data, caplen)
+    keep = is_ipv4 & (caplen >= l3 + 20)
+    ip = _gather(buf, data + l3, 20).view(IPV4_HEADER_DTYPE).reshape(-1)
+    ihl = (ip['version_ihl'] & 0x0F).astype(np.int64) * 4
+    keep &= (ip['protocol'] == socket.IPPROTO_TCP) & ((ip['fragment'] & 0x1FFF) == 0)
+    tcp_start = l3 + ihl
+    keep &= caplen >= tcp_start + 20
+
+    index = np.flatnonzero(keep)
+    ip = ip[index]
+    tcp_start = tcp_start[index]
+    records = records[index]
+    tcp = _gather(buf, data[index] + tcp_start, 20).view(TCP_HEADER_DTYPE).reshape(-1)
+
+    tcp_header_length = (tcp['offset_flags'] >> 12).astype(np.int64) * 4
+    # Same definitions as decode_ipv4_tcp: IP-derived payload length and everything after the TCP header on the wire
+    payload_length = np.maximum(ip['total_length'].astype(np.int64) - ihl[index] - tcp_header_length, 0)
+    segment_size = np.maximum(records['wirelen'].astype(np.int64) - tcp_start - tcp_header_length, 0)
+
+    return {
+        'pkt_num': index + first_pkt_num,
+        'ts_ns': records['ts_sec'].astype(np.int64) * NS_PER_SEC + records['ts_frac'].astype(np.int64) * frac_to_ns,
+        'src_ip': ip['src'].astype(np.uint32),
+        'dst_ip': ip['dst'].astype(np.uint32),
+        'src_port': tcp['src_port'].astype(np.uint16),
+        'dst_port': tcp['dst_port'].astype(np.uint16),
+        'seq': tcp['seq'].astype(np.uint32),
+        'ack': tcp['ack'].astype(np.uint32),
+        'flags': (tcp['offset_flags'] & 0x01FF).astype(np.uint16),
+        'window': tcp['window'].astype(np.uint16),
+        'payload_length': payload_length,
+        'segment_size': segment_size,
+    }
+
+
+def iter_pcap_columns(pcap_file, batch_size=DECODE_BLOCK_SIZE):
+    # Vectorized decoder: memory-maps a classic pcap file, indexes its record headers and pulls the IPv4/TCP
+    # fields out in bulk, batch_size records at a time. Yields one dict of NumPy arrays keyed like PACKET_DTYPES per
+    # block, with pkt_num counting every record in the file (as in the scapy decoder), so only the record offsets
+    # and one block of columns are held at a time. Compressed archives are decompressed into memory instead of
+    # being mapped; pcapng files and other link types go through iter_packet_batches.
+    if pcap_file.endswith(COMPRESSED_SUFFIXES):
+        with open_capture(pcap_file) as f:
+            yield from _iter_classic_columns(f.read(), pcap_file, batch_size)
+        return
+
+    with open(pcap_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= 24:
+            yield from _iter_classic_columns(f.read(), pcap_file, batch_size)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _iter_classic_columns(mm, pcap_file, batch_size)
+
+
+def read_pcap_columns(pcap_file, block_size=DECODE_BLOCK_SIZE):
+    # All packet columns of a capture from the vectorized decoder, held in memory at once
+    return concat_packet_columns(iter_pcap_columns(pcap_file, block_size))
+
+
+def _iter_classic_columns(mm, pcap_file, block_size):
+    magic = bytes(mm[:4])
+    if magic == PCAPNG_MAGIC:
+        yield from iter_packet_batches(pcap_file, block_size)
+        return
+    if magic not in PCAP_MAGIC:
+        raise ValueError(f"Unknown capture file format: {pcap_file}")
+    if len(mm) <= 24:
+        return
+
+    endian, frac_to_ns = PCAP_MAGIC[magic]
+    linktype = struct.unpack_from(endian + 'I', mm, 20)[0] & 0x0FFFFFFF
+    if linktype not in VECTORIZED_LINKTYPES:
+        yield from iter_packet_batches(pcap_file, block_size)
+        return
+
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    record_dtype = np.dtype([('ts_sec', endian + 'u4'), ('ts_frac', endian + 'u4'), ('caplen', endian + 'u4'), ('wirelen', endian + 'u4')])
+    offsets = index_pcap_records(mm, endian)
+    try:
+        for start in range(0, len(offsets), block_size):
+            # The decoded columns are copies, so nothing refers to the mapped file once a block is yielded
+            block = _decode_block(buf, record_dtype, frac_to_ns, linktype, offsets[start:start + block_size], start + 1)
+            yield {name: block[name].astype(dtype, copy=False) for name, dtype in PACKET_DTYPES.items()}
+    finally:
+        del buf  # Release the buffer export before the mmap is closed
@@ -1,72 +1,288 @@
-import sys
-from scapy.all import rdpcap, TCP, IP, Raw
+import argparse
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 import os
+import re
 import subprocess
-from decimal import Decimal, ROUND_DOWN
 import shutil
+import tempfile
+from functools import partial
 from multiprocessing import Pool, cpu_count
 
-def extract_information(pcap_file):
-    # Extracts relevant information from pcap file
-    packets = rdpcap(pcap_file)
-    information = []
-    last_time = None
-    packet_map = {}  # Create a dictionary to store packets
-
-    for packet_num, packet in enumerate(packets, start=1):
-        if packet.haslayer(IP) and packet.haslayer(TCP):
-            tcp = packet[TCP]
-            # Check for ECN flags: ECE or CWR
-            ecn_flag = 1 if ('E' in tcp.flags or 'C' in tcp.flags) else 0  # 'E' for ECE, 'C' for CWR
-            ece_flag = 1 if 'E' in tcp.flags else 0  # ECE flag
-            cwr_flag = 1 if 'C' in tcp.flags else 0  # CWR flag
-
-            time_stamp = packet.time
-            src_ip = packet[IP].src
-            dst_ip = packet[IP].dst
-            src_port = tcp.sport
-            dst_port = tcp.dport
-            pkt_num = packet_num
-            tcp_seq = tcp.seq
-            ack_num = tcp.ack
-            tcp_flags = tcp.flags
-            payload_indicator = 1 if Raw in packet else 0
-            segment_size = len(packet[TCP].payload)
-            rwnd = tcp.window
-
-            # Determine congestion window size
-            if tcp.flags.P and tcp.flags.A and payload_indicator == 1:
-                cwnd = segment_size  # from sender to dest, we are assuming the CWND corresponds to the sent segment size
-            else:
-                cwnd = None
-
-            packet_map[tcp.seq] = packet
-            information.append([time_stamp, time_stamp, src_ip, src_port, dst_ip, dst_port, pkt_num, tcp_flags, payload_indicator,
-                                cwnd, rwnd, tcp_seq, ack_num, segment_size, ecn_flag, ece_flag, cwr_flag])
-
-    return information
-
-def process_information_data(information):
-    # Processes the extracted information data
-    column_names = ['original_time_stamp','time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'pkt_num', 'tcp_flags', 'payload',
-                    'cwnd_bytes', 'rwnd_bytes', 'tcp_seq', 'ack_num', 'segment_size_bytes', 'ECN', 'ECE_FLAG', 'CWR_FLAG']
-    df = pd.DataFrame(information, columns=column_names)
-    df['original_time_stamp'] = pd.to_numeric(df['original_time_stamp'])
-    df['time_stamp_sec'] = pd.to_numeric(df['time_stamp_sec'])
-    df.sort_values(by=['dst_port', 'src_port', 'time_stamp_sec'], inplace=True)
-
-    # Adjust timestamps relative to the first packet of each destination port
-    first_timestamp = df.groupby('dst_port')['time_stamp_sec'].transform('first')
-    df['time_stamp_sec'] = (df['time_stamp_sec'] - first_timestamp).round(3)
-        
-    return df, first_timestamp
-
-
-def save_to_csv(df, csv_file):
-    # Saves the information data to a CSV file
-    df.to_csv(csv_file, index=False)
+import pcap_reader
+import tcp_analysis
+from pcap_reader import TCP_ACK, TCP_CWR, TCP_ECE, TCP_PSH, TCP_FLAG_STRINGS
 
+INFORMATION_COLUMNS = ['original_time_stamp', 'time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'pkt_num', 'tcp_flags',
+                       'payload', 'cwnd_bytes', 'rwnd_bytes', 'tcp_seq', 'ack_num', 'segment_size_bytes', 'ECN', 'ECE_FLAG', 'CWR_FLAG']
+RETX_COLUMNS = ['original_time_stamp', 'time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'retx_pkts']
+RTT_COLUMNS = ['original_time_stamp', 'time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'rtt_ms']
+
+# Seconds of the preceding capture replayed into the TCP tracker before a worker's first chunk, so flow state
+# (outstanding segments, highest sequence, duplicate ACKs) is warm at the chunk boundary
+DEFAULT_OVERLAP_SEC = 1.0
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+# Rows of one run copied per step when the runs are merged into a table (see iter_merged_flows)
+MERGE_BLOCK_ROWS = 65536
+
+# What happens to the pcap directory once the tables are written and their row counts verified
+KEEP_PCAP_MODES = ('delete', 'keep', 'archive')
+ARCHIVE_DIRECTORY = 'pcap_archive'
+ARCHIVE_MANIFEST = 'manifest.json'
+
+# Column types of the per-chunk tables. IPs are kept as integers and tcp_flags as the flag bits until the rows are
+# written (see format_columns), so chunks stay compact. cwnd_bytes is float because it is NaN for packets without data.
+COLUMN_DTYPES = {
+    'original_time_stamp': np.float64, 'time_stamp_sec': np.float64, 'src_ip': np.uint32, 'src_port': np.uint16, 'dst_ip': np.uint32,
+    'dst_port': np.uint16, 'pkt_num': np.int64, 'tcp_flags': np.uint16, 'payload': np.uint8, 'cwnd_bytes': np.float64,
+    'rwnd_bytes': np.uint16, 'tcp_seq': np.uint32, 'ack_num': np.uint32, 'segment_size_bytes': np.int64, 'ECN': np.uint8,
+    'ECE_FLAG': np.uint8, 'CWR_FLAG': np.uint8, 'retx_pkts': np.int64, 'rtt_ms': np.float64, 'time_stamp_ns': np.int64,
+}
+
+
+def new_columns(column_names):
+    return {name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in column_names}
+
+
+def rows_to_columns(rows, column_names):
+    if not rows:
+        columns = new_columns(column_names)
+    else:
+        columns = {name: np.array(values, dtype=COLUMN_DTYPES[name]) for name, values in zip(column_names, zip(*rows))}
+    # Rows from tshark only carry float epoch seconds
+    columns['time_stamp_ns'] = np.round(columns['original_time_stamp'] * pcap_reader.NS_PER_SEC).astype(np.int64)
+    return columns
+
+
+def iter_packets_scapy(pcap_file, batch_size=pcap_reader.STREAM_BATCH_SIZE):
+    # Reference decoder: dissects every packet with scapy, streaming them with PcapReader, and yields the packet
+    # columns in batches of batch_size packets
+    from scapy.all import PcapReader, TCP, IP, Raw
+
+    rows = []
+    with PcapReader(pcap_file) as packets:
+        for packet_num, packet in enumerate(packets, start=1):
+            if packet.haslayer(IP) and packet.haslayer(TCP):
+                tcp = packet[TCP]
+                payload_length = len(packet[Raw].load) if Raw in packet else 0
+                rows.append((packet_num, int(packet.time * pcap_reader.NS_PER_SEC), pcap_reader.ipv4_to_int(packet[IP].src),
+                             pcap_reader.ipv4_to_int(packet[IP].dst), tcp.sport, tcp.dport, tcp.seq, tcp.ack, int(tcp.flags),
+                             tcp.window, payload_length, len(tcp.payload)))
+                if len(rows) >= batch_size:
+                    yield packet_columns(rows)
+                    rows = []
+    if rows:
+        yield packet_columns(rows)
+
+
+def packet_columns(rows):
+    return {name: np.array(values, dtype=dtype) for (name, dtype), values in zip(pcap_reader.PACKET_DTYPES.items(), zip(*rows))}
+
+
+# Packet decoders, each yielding the packet columns of a capture batch by batch (see pcap_reader.PACKET_DTYPES)
+DECODERS = {
+    'numpy': pcap_reader.iter_pcap_columns,
+    'stream': pcap_reader.iter_packet_batches,
+    'scapy': iter_packets_scapy,
+}
+
+# The three tables written for a run and their columns
+TABLES = (('extracted_information', INFORMATION_COLUMNS), ('retx', RETX_COLUMNS), ('rtt', RTT_COLUMNS))
+
+
+def information_from_packets(packets):
+    # Builds the extracted_information columns from decoded packet columns
+    flags = packets['flags']
+    time_stamp = pcap_reader.ns_to_seconds_array(packets['ts_ns'])
+    # Check for ECN flags: ECE or CWR
+    ece_flag = ((flags & TCP_ECE) != 0).astype(np.uint8)
+    cwr_flag = ((flags & TCP_CWR) != 0).astype(np.uint8)
+    payload_indicator = (packets['payload_length'] > 0).astype(np.uint8)
+    # Determine congestion window size: from sender to dest, we are assuming the CWND corresponds to the sent segment size
+    carries_data = ((flags & TCP_PSH) != 0) & ((flags & TCP_ACK) != 0) & (payload_indicator == 1)
+
+    return {
+        'time_stamp_ns': packets['ts_ns'],
+        'original_time_stamp': time_stamp,
+        'time_stamp_sec': time_stamp.copy(),
+        'src_ip': packets['src_ip'],
+        'src_port': packets['src_port'],
+        'dst_ip': packets['dst_ip'],
+        'dst_port': packets['dst_port'],
+        'pkt_num': packets['pkt_num'],
+        'tcp_flags': flags,
+        'payload': payload_indicator,
+        'cwnd_bytes': np.where(carries_data, packets['segment_size'], np.nan),
+        'rwnd_bytes': packets['window'],
+        'tcp_seq': packets['seq'],
+        'ack_num': packets['ack'],
+        'segment_size_bytes': packets['segment_size'],
+        'ECN': ece_flag | cwr_flag,
+        'ECE_FLAG': ece_flag,
+        'CWR_FLAG': cwr_flag,
+    }
+
+
+def format_columns(columns):
+    # Converts the compact columns to the values written to the CSV: dotted-quad IPs and scapy-style flag strings
+    formatted = dict(columns)
+    for name in ('src_ip', 'dst_ip'):
+        formatted[name] = pcap_reader.format_ipv4(columns[name])
+    if 'tcp_flags' in columns:
+        formatted['tcp_flags'] = np.array(TCP_FLAG_STRINGS, dtype=object)[columns['tcp_flags']]
+    return formatted
+
+
+def analyze_packets(packets, information, analyzer=None):
+    # Computes the retx and rtt tables from the decoded packets in the same pass that produced the packet table,
+    # instead of running tshark over the file again. Pass the analyzer of the previous chunk to carry flow state over.
+    retx_index, rtt_index, rtt_ns = tcp_analysis.analyze_packets(packets, analyzer)
+    retx = {name: information[name][retx_index] for name in ['time_stamp_ns'] + RETX_COLUMNS[:-1]}
+    retx['retx_pkts'] = np.ones(len(retx_index), dtype=np.int64)
+    rtt = {name: information[name][rtt_index] for name in ['time_stamp_ns'] + RTT_COLUMNS[:-1]}
+    rtt['rtt_ms'] = np.round(rtt_ns / 1e6, 3)
+    return retx, rtt
+
+
+def sort_by_flow(columns):
+    # Sorts one run's table by (dst_port, src_port, time); lexsort is stable, like the sort_values it replaces
+    order = np.lexsort((columns['original_time_stamp'], columns['src_port'], columns['dst_port']))
+    return {name: values[order] for name, values in columns.items()}
+
+
+def flow_runs(columns):
+    # Maps each flow key of a flow-sorted table to the (start, stop) rows of its run
+    keys = (columns['dst_port'].astype(np.uint32) << 16) | columns['src_port']
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+    stops = np.r_[starts[1:], len(keys)]
+    return dict(zip(keys[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+
+def iter_merged_flows(chunks, block_rows=MERGE_BLOCK_ROWS):
+    # k-way merge of runs that are each sorted by flow and time, yielding every flow in time order as consecutive
+    # slices, so no flow is ever held whole. Runs are in capture order (usually the files mapped by load_run): a flow
+    # whose runs follow each other in time is copied out run by run, block_rows rows at a time, and only a flow whose
+    # timestamps step back across a run boundary is merged by time (see merge_flow_parts).
+    runs = [flow_runs(chunk) for chunk in chunks]
+    for key in sorted(set().union(*runs)):
+        parts = [(chunk, chunk_runs[key]) for chunk, chunk_runs in zip(chunks, runs) if key in chunk_runs]
+        in_order = all(chunk['original_time_stamp'][start] >= previous['original_time_stamp'][previous_stop - 1]
+                       for (previous, (_, previous_stop)), (chunk, (start, _)) in zip(parts, parts[1:]))
+        if in_order:
+            for chunk, (start, stop) in parts:
+                for block_start in range(start, stop, block_rows):
+                    block_stop = min(block_start + block_rows, stop)
+                    yield {name: np.array(values[block_start:block_stop]) for name, values in chunk.items()}
+        else:
+            yield from merge_flow_parts(parts, block_rows)
+
+
+def merge_flow_parts(parts, block_rows):
+    # Merges the time-sorted runs of one flow by timestamp, holding about block_rows rows of each run at a time.
+    # Rows earlier than the last pending row of every run that still has rows on disk can no longer be preceded by
+    # anything unread, so they are yielded; ties stay in run order, as with a stable sort of the concatenated runs.
+    names = list(parts[0][0])
+    positions = [start for _, (start, _) in parts]
+    pending = [{name: np.array(chunk[name][:0]) for name in names} for chunk, _ in parts]
+
+    def read(index, count):
+        chunk, (_, stop) = parts[index]
+        position = positions[index]
+        positions[index] = min(position + count, stop)
+        pending[index] = {name: np.concatenate([pending[index][name], chunk[name][position:positions[index]]]) for name in names}
+
+    while True:
+        for index, (_, (_, stop)) in enumerate(parts):
+            missing = block_rows - len(pending[index]['original_time_stamp'])
+            if missing > 0 and positions[index] < stop:
+                read(index, missing)
+        unread = [index for index, (_, (_, stop)) in enumerate(parts) if positions[index] < stop]
+        if unread:
+            cutoff_index = min(unread, key=lambda index: pending[index]['original_time_stamp'][-1])
+            cutoff = pending[cutoff_index]['original_time_stamp'][-1]
+            ready = [part['original_time_stamp'] < cutoff for part in pending]
+            if not any(mask.any() for mask in ready):
+                read(cutoff_index, block_rows)  # A whole block of equal timestamps: read further into that run
+                continue
+        else:
+            ready = [np.ones(len(part['original_time_stamp']), dtype=bool) for part in pending]
+
+        merged = {name: np.concatenate([part[name][mask] for part, mask in zip(pending, ready)]) for name in names}
+        order = np.argsort(merged['original_time_stamp'], kind='stable')
+        yield {name: values[order] for name, values in merged.items()}
+        if not unread:
+            return
+        pending = [{name: values[~mask] for name, values in part.items()} for part, mask in zip(pending, ready)]
+
+
+def parquet_flow_table(pa, flow, column_names):
+    # Converts one flow to an Arrow table: int64 ns timestamps instead of float seconds, dictionary-encoded IPs,
+    # tcp_flags as the flag bits (uint16, since the NS flag is bit 8) and cwnd_bytes as a nullable integer
+    arrays = {}
+    for name in column_names:
+        values = flow[name]
+        if name == 'original_time_stamp':
+            arrays['time_stamp_ns'] = pa.array(flow['time_stamp_ns'], type=pa.int64())
+        elif name in ('src_ip', 'dst_ip'):
+            arrays[name] = pa.array(pcap_reader.format_ipv4(values), type=pa.string()).dictionary_encode()
+        elif name == 'cwnd_bytes':
+            missing = np.isnan(values)
+            arrays[name] = pa.array(np.where(missing, 0, values).astype(np.int32), mask=missing, type=pa.int32())
+        else:
+            arrays[name] = pa.array(values)
+    return pa.table(arrays)
+
+
+def save_merged_tables(chunks, column_names, table_path, outputs=('csv',), anchors=None):
+    # Writes the merged table flow by flow to table_path.csv and/or table_path.parquet, a slice of a flow at a time,
+    # so neither the full table nor a whole flow is built in memory. Every Parquet row group holds rows of a single
+    # flow, which lets readers skip flows by port.
+    # time_stamp_sec is relative to the anchor of the row's destination port in `anchors` (original_time_stamp by
+    # dst_port). Ports without an anchor are anchored at their first row, which is added to `anchors`: writing the
+    # packet table first with a shared dict puts the retx and rtt tables on the time base of its packets.
+    # Returns the number of rows.
+    if anchors is None:
+        anchors = {}
+    rows = 0
+    anchor_port = None
+    first_timestamp = None
+    csv_file = None
+    parquet_writer = None
+    if 'parquet' in outputs:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    try:
+        if 'csv' in outputs:
+            csv_file = open(table_path + '.csv', 'w')
+            csv_file.write(','.join(column_names) + '\n')
+        for flow in iter_merged_flows(chunks):
+            if flow['dst_port'][0] != anchor_port:
+                anchor_port = flow['dst_port'][0]
+                first_timestamp = anchors.setdefault(int(anchor_port), flow['original_time_stamp'][0])
+            flow['time_stamp_sec'] = np.round(flow['original_time_stamp'] - first_timestamp, 3)
+            if csv_file is not None:
+                pd.DataFrame(format_columns(flow), columns=column_names).to_csv(csv_file, header=False, index=False)
+            if 'parquet' in outputs:
+                table = parquet_flow_table(pa, flow, column_names)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(table_path + '.parquet', table.schema)
+                parquet_writer.write_table(table)
+            rows += len(flow['dst_port'])
+        if 'parquet' in outputs and parquet_writer is None:
+            # No rows: still write a file with the right schema
+            empty = {name: values[:0] for name, values in chunks[0].items()} if chunks else None
+            if empty is not None:
+                pq.write_table(parquet_flow_table(pa, empty, column_names), table_path + '.parquet')
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        if parquet_writer is not None:
+            parquet_writer.close()
+    return rows
 
 
 def analyze_retx_from_pcap(pcap_file):
@@ -82,9 +298,9 @@ def analyze_retx_from_pcap(pcap_file):
         if not fields[0]:
             continue
         time_stamp = float(fields[0])
-        src_ip = fields[1] if len(fields) > 1 else 'Unknown'
+        src_ip = pcap_reader.ipv4_to_int(fields[1]) if len(fields) > 1 and fields[1] else 0
         src_port = int(fields[2]) if fields[2] else 0
-        dst_ip = fields[3] if len(fields) > 3 else 'Unknown'
+        dst_ip = pcap_reader.ipv4_to_int(fields[3]) if len(fields) > 3 and fields[3] else 0
         dst_port = int(fields[4]) if fields[4] else 0
         retransmitted = int(fields[5]) if fields[5] else 0
 
@@ -93,19 +309,6 @@ def analyze_retx_from_pcap(pcap_file):
     return retx
 
 
-def process_retx_data(retx, first_timestamp):
-    # Processes the extracted retx data
-    column_names = ['original_time_stamp','time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'retx_pkts']
-    df = pd.DataFrame(retx, columns=column_names)
-    df['time_stamp_sec'] = pd.to_numeric(df['time_stamp_sec'])
-    df.sort_values(by=['dst_port', 'src_port', 'time_stamp_sec'], inplace=True)
-
-    # Adjust timestamps relative to the first packet of each destination port
-    df['time_stamp_sec'] = (df['time_stamp_sec'] - first_timestamp).round(3)
-        
-    return df
-
-
 def analyze_rtt_from_pcap(pcap_file):
     # Run tshark command to analyze the pcap file and filter retransmissions
     cmd = ['tshark', '-r', pcap_file, '-Y', 'tcp.analysis.ack_rtt', '-T', 'fields', '-e',
@@ -120,9 +323,9 @@ def analyze_rtt_from_pcap(pcap_file):
         if not fields[0]:
             continue
         time_stamp = float(fields[0])
-        src_ip = fields[1] if len(fields) > 1 else 'Unknown'
+        src_ip = pcap_reader.ipv4_to_int(fields[1]) if len(fields) > 1 and fields[1] else 0
         src_port = int(fields[2]) if fields[2] else 0
-        dst_ip = fields[3] if len(fields) > 3 else 'Unknown'
+        dst_ip = pcap_reader.ipv4_to_int(fields[3]) if len(fields) > 3 and fields[3] else 0
         dst_port = int(fields[4]) if fields[4] else 0
         rtt_ms = round(float(fields[5]) * 1000, 3) if fields[5] is not None else 0
 
@@ -131,66 +334,318 @@ def analyze_rtt_from_pcap(pcap_file):
     return rtts
 
 
-def process_rtt_data(rtt, first_timestamp):
-    # Processes the extracted rtt data
-    column_names = ['original_time_stamp','time_stamp_sec', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'rtt_ms']
-    df = pd.DataFrame(rtt, columns=column_names)
-    df['time_stamp_sec'] = pd.to_numeric(df['time_stamp_sec'])
-    df.sort_values(by=['dst_port', 'src_port', 'time_stamp_sec'], inplace=True)
-
-    # Adjust timestamps relative to the first packet of each destination port
-    df['time_stamp_sec'] = (df['time_stamp_sec'] - first_timestamp).round(3)
-        
-    return df
-
-def process_pcap_file(pcap_file):
-    information = extract_information(pcap_file)
-    retx = analyze_retx_from_pcap(pcap_file)
-    rtt = analyze_rtt_from_pcap(pcap_file)
-    return information, retx, rtt
-
-def main(base_directory):
-    pcap_directory = os.path.join(base_directory, 'pcap')
+def spill_run(columns, run_file):
+    # Writes a flow-sorted run as one .npy record array and returns its path, so workers hand their results to the
+    # parent through the disk instead of the pool
+    run = np.empty(len(columns['dst_port']), dtype=[(name, values.dtype) for name, values in columns.items()])
+    for name, values in columns.items():
+        run[name] = values
+    np.save(run_file, run)
+    return run_file
+
+
+def load_run(run_file):
+    # Maps a spilled run back as columns; rows are only read from disk when the merge copies them out
+    run = np.load(run_file, mmap_mode='r')
+    return {name: run[name] for name in run.dtype.names}
+
+
+def load_results(results):
+    return [{name: [load_run(run_file) for run_file in runs] for name, runs in result.items()} for result in results]
+
+
+def process_pcap_file(pcap_file, decoder='numpy', analysis='builtin', analyzer=None, spill_directory=None):
+    # Decodes and analyzes one chunk a batch at a time, so only one batch of packet columns is held while it is
+    # processed. Returns, per table name, the runs of the chunk: one compact column table sorted by flow per batch,
+    # or the path of the file it was spilled to when spill_directory is given.
+    runs = {name: [] for name, _ in TABLES}
+
+    def add_run(name, columns):
+        columns = sort_by_flow(columns)
+        if spill_directory is not None:
+            run_file = os.path.join(spill_directory, f"{os.path.basename(pcap_file)}.{name}.{len(runs[name])}.npy")
+            columns = spill_run(columns, run_file)
+        runs[name].append(columns)
+
+    for packets in DECODERS[decoder](pcap_file):
+        information = information_from_packets(packets)
+        if analysis == 'builtin':
+            retx, rtt = analyze_packets(packets, information, analyzer)
+            add_run('retx', retx)
+            add_run('rtt', rtt)
+        add_run('extracted_information', information)
+        del packets, information
+    if analysis == 'tshark':
+        add_run('retx', rows_to_columns(analyze_retx_from_pcap(pcap_file), RETX_COLUMNS))
+        add_run('rtt', rows_to_columns(analyze_rtt_from_pcap(pcap_file), RTT_COLUMNS))
+    return runs
+
+
+def read_tail(pcap_file, window_ns, start_ns=None, decoder='numpy'):
+    # Decodes the packets of a chunk captured from start_ns on, or in the last window_ns before its latest packet
+    # when start_ns is None, a batch at a time, keeping only the batches that can still fall in the window.
+    # Returns (packet columns, start of the window, timestamp of the chunk's first packet); the columns are None
+    # for a chunk without TCP packets.
+    tail = []
+    first_ns = None
+    end_ns = None
+    for packets in DECODERS[decoder](pcap_file):
+        ts_ns = packets['ts_ns']
+        if not len(ts_ns):
+            continue
+        if first_ns is None:
+            first_ns = int(ts_ns[0])
+        end_ns = int(ts_ns.max()) if end_ns is None else max(end_ns, int(ts_ns.max()))
+        cutoff = start_ns if start_ns is not None else end_ns - window_ns
+        tail = [batch for batch in tail if batch['ts_ns'].max() >= cutoff] + [packets]
+    if end_ns is None:
+        return None, start_ns, None
+
+    if start_ns is None:
+        start_ns = end_ns - window_ns
+    packets = pcap_reader.concat_packet_columns(tail)
+    keep = packets['ts_ns'] >= start_ns
+    return {name: values[keep] for name, values in packets.items()}, start_ns, first_ns
+
+
+def read_overlap(pcap_files, index, overlap_sec, decoder='numpy'):
+    # Decodes the packets captured in the last overlap_sec seconds before chunk `index`, walking back over as
+    # many preceding chunks as the window spans. Returns the packet columns in capture order.
+    parts = []
+    start_ns = None
+    for previous in range(index - 1, -1, -1):
+        if overlap_sec <= 0:
+            break
+        packets, start_ns, first_ns = read_tail(pcap_files[previous], int(overlap_sec * pcap_reader.NS_PER_SEC), start_ns, decoder)
+        if packets is None:
+            continue
+        parts.append(packets)
+        if first_ns < start_ns:
+            break
+    return parts[::-1]
+
+
+def process_pcap_range(chunk_range, pcap_files, decoder='numpy', analysis='builtin', overlap_sec=DEFAULT_OVERLAP_SEC,
+                       spill_directory=None):
+    # Processes a contiguous range of chunks with one TCP tracker, so flow state carries across the boundaries
+    # inside the range. The tracker is first warmed up on the overlap window before the range; nothing is
+    # reported for those packets, they only rebuild the state the previous worker had at the boundary.
+    start, stop = chunk_range
+    analyzer = tcp_analysis.TcpAnalyzer()
+    if analysis == 'builtin':
+        for packets in read_overlap(pcap_files, start, overlap_sec, decoder):
+            tcp_analysis.analyze_packets(packets, analyzer)
+    return [process_pcap_file(pcap_files[index], decoder, analysis, analyzer, spill_directory) for index in range(start, stop)]
+
+
+def chunk_ranges(count, parts):
+    # Splits chunk indices 0..count-1 into at most `parts` contiguous, nearly equal ranges
+    bounds = np.linspace(0, count, min(parts, count) + 1).round().astype(int).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def sorted_pcap_files(pcap_directory):
+    # tcpdump -C numbers the rotated files capture.pcap, capture.pcap1, capture.pcap2, ... in capture order
+    # (archived chunks carry an extra .zst or .gz suffix)
+    def chunk_number(file_name):
+        match = re.search(r'(\d+)(?:\.zst|\.gz)?$', file_name)
+        return (int(match.group(1)) if match else -1, file_name)
+    file_names = [file_name for file_name in os.listdir(pcap_directory) if file_name != ARCHIVE_MANIFEST]
+    return [os.path.join(pcap_directory, file_name) for file_name in sorted(file_names, key=chunk_number)]
+
+
+def table_rows(results, name, column_names):
+    # Rows of one table of per-chunk results as a set of tuples tagged with the chunk number, for comparing two runs
+    rows = set()
+    for number, result in enumerate(results):
+        for run in result[name]:
+            rows.update((number,) + row for row in zip(*(run[column].tolist() for column in column_names)))
+    return rows
+
+
+def validate_against_serial(pcap_files, results, decoder='numpy', spill_directory=None):
+    # Re-runs the analysis as a single serial pass over all chunks and reports rows that differ from the parallel run
+    serial = process_pcap_range((0, len(pcap_files)), pcap_files, decoder, 'builtin', 0, spill_directory)
+    if spill_directory is not None:
+        serial = load_results(serial)
+    mismatches = 0
+    for name, column_names in TABLES[1:]:
+        key_columns = ['original_time_stamp', 'src_port', 'dst_port', column_names[-1]]
+        parallel_rows = table_rows(results, name, key_columns)
+        serial_rows = table_rows(serial, name, key_columns)
+        only_parallel = len(parallel_rows - serial_rows)
+        only_serial = len(serial_rows - parallel_rows)
+        mismatches += only_parallel + only_serial
+        print(f"Validation {name}: {len(serial_rows)} serial rows, {only_serial} missing and {only_parallel} extra in parallel run")
+    return mismatches
+
+
+def file_sha256(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(partial(f.read, 1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_written_rows(table_path, outputs):
+    # Row counts of the written table files, read back from disk
+    counts = {}
+    if 'csv' in outputs:
+        with open(table_path + '.csv', 'rb') as f:
+            counts['csv'] = sum(block.count(b'\n') for block in iter(partial(f.read, 1 << 20), b'')) - 1
+    if 'parquet' in outputs and os.path.exists(table_path + '.parquet'):
+        import pyarrow.parquet as pq
+        counts['parquet'] = pq.ParquetFile(table_path + '.parquet').metadata.num_rows
+    return counts
+
+
+def verify_tables(tables, outputs):
+    # Checks every written table file against its expected number of rows. Returns a list of problems.
+    problems = []
+    for table_path, expected in tables:
+        for output, rows in count_written_rows(table_path, outputs).items():
+            if rows != expected:
+                problems.append(f"{table_path}.{output} has {rows} rows, expected {expected}")
+    return problems
+
+
+def archive_pcap_file(pcap_file, archive_directory, decoder='numpy'):
+    # Writes the header-only archive of one chunk and decodes it again, returning its manifest entry
+    archive_file = os.path.join(archive_directory, os.path.basename(pcap_file) + pcap_reader.archive_suffix())
+    try:
+        records = pcap_reader.write_header_archive(pcap_file, archive_file)
+        header_only = True
+    except ValueError:
+        # Mixed link types can't be written as one classic pcap: keep the whole capture, compressed
+        with open(pcap_file, 'rb') as source, pcap_reader.open_archive_writer(archive_file) as archive:
+            shutil.copyfileobj(source, archive, 1 << 20)
+        records = None
+        header_only = False
+    return {
+        'file': os.path.basename(archive_file),
+        'source_file': os.path.basename(pcap_file),
+        'source_bytes': os.path.getsize(pcap_file),
+        'source_sha256': file_sha256(pcap_file),
+        'archive_bytes': os.path.getsize(archive_file),
+        'archive_sha256': file_sha256(archive_file),
+        'header_only': header_only,
+        'records': records,
+        'tcp_packets': sum(len(packets['ts_ns']) for packets in DECODERS[decoder](archive_file)),
+    }
+
+
+def archive_pcap_files(pcap_files, archive_directory, tcp_packets, tables, processes, decoder='numpy'):
+    # Archives all chunks in parallel and writes the manifest. Returns a list of problems; the manifest is only
+    # written if every archive decodes to the same number of TCP packets as its source.
+    os.makedirs(archive_directory, exist_ok=True)
+    with Pool(processes=processes) as pool:
+        chunks = pool.map(partial(archive_pcap_file, archive_directory=archive_directory, decoder=decoder), pcap_files)
+
+    problems = [f"{chunk['file']} decodes to {chunk['tcp_packets']} TCP packets, expected {expected}"
+                for chunk, expected in zip(chunks, tcp_packets) if chunk['tcp_packets'] != expected]
+    if not problems:
+        manifest = {
+            'tables': {os.path.basename(table_path): rows for table_path, rows in tables},
+            'chunks': chunks,
+        }
+        with open(os.path.join(archive_directory, ARCHIVE_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return problems
+
+
+def main(base_directory, decoder='numpy', analysis='builtin', overlap_sec=DEFAULT_OVERLAP_SEC, validate=False, outputs=('csv',),
+         keep_pcap='delete', pcap_directory='pcap'):
+    if validate and analysis != 'builtin':
+        raise ValueError("validate compares the builtin analysis with a serial pass; use analysis='builtin'")
+    pcap_directory = os.path.join(base_directory, pcap_directory)
+    archive_directory = os.path.join(base_directory, ARCHIVE_DIRECTORY)
+    if os.path.abspath(pcap_directory) == os.path.abspath(archive_directory):
+        keep_pcap = 'keep'  # Reprocessing from the archive
     if os.path.exists(pcap_directory):
-        pcap_files = [os.path.join(pcap_directory, file_name) for file_name in os.listdir(pcap_directory)]
-
-        # Use multiprocessing to process pcap files in parallel
-        with Pool(processes=(int)(cpu_count()/2)) as pool:
-            results = pool.map(process_pcap_file, pcap_files)
-
-        information = []
-        retx = []
-        rtt = []
-        first_timestamp = None
-
-        for info, r, rt in results:
-            information.extend(info)
-            retx.extend(r)
-            rtt.extend(rt)
-
-        info_df, first_timestamp = process_information_data(information)
-        retx_df = process_retx_data(retx, first_timestamp)
-        rtt_df = process_rtt_data(rtt, first_timestamp)
-
-        information_csv_file = os.path.join(base_directory, 'extracted_information.csv')
-        retx_csv_file = os.path.join(base_directory, 'retx.csv')
-        rtt_csv_file = os.path.join(base_directory, 'rtt.csv')
-
-        save_to_csv(info_df, information_csv_file)
-        save_to_csv(retx_df, retx_csv_file)
-        save_to_csv(rtt_df, rtt_csv_file)
-
-        shutil.rmtree(pcap_directory)
+        pcap_files = sorted_pcap_files(pcap_directory)
+        if analysis == 'tshark' and len(pcap_files) > 1:
+            # tshark starts every chunk with no flow state, unlike the builtin tracker's ranges and overlap warm-up
+            print(f"Warning: tshark analyzes each of the {len(pcap_files)} pcap chunks on its own, so retransmissions and "
+                  "RTT samples next to the chunk boundaries are missed or misreported; use --analysis builtin")
+
+        # Use multiprocessing to process pcap files in parallel, one contiguous range of chunks per worker. Workers
+        # spill their sorted runs to disk and the tables are merged from the mapped files, so memory stays bounded
+        # by a batch per worker and a merge block per run, whatever the size of the capture.
+        processes = max(1, cpu_count() // 2)
+        spill_directory = tempfile.mkdtemp(prefix='.process_pcap-', dir=base_directory)
+        try:
+            with Pool(processes=processes) as pool:
+                results = []
+                for range_results in pool.imap(partial(process_pcap_range, pcap_files=pcap_files, decoder=decoder, analysis=analysis,
+                                                       overlap_sec=overlap_sec, spill_directory=spill_directory),
+                                               chunk_ranges(len(pcap_files), processes)):
+                    results.extend(range_results)
+                # IPv4/TCP records per chunk from a separate walk over the record headers, the reference for the
+                # row count of the packet table
+                tcp_packets = pool.map(pcap_reader.count_ipv4_tcp_records, pcap_files)
+            results = load_results(results)
+
+            if validate:
+                serial_directory = os.path.join(spill_directory, 'serial')
+                os.mkdir(serial_directory)
+                validate_against_serial(pcap_files, results, decoder, serial_directory)
+
+            # The packet table is written first; its first packet of each destination port anchors time_stamp_sec
+            # in all three tables
+            tables = []
+            anchors = {}
+            for name, column_names in TABLES:
+                runs = [run for result in results for run in result[name]]
+                table_path = os.path.join(base_directory, name)
+                save_merged_tables(runs, column_names, table_path, outputs, anchors)
+                expected = sum(tcp_packets) if name == 'extracted_information' else sum(len(run['dst_port']) for run in runs)
+                tables.append((table_path, expected))
+            del results, runs  # Unmap the spilled runs before their files are removed
+        finally:
+            shutil.rmtree(spill_directory)
+
+        # Only remove the capture once the packet table on disk holds one row per IPv4/TCP record of the capture and
+        # the retx and rtt tables one row per analysis result
+        problems = verify_tables(tables, outputs)
+        if not problems and keep_pcap == 'archive':
+            problems = archive_pcap_files(pcap_files, archive_directory, tcp_packets, tables, processes, decoder)
+
+        if problems:
+            print("Verification failed, keeping " + pcap_directory)
+            for problem in problems:
+                print("  " + problem)
+        elif keep_pcap in ('delete', 'archive'):
+            shutil.rmtree(pcap_directory)
 
         print("Extraction and analysis complete.")
 
 if __name__ == "__main__":
-    # Get the base_directory from the command line argument
-    if len(sys.argv) > 1:
-        base_directory = sys.argv[1]
-        print(base_directory)
-    else:
-        print("Please provide the base_directory as a command-line argument.")
-        sys.exit(1)
-
-    main(base_directory)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract packet, retransmission and RTT data from the pcap chunks of a run")
+    parser.add_argument("base_directory", type=str, help="Run directory containing the pcap/ directory")
+    parser.add_argument("--decoder", choices=sorted(DECODERS), default='numpy',
+                        help="Packet decoder: vectorized NumPy decoder (default), streaming raw-header parser, or scapy")
+    parser.add_argument("--analysis", choices=['builtin', 'tshark'], default='builtin',
+                        help="Retransmission and ACK RTT analysis: the in-process TCP tracker (default), whose flow state carries "
+                             "across chunk boundaries, or two tshark passes per file, which restart at every chunk")
+    parser.add_argument("--overlap-sec", type=float, default=DEFAULT_OVERLAP_SEC,
+                        help="Seconds of the preceding chunk replayed to warm up the TCP tracker of each worker (builtin analysis)")
+    parser.add_argument("--validate", action='store_true',
+                        help="Also run the builtin analysis as one serial pass over all chunks and report differing rows (needs --analysis builtin)")
+    parser.add_argument("--output", type=str, default='csv',
+                        help="Comma-separated output formats of the three tables: csv (default) and/or parquet (needs pyarrow)")
+    parser.add_argument("--keep-pcap", choices=KEEP_PCAP_MODES, default='delete',
+                        help="After the tables are written and verified: delete the pcap directory (default), keep it, or "
+                             f"replace it with header-only compressed copies and a checksum manifest in {ARCHIVE_DIRECTORY}/")
+    parser.add_argument("--pcap-directory", type=str, default='pcap',
+                        help=f"Directory of the pcap chunks inside base_directory (use {ARCHIVE_DIRECTORY} to reprocess an archive)")
+    args = parser.parse_args()
+    outputs = args.output.split(',')
+    if not outputs or any(output not in OUTPUT_FORMATS for output in outputs):
+        parser.error(f"--output must be a comma-separated list of {', '.join(OUTPUT_FORMATS)}")
+    if args.validate and args.analysis != 'builtin':
+        parser.error("--validate checks the builtin analysis and cannot be used with --analysis tshark")
+    print(args.base_directory)
+
+    main(args.base_directory, args.decoder, args.analysis, args.overlap_sec, args.validate, outputs, args.keep_pcap,
+         args.pcap_directory)
\ No newline at end of file
@@ -0,0 +1,89 @@
+import re
+import subprocess
+
+# Lines of `tc -s qdisc show`: a header per qdisc followed by its statistics, e.g.
+#   qdisc red 2: parent 1:1 limit 400000b min 30000b max 90000b ecn
+#    Sent 1234 bytes 10 pkt (dropped 0, overlimits 0 requeues 0)
+#    backlog 0b 0p requeues 0
+#     marked 0 early 0 pdrop 0 other 0
+QDISC_HEADER = re.compile(r'^qdisc (\S+) ([0-9a-f]*):\s*(?:root|parent (\S+))?')
+SENT_LINE = re.compile(r'Sent (\d+) bytes (\d+) pkts? \(dropped (\d+), overlimits (\d+) requeues (\d+)\)')
+BACKLOG_LINE = re.compile(r'backlog (\d+(?:\.\d+)?)([KMG]?)b (\d+)p requeues (\d+)')
+# Extended statistics are printed as "name value" pairs (RED, fq_codel, fq, cake, ...)
+COUNTER = re.compile(r'(?:^|\s)([a-z][a-z_]*) (\d+)(?=\s|$)')
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# Columns of the buffer_status CSVs. sent_bytes and backlog_bytes follow the original columns, then the
+# AQM-internal counters of the sampled qdisc kind.
+BUFFER_STATUS_FIELDS = ['original_timestamp', 'time_stamp_sec', 'sent_pkts', 'dropped_pkts', 'overlimits_pkts', 'backlog_pkts',
+                        'requeues_pkts', 'sent_bytes', 'backlog_bytes']
+AQM_FIELDS = {
+    'red': ('early', 'pdrop', 'other', 'marked'),
+    'fq_codel': ('maxpacket', 'drop_overlimit', 'ecn_mark', 'new_flow_count', 'new_flows_len', 'old_flows_len', 'ce_mark',
+                 'memory_used', 'drop_overmemory'),
+}
+
+
+def parse_tc_qdisc(output):
+    # Parses the output of `tc -s qdisc show` in one pass. Returns one dict per qdisc, in the order tc prints
+    # them, with the same keys as tc_netlink.QdiscSampler.sample: kind, handle, parent, bytes, packets, drops,
+    # overlimits, requeues, backlog (bytes), qlen (packets) and any extended counters.
+    qdiscs = []
+    qdisc = None
+    for line in output.splitlines():
+        header = QDISC_HEADER.match(line)
+        if header:
+            qdisc = {'kind': header.group(1), 'handle': header.group(2), 'parent': header.group(3) or 'root'}
+            qdiscs.append(qdisc)
+            continue
+        if qdisc is None:
+            continue
+        sent = SENT_LINE.search(line)
+        if sent:
+            qdisc['bytes'], qdisc['packets'], qdisc['drops'], qdisc['overlimits'], qdisc['requeues'] = map(int, sent.groups())
+            continue
+        backlog = BACKLOG_LINE.search(line)
+        if backlog:
+            size, unit, qlen, requeues = backlog.groups()
+            qdisc['backlog'] = int(float(size) * SIZE_UNITS[unit])
+            qdisc['qlen'] = int(qlen)
+            qdisc['requeues'] = int(requeues)
+            continue
+        if 'bytes' in qdisc:
+            for name, value in COUNTER.findall(line):
+                qdisc[name] = int(value)
+    return qdiscs
+
+
+def sample_qdiscs(interface, sampler=None):
+    # Reads the qdiscs of an interface over rtnetlink when a tc_netlink.QdiscSampler is given, otherwise from tc
+    if sampler is not None:
+        return sampler.sample()
+    output = subprocess.check_output(["tc", "-s", "qdisc", "show", "dev", interface], universal_newlines=True)
+    return parse_tc_qdisc(output)
+
+
+def last_qdisc(qdiscs, kind=None):
+    # The last qdisc (of a kind) in the order tc prints them
+    matching = [qdisc for qdisc in qdiscs if kind is None or qdisc['kind'] == kind]
+    return matching[-1] if matching else None
+
+
+def buffer_status_fields(kind=None):
+    return BUFFER_STATUS_FIELDS + list(AQM_FIELDS.get(kind, ()))
+
+
+def buffer_status(qdisc):
+    # Maps a sampled qdisc to the buffer_status CSV columns (without the timestamps)
+    status = {
+        'sent_pkts': qdisc.get('packets', 0),
+        'dropped_pkts': qdisc.get('drops', 0),
+        'overlimits_pkts': qdisc.get('overlimits', 0),
+        'backlog_pkts': qdisc.get('qlen', 0),
+        'requeues_pkts': qdisc.get('requeues', 0),
+        'sent_bytes': qdisc.get('bytes', 0),
+        'backlog_bytes': qdisc.get('backlog', 0),
+    }
+    for field in AQM_FIELDS.get(qdisc['kind'], ()):
+        status[field] = qdisc.get(field, 0)
+    return status
@@ -0,0 +1,124 @@
+import ctypes
+import ctypes.util
+import json
+import sys
+import time
+from array import array
+
+import numpy as np
+
+NS_PER_SEC = 1000000000
+TIMER_ABSTIME = 1
+PR_SET_TIMERSLACK = 29
+# Timer slack requested for the sampling thread (ns); the Linux default of 50 us would dominate the jitter
+TIMER_SLACK_NS = 1000
+
+# Bin edges (us) of the inter-sample jitter histogram: the deviation of each sample interval from the target
+JITTER_BIN_EDGES_US = [-1000, -500, -200, -100, -50, -20, -10, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+
+
+def monotonic_ns():
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+
+def paired_now():
+    # Reads CLOCK_MONOTONIC and CLOCK_REALTIME back to back: the monotonic time orders and spaces the samples,
+    # the realtime timestamp aligns them with the packet captures of the other hosts
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC), time.time()
+
+
+class DeadlineScheduler:
+    # Calls a sample function at absolute CLOCK_MONOTONIC deadlines start + k * interval, so the period does not
+    # stretch by the time each sample takes and does not drift. Sleeps with clock_nanosleep(TIMER_ABSTIME) where
+    # libc provides it (and time.sleep otherwise), optionally busy-waiting the last `spin` seconds. A deadline
+    # that has already passed by more than one interval is counted as missed and skipped instead of bursting.
+
+    def __init__(self, interval, spin=0.0):
+        self.interval_ns = int(round(interval * NS_PER_SEC))
+        self.spin_ns = int(spin * NS_PER_SEC)
+        self.libc = _load_libc()
+        self.clock_nanosleep = getattr(self.libc, 'clock_nanosleep', None)
+        if self.clock_nanosleep is not None:
+            self.clock_nanosleep.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+            self.libc.prctl(PR_SET_TIMERSLACK, ctypes.c_ulong(TIMER_SLACK_NS), 0, 0, 0)
+        self.starts = array('q')
+        self.missed = 0
+
+    def sleep_until(self, deadline_ns):
+        wake_ns = deadline_ns - self.spin_ns
+        if self.clock_nanosleep is not None:
+            request = _Timespec(wake_ns // NS_PER_SEC, wake_ns % NS_PER_SEC)
+            while self.clock_nanosleep(time.CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(request), None) == 4:  # EINTR
+                pass
+        else:
+            delay = (wake_ns - monotonic_ns()) / NS_PER_SEC
+            if delay > 0:
+                time.sleep(delay)
+        while self.spin_ns and monotonic_ns() < deadline_ns:
+            pass
+
+    def run(self, sample, duration):
+        # Calls sample() at every deadline for `duration` seconds and returns the sampling statistics
+        start_ns = monotonic_ns()
+        end_ns = start_ns + int(duration * NS_PER_SEC)
+        deadline_ns = start_ns
+        while deadline_ns < end_ns:
+            now_ns = monotonic_ns()
+            if now_ns < deadline_ns:
+                self.sleep_until(deadline_ns)
+                now_ns = monotonic_ns()
+            elif now_ns - deadline_ns > self.interval_ns:
+                skipped = (now_ns - deadline_ns) // self.interval_ns
+                self.missed += skipped
+                deadline_ns += skipped * self.interval_ns
+            self.starts.append(now_ns)
+            sample()
+            deadline_ns += self.interval_ns
+        return self.stats(monotonic_ns() - start_ns)
+
+    def stats(self, elapsed_ns):
+        starts = np.frombuffer(self.starts, dtype=np.int64) if len(self.starts) else np.empty(0, dtype=np.int64)
+        jitter_us = (np.diff(starts) - self.interval_ns) / 1000
+        edges = [-np.inf] + JITTER_BIN_EDGES_US + [np.inf]
+        counts = np.histogram(jitter_us, bins=edges)[0] if len(jitter_us) else np.zeros(len(edges) - 1, dtype=np.int64)
+        labels = [f'< {JITTER_BIN_EDGES_US[0]}'] + [f'{low} .. {high}' for low, high in zip(JITTER_BIN_EDGES_US[:-1], JITTER_BIN_EDGES_US[1:])] \
+            + [f'>= {JITTER_BIN_EDGES_US[-1]}']
+        abs_jitter = np.abs(jitter_us)
+        return {
+            'samples': len(starts),
+            'elapsed_sec': round(elapsed_ns / NS_PER_SEC, 6),
+            'target_hz': NS_PER_SEC / self.interval_ns,
+            'achieved_hz': round(len(starts) / (elapsed_ns / NS_PER_SEC), 3) if elapsed_ns else 0.0,
+            'missed_deadlines': int(self.missed),
+            'clock_nanosleep': self.clock_nanosleep is not None,
+            'jitter_us_p50': round(float(np.percentile(abs_jitter, 50)), 3) if len(abs_jitter) else 0.0,
+            'jitter_us_p99': round(float(np.percentile(abs_jitter, 99)), 3) if len(abs_jitter) else 0.0,
+            'jitter_us_max': round(float(abs_jitter.max()), 3) if len(abs_jitter) else 0.0,
+            'jitter_histogram_us': dict(zip(labels, counts.tolist())),
+        }
+
+
+def report(stats, stats_file=None):
+    # Prints the sampling statistics of a run and optionally saves them as JSON
+    print(f"Took {stats['samples']} samples in {stats['elapsed_sec']:.1f} s: {stats['achieved_hz']:.1f} Hz "
+          f"(target {stats['target_hz']:.0f} Hz), {stats['missed_deadlines']} missed deadlines, "
+          f"jitter p50 {stats['jitter_us_p50']:.1f} us, p99 {stats['jitter_us_p99']:.1f} us, max {stats['jitter_us_max']:.1f} us")
+    for label, count in stats['jitter_histogram_us'].items():
+        if count:
+            print(f"  {label:>14} us: {count}")
+    if stats_file is not None:
+        with open(stats_file, 'w') as f:
+            json.dump(stats, f, indent=2)
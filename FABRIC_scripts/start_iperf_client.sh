@@ -9,6 +9,14 @@ run=$6
 upper_limit_port=$(( $7 + 10 ))
 client=$8
 flows=$9
+# Optional output format: text (default, -f m), json (-J) or json-stream (--json-stream, iperf3 >= 3.17)
+output_format=${10:-text}
+
+case "$output_format" in
+    json) format_option="-J"; output_suffix="json" ;;
+    json-stream) format_option="--json-stream"; output_suffix="json" ;;
+    *) format_option="-f m"; output_suffix="out" ;;
+esac
 
 output_directory="output/${bw}_${cca1}_${cca2}_${aqm}_${bdp}_${run}"
 mkdir -p "$output_directory"
@@ -23,9 +31,9 @@ pcap_file="${pcap_directory_path}/capture.pcap"
 $(sudo tcpdump -s 0 -i any -C 100 -W 10000000 -s 0 -w ${pcap_file} > tcp_dump.out 2>&1 &);
 
 for ((i=11; i<=upper_limit_port; i++)); do
-    iperf_output_file="${output_directory}/iperf_${i}.out"
+    iperf_output_file="${output_directory}/iperf_${i}.${output_suffix}"
     #iperf_command="iperf3 -c ${client} -p 156${i} -C ${cca1} -t 200 -f m -P ${flows} -M 8900 > ${iperf_output_file} 2>&1"
-    $(iperf3 -c ${client} -p 156${i} -C ${cca1} -t 200 -f m -P ${flows} -M 8900 > ${iperf_output_file} 2>&1 &);
+    $(iperf3 -c ${client} -p 156${i} -C ${cca1} -t 200 ${format_option} -P ${flows} -M 8900 > ${iperf_output_file} 2>&1 &);
     #eval "$iperf_command" &
 done
 
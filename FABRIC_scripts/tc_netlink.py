@@ -0,0 +1,147 @@
+import os
+import socket
+import struct
+
+# rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/pkt_sched.h, linux/gen_stats.h)
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x001
+NLM_F_DUMP = 0x300
+RTM_NEWQDISC = 36
+RTM_GETQDISC = 38
+
+TCA_KIND = 1
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+TCA_STATS_APP = 4
+TCA_STATS_PKT64 = 8
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+TCMSG = struct.Struct('=BxxxiIII')
+RTATTR_HEADER = struct.Struct('=HH')
+GNET_STATS_BASIC = struct.Struct('=QI')
+GNET_STATS_QUEUE = struct.Struct('=IIIII')
+
+TC_H_ROOT = 0xFFFFFFFF
+
+# Extended statistics (TCA_STATS_APP) of the AQMs we run, with the field names tc prints, in struct order
+RED_XSTATS = struct.Struct('=IIII')
+RED_XSTATS_FIELDS = ('early', 'pdrop', 'other', 'marked')
+FQ_CODEL_XSTATS_TYPE_QDISC = 0
+FQ_CODEL_XSTATS = struct.Struct('=IIIIIIIII')
+FQ_CODEL_XSTATS_FIELDS = ('maxpacket', 'drop_overlimit', 'ecn_mark', 'new_flow_count', 'new_flows_len', 'old_flows_len',
+                          'ce_mark', 'memory_used', 'drop_overmemory')
+
+RECEIVE_BUFFER_SIZE = 65536
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _iter_attributes(data, offset, end):
+    # Yields (type, payload offset, payload end) of the rtattrs between offset and end
+    while offset + RTATTR_HEADER.size <= end:
+        length, attribute_type = RTATTR_HEADER.unpack_from(data, offset)
+        if length < RTATTR_HEADER.size:
+            return
+        yield attribute_type & 0x3FFF, offset + RTATTR_HEADER.size, offset + length
+        offset += _align(length)
+
+
+def format_handle(handle):
+    # Formats a qdisc handle or parent the way tc prints it ("1:", "1:1", ":1")
+    if handle == TC_H_ROOT:
+        return 'root'
+    major, minor = handle >> 16, handle & 0xFFFF
+    if not handle:
+        return '0:'
+    return (f'{major:x}' if major else '') + ':' + (f'{minor:x}' if minor else '')
+
+
+def _parse_xstats(kind, data, start, end):
+    if kind == 'red' and end - start >= RED_XSTATS.size:
+        return dict(zip(RED_XSTATS_FIELDS, RED_XSTATS.unpack_from(data, start)))
+    if kind == 'fq_codel' and end - start >= 4 + FQ_CODEL_XSTATS.size:
+        if struct.unpack_from('=I', data, start)[0] == FQ_CODEL_XSTATS_TYPE_QDISC:
+            return dict(zip(FQ_CODEL_XSTATS_FIELDS, FQ_CODEL_XSTATS.unpack_from(data, start + 4)))
+    return {}
+
+
+def _parse_qdisc(data, offset, end):
+    # Parses one RTM_NEWQDISC message body (struct tcmsg followed by attributes)
+    _, ifindex, handle, parent, _ = TCMSG.unpack_from(data, offset)
+    qdisc = {'ifindex': ifindex, 'kind': None, 'handle': format_handle(handle).rstrip(':'), 'parent': format_handle(parent)}
+    xstats = None
+    for attribute_type, start, stop in _iter_attributes(data, offset + TCMSG.size, end):
+        if attribute_type == TCA_KIND:
+            qdisc['kind'] = bytes(data[start:stop]).rstrip(b'\0').decode()
+        elif attribute_type == TCA_STATS2:
+            for stats_type, stats_start, stats_stop in _iter_attributes(data, start, stop):
+                if stats_type == TCA_STATS_BASIC and stats_stop - stats_start >= GNET_STATS_BASIC.size:
+                    qdisc['bytes'], qdisc['packets'] = GNET_STATS_BASIC.unpack_from(data, stats_start)
+                elif stats_type == TCA_STATS_PKT64 and stats_stop - stats_start >= 8:
+                    qdisc['packets'] = struct.unpack_from('=Q', data, stats_start)[0]
+                elif stats_type == TCA_STATS_QUEUE and stats_stop - stats_start >= GNET_STATS_QUEUE.size:
+                    (qdisc['qlen'], qdisc['backlog'], qdisc['drops'], qdisc['requeues'],
+                     qdisc['overlimits']) = GNET_STATS_QUEUE.unpack_from(data, stats_start)
+                elif stats_type == TCA_STATS_APP:
+                    xstats = (stats_start, stats_stop)
+    if xstats is not None:
+        qdisc.update(_parse_xstats(qdisc['kind'], data, *xstats))
+    return qdisc
+
+
+class QdiscSampler:
+    # Reads the statistics of the qdiscs of one interface over a single long-lived rtnetlink socket, the same
+    # counters `tc -s qdisc show dev <interface>` prints, without forking a shell and tc for every sample
+
+    def __init__(self, interface):
+        self.ifindex = socket.if_nametoindex(interface)
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.sequence = 0
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sample(self):
+        # Dumps the qdiscs and returns the ones of our interface in kernel order (as tc prints them), each as a
+        # dict with the keys of qdisc_stats.parse_tc_qdisc: kind, handle, parent, bytes, packets, drops, overlimits,
+        # requeues, backlog, qlen and, for RED and fq_codel, the extended statistics
+        self.sequence += 1
+        request = NLMSG_HEADER.pack(NLMSG_HEADER.size + TCMSG.size, RTM_GETQDISC, NLM_F_REQUEST | NLM_F_DUMP,
+                                    self.sequence, 0) + TCMSG.pack(socket.AF_UNSPEC, self.ifindex, 0, 0, 0)
+        self.sock.send(request)
+
+        qdiscs = []
+        view = memoryview(self.buffer)
+        while True:
+            size = self.sock.recv_into(self.buffer)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= size:
+                length, message_type, _, sequence, _ = NLMSG_HEADER.unpack_from(view, offset)
+                if length < NLMSG_HEADER.size:
+                    break
+                if sequence == self.sequence:
+                    if message_type == NLMSG_DONE:
+                        return qdiscs
+                    if message_type == NLMSG_ERROR:
+                        error = struct.unpack_from('=i', view, offset + NLMSG_HEADER.size)[0]
+                        if error:
+                            raise OSError(-error, os.strerror(-error))
+                    elif message_type == RTM_NEWQDISC:
+                        qdisc = _parse_qdisc(view, offset + NLMSG_HEADER.size, offset + length)
+                        if qdisc['ifindex'] == self.ifindex:
+                            qdiscs.append(qdisc)
+                offset += _align(length)
+
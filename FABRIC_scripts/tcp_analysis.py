@@ -0,0 +1,162 @@
+import heapq
+
+import numpy as np
+
+from pcap_reader import TCP_ACK, TCP_FIN, TCP_RST, TCP_SYN
+
+SEQ_MODULUS = 1 << 32
+HALF_SEQ_SPACE = 1 << 31
+
+# Time limits of the tshark tcp.analysis heuristics
+FAST_RETRANSMISSION_WINDOW_NS = 20000000
+DEFAULT_OUT_OF_ORDER_THRESHOLD_NS = 3000000
+
+
+class Conversation:
+    # State shared by both directions of a connection: the handshake RTT, which bounds out-of-order detection
+    __slots__ = ('syn_time', 'first_rtt')
+
+    def __init__(self):
+        self.syn_time = None
+        self.first_rtt = None
+
+
+class FlowDirection:
+    # Sequence-space state of one direction of a TCP connection. Sequence numbers are unwrapped to
+    # unbounded integers, so comparisons stay correct across 32-bit wraparound.
+    __slots__ = ('reverse', 'conversation', 'last_raw', 'last_unwrapped', 'nextseq', 'nextseq_time', 'lastack', 'lastack_time',
+                 'window', 'dupacks', 'outstanding', 'outstanding_ends')
+
+    def __init__(self, conversation):
+        self.reverse = None
+        self.conversation = conversation
+        self.last_raw = None
+        self.last_unwrapped = None
+        self.nextseq = None          # Highest sequence number sent so far (end of the furthest segment)
+        self.nextseq_time = None
+        self.lastack = None          # Last ACK sent in this direction (in the reverse direction's sequence space)
+        self.lastack_time = None
+        self.window = None
+        self.dupacks = 0
+        self.outstanding = {}        # End sequence number of each unacknowledged segment -> time it was first sent
+        self.outstanding_ends = []   # Heap of the keys of `outstanding`
+
+    def unwrap(self, raw):
+        # Maps a 32-bit sequence number of this direction to the unwrapped sequence space
+        if self.last_raw is None:
+            self.last_unwrapped = raw
+        else:
+            self.last_unwrapped += ((raw - self.last_raw + HALF_SEQ_SPACE) % SEQ_MODULUS) - HALF_SEQ_SPACE
+        self.last_raw = raw
+        return self.last_unwrapped
+
+
+class TcpAnalyzer:
+    # Per-flow TCP state tracker reproducing tshark's tcp.analysis.retransmission and tcp.analysis.ack_rtt
+    # in a single pass over the packets, in capture order. Flow directions are keyed by 4-tuple.
+
+    def __init__(self):
+        self.directions = {}
+
+    def direction(self, src_ip, src_port, dst_ip, dst_port):
+        key = (src_ip, src_port, dst_ip, dst_port)
+        forward = self.directions.get(key)
+        if forward is None:
+            conversation = Conversation()
+            forward = FlowDirection(conversation)
+            reverse = FlowDirection(conversation)
+            forward.reverse = reverse
+            reverse.reverse = forward
+            self.directions[key] = forward
+            self.directions[(dst_ip, dst_port, src_ip, src_port)] = reverse
+        return forward
+
+    def process(self, ts_ns, src_ip, src_port, dst_ip, dst_port, raw_seq, raw_ack, flags, window, seglen):
+        # Feeds one packet to the tracker. Returns (is_retransmission, ack_rtt_ns) where ack_rtt_ns is None
+        # unless this packet exactly acknowledges the end of an outstanding segment.
+        forward = self.direction(src_ip, src_port, dst_ip, dst_port)
+        reverse = forward.reverse
+        conversation = forward.conversation
+        seq = forward.unwrap(raw_seq)
+        ack = reverse.unwrap(raw_ack) if flags & TCP_ACK else None
+        syn_fin = 1 if flags & (TCP_SYN | TCP_FIN) else 0
+        control = flags & (TCP_SYN | TCP_FIN | TCP_RST)
+
+        # Handshake RTT: from the SYN to the first ACK that completes the handshake
+        if flags & TCP_SYN:
+            if not flags & TCP_ACK:
+                conversation.syn_time = ts_ns
+        elif ack is not None and conversation.first_rtt is None and conversation.syn_time is not None:
+            conversation.first_rtt = ts_ns - conversation.syn_time
+
+        nextseq = forward.nextseq
+        keep_alive = seglen <= 1 and nextseq is not None and seq == nextseq - 1 and not control
+
+        if (ack is not None and seglen == 0 and window and window == forward.window and seq == nextseq
+                and ack == forward.lastack and not control):
+            forward.dupacks += 1
+        else:
+            forward.dupacks = 0
+
+        # Data (or SYN/FIN) that does not advance the sequence space is a retransmission, unless it looks like
+        # reordering shortly after the highest segment or only repeats data the receiver already acknowledged
+        retransmission = False
+        if not keep_alive and (seglen > 0 or syn_fin) and nextseq is not None and seq < nextseq:
+            if (reverse.dupacks >= 2 and reverse.lastack == seq
+                    and ts_ns - reverse.lastack_time < FAST_RETRANSMISSION_WINDOW_NS):
+                retransmission = True  # Fast retransmission
+            else:
+                threshold = conversation.first_rtt or DEFAULT_OUT_OF_ORDER_THRESHOLD_NS
+                out_of_order = ts_ns - forward.nextseq_time < threshold and nextseq != seq + seglen + syn_fin
+                spurious = seglen > 0 and reverse.lastack is not None and seq + seglen <= reverse.lastack
+                retransmission = not out_of_order and not spurious
+
+        end = seq + seglen + syn_fin
+        if nextseq is None or end > nextseq:
+            forward.nextseq = end
+            forward.nextseq_time = ts_ns
+        forward.window = window
+        if ack is not None:
+            forward.lastack = ack
+            forward.lastack_time = ts_ns
+
+        # Like tshark, only segments that advance the highest sequence number are timed, so the ACK of resent or
+        # keep-alive data yields no RTT sample of its own
+        if (seglen > 0 or syn_fin) and (nextseq is None or end > nextseq):
+            forward.outstanding[end] = ts_ns
+            heapq.heappush(forward.outstanding_ends, end)
+
+        ack_rtt = None
+        if ack is not None and reverse.outstanding:
+            sent = reverse.outstanding.pop(ack, None)
+            if sent is not None:
+                ack_rtt = ts_ns - sent
+            # Everything up to the cumulative ACK is acknowledged and needs no further tracking
+            ends = reverse.outstanding_ends
+            while ends and ends[0] <= ack:
+                reverse.outstanding.pop(heapq.heappop(ends), None)
+
+        return retransmission, ack_rtt
+
+
+def analyze_packets(packets, analyzer=None):
+    # Runs the tracker over decoded packet columns (see pcap_reader.PACKET_DTYPES) in capture order.
+    # Returns (positions of retransmitted packets, positions of packets carrying an ACK RTT sample, RTT samples in ns).
+    if analyzer is None:
+        analyzer = TcpAnalyzer()
+    process = analyzer.process
+    retx_index = []
+    rtt_index = []
+    rtt_ns = []
+    fields = zip(packets['ts_ns'].tolist(), packets['src_ip'].tolist(), packets['src_port'].tolist(), packets['dst_ip'].tolist(),
+                 packets['dst_port'].tolist(), packets['seq'].tolist(), packets['ack'].tolist(), packets['flags'].tolist(),
+                 packets['window'].tolist(), packets['payload_length'].tolist())
+    for position, packet in enumerate(fields):
+        retransmission, ack_rtt = process(*packet)
+        if retransmission:
+            retx_index.append(position)
+        if ack_rtt is not None:
+            rtt_index.append(position)
+            rtt_ns.append(ack_rtt)
+
+    return np.array(retx_index, dtype=np.int64), np.array(rtt_index, dtype=np.int64), np.array(rtt_ns, dtype=np.int64)
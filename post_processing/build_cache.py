@@ -0,0 +1,97 @@
+import hashlib
+import inspect
+import json
+import os
+from contextlib import contextmanager
+
+# Skip-if-fresh cache of the post-processing stages. A stage (e.g. the plots of one configuration or the import
+# of one CSV into InfluxDB) keeps a record of the fingerprints of its input files, the version of the code that
+# ran it and its parameters, together with the outputs it wrote. When a re-run computes the same fingerprint and
+# the recorded outputs still exist, the stage is up to date and can be skipped.
+
+CACHE_DIRECTORY = '.build_cache'
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_fingerprint(file_name, content_hash=False):
+    # (size, mtime_ns) of a file, or the SHA-256 of its contents with content_hash (for inputs whose mtime is not
+    # reliable, e.g. copied with cp -r); None for a missing file
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    if not content_hash:
+        return [stat.st_size, stat.st_mtime_ns]
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return [stat.st_size, digest.hexdigest()]
+
+
+def code_version(*sources):
+    # SHA-256 over the source of the code producing a stage's outputs (modules or file names, whose whole file
+    # is hashed, or functions), so that changing the code invalidates its cached outputs
+    digest = hashlib.sha256()
+    for source in sources:
+        if callable(source):
+            digest.update(inspect.getsource(source).encode())
+            continue
+        with open(getattr(source, '__file__', source), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(inputs, code, content_hash=False, **params):
+    # Fingerprint of a stage: its input files, code version and any parameters the outputs depend on. Compute it
+    # before running the stage, so that inputs changing while it runs make the next run redo it.
+    return {
+        'code': code,
+        'params': params,
+        'inputs': {os.path.abspath(file_name): file_fingerprint(file_name, content_hash) for file_name in inputs},
+    }
+
+
+def stage_record(directory, stage):
+    # Record file of a stage whose outputs live in directory
+    return os.path.join(directory, CACHE_DIRECTORY, f'{stage}.json')
+
+
+def is_fresh(record_file, fingerprint):
+    # True when the stage last ran with the same fingerprint and all the outputs it wrote still exist
+    try:
+        with open(record_file) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # JSON turns tuples into lists; round-trip the fingerprint so both sides compare alike
+    return (record.get('fingerprint') == json.loads(json.dumps(fingerprint))
+            and all(os.path.exists(output) for output in record.get('outputs', [])))
+
+
+def save_record(record_file, fingerprint, outputs=()):
+    # Marks a stage as up to date after it wrote `outputs` from the inputs of `fingerprint`
+    os.makedirs(os.path.dirname(record_file), exist_ok=True)
+    with atomic_write(record_file) as f:
+        json.dump({'fingerprint': fingerprint, 'outputs': [os.path.abspath(output) for output in outputs]}, f, indent=1)
+
+
+@contextmanager
+def atomic_write(file_name, mode='w', **kwargs):
+    # Opens a temporary file next to file_name and replaces file_name with it once the block completes, so
+    # readers (and interrupted runs) never see a partially written file; on an error file_name is left untouched
+    temp_file = f'{file_name}.tmp-{os.getpid()}'
+    try:
+        with open(temp_file, mode, **kwargs) as f:
+            yield f
+        os.replace(temp_file, file_name)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def write_csv(df, file_name, **kwargs):
+    # DataFrame.to_csv with replace semantics: the whole file is rewritten atomically
+    with atomic_write(file_name, newline='') as f:
+        df.to_csv(f, **kwargs)
@@ -1,21 +1,22 @@
-import pandas as pd
 import sys
 
+from pcap_tables import read_table
+
 def count_ecn_packets(csv_file):
     try:
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(csv_file)
-
-        # Check if 'ECN' column exists
-        if 'ECN' in df.columns:
-            # Sum the 'ECN' column to count how many packets are flagged
-            ecn_count = df['ECN'].sum()
-            # Get the total number of packets by counting the number of rows
-            total_packets = len(df)
-            print(f"Total ECN-flagged packets: {ecn_count}")
-            print(f"Total packets: {total_packets}")
-        else:
+        # Load only the 'ECN' column of the CSV or Parquet file into a DataFrame
+        try:
+            df = read_table(csv_file, columns=['ECN'])
+        except (KeyError, ValueError):
             print("Error: 'ECN' column not found in the CSV file.")
+            return
+
+        # Sum the 'ECN' column to count how many packets are flagged
+        ecn_count = df['ECN'].sum()
+        # Get the total number of packets by counting the number of rows
+        total_packets = len(df)
+        print(f"Total ECN-flagged packets: {ecn_count}")
+        print(f"Total packets: {total_packets}")
     except FileNotFoundError:
         print(f"Error: File '{csv_file}' not found.")
     except Exception as e:
@@ -26,4 +27,4 @@ if __name__ == "__main__":
         csv_file = sys.argv[1]
         count_ecn_packets(csv_file)
     else:
-        print("Usage: python count_ecn_packets.py <path_to_csv_file>")
+        print("Usage: python count_ecn.py <path_to_csv_or_parquet_file>")
@@ -0,0 +1,95 @@
+import json
+import os
+
+import pandas as pd
+
+import build_cache
+from build_cache import atomic_write, write_csv
+
+# Per-run store of preprocessed DataFrames, so the raw tables of a run are parsed and normalized once and every
+# later stage (plot_all re-runs, influxdb_database) reads the prepared frames instead. Each frame is an
+# uncompressed Feather file in <run>/.frame_store/, read memory-mapped; meta.json records for every frame the
+# fingerprint of the inputs it was built from (see build_cache) and any values that go with it, such as the
+# anchor timestamp of the run. Without pyarrow nothing is stored and the frames are built every time.
+
+STORE_DIRECTORY = '.frame_store'
+META_FILE = 'meta.json'
+
+
+def feather_module():
+    # pyarrow.feather, or None when pyarrow is not installed
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        return None
+    return feather
+
+
+class FrameStore:
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, STORE_DIRECTORY)
+        self.meta_file = os.path.join(self.directory, META_FILE)
+
+    def frame_file(self, name):
+        return os.path.join(self.directory, f'{name}.feather')
+
+    def read_meta(self):
+        try:
+            with open(self.meta_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'frames': {}}
+
+    def get(self, name, fingerprint):
+        # Returns (df, info) of a stored frame built from the inputs of fingerprint, or (None, None) if there is
+        # none (or it is stale)
+        feather = feather_module()
+        entry = self.read_meta()['frames'].get(name)
+        if (feather is None or entry is None or entry['fingerprint'] != json.loads(json.dumps(fingerprint))
+                or not os.path.exists(self.frame_file(name))):
+            return None, None
+        return feather.read_table(self.frame_file(name), memory_map=True).to_pandas(), entry.get('info', {})
+
+    def put(self, name, fingerprint, df, info=None):
+        # Stores df (and the JSON-serializable info that goes with it) as built from the inputs of fingerprint
+        feather = feather_module()
+        if feather is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(self.frame_file(name), 'wb') as f:
+            feather.write_feather(df, f, compression='uncompressed')
+        # Re-read the metadata so entries stored meanwhile by other stages of the same run are kept
+        meta = self.read_meta()
+        meta['frames'][name] = {'fingerprint': fingerprint, 'rows': len(df), 'info': info or {}}
+        with atomic_write(self.meta_file) as f:
+            json.dump(meta, f, indent=1)
+
+    def load(self, name, fingerprint, build):
+        # Returns (df, info) of the stored frame, or builds it with build() -> (df, info) and stores the result.
+        # A frame that could not be built (df is None) is not stored.
+        df, info = self.get(name, fingerprint)
+        if df is not None:
+            return df, info
+        df, info = build()
+        if df is not None:
+            self.put(name, fingerprint, df, info)
+        return df, info
+
+    def write_csv(self, df, csv_file, **kwargs):
+        # Writes df to csv_file (atomically, see build_cache.write_csv) and stores a copy keyed by the CSV's
+        # fingerprint, which read_csv returns instead of parsing the CSV again
+        write_csv(df, csv_file, **kwargs)
+        self.put(csv_frame_name(csv_file), csv_fingerprint(csv_file), df.reset_index(drop=True))
+
+    def read_csv(self, csv_file, **kwargs):
+        # The stored copy of a CSV written by write_csv while the CSV is unchanged, otherwise pd.read_csv
+        df, _ = self.get(csv_frame_name(csv_file), csv_fingerprint(csv_file))
+        return df if df is not None else pd.read_csv(csv_file, **kwargs)
+
+
+def csv_frame_name(csv_file):
+    return os.path.splitext(os.path.basename(csv_file))[0]
+
+
+def csv_fingerprint(csv_file):
+    return build_cache.stage_fingerprint([csv_file], 'csv')
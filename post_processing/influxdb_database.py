@@ -4,6 +4,9 @@ import pandas as pd
 import os
 import concurrent.futures
 
+import build_cache
+from frame_store import FrameStore
+
 # InfluxDB connection settings
 host = 'localhost'  # Update with your InfluxDB host
 port = 8086  # Update with your InfluxDB port
@@ -18,10 +21,19 @@ client = InfluxDBClient(host, port)
 client.switch_database(database)
 
 def import_csv_to_influxdb(csv_file, measurement_name, start_time, fields):
+    # Skip CSV files already imported into this measurement, unchanged since and with the same settings
+    record_file = build_cache.stage_record(os.path.dirname(csv_file), f'influx_{measurement_name}')
+    fingerprint = build_cache.stage_fingerprint([csv_file], build_cache.code_version(__file__), host=host, port=port,
+                                                database=database, start_time=str(start_time), fields=fields)
+    if build_cache.is_fresh(record_file, fingerprint):
+        logging.info(f"{csv_file} is already imported into measurement {measurement_name}, skipping")
+        return
+
     try:
         logging.info(f"Importing {csv_file} into measurement {measurement_name}")
-        # Read CSV file into a DataFrame, skipping rows with missing data
-        df = pd.read_csv(csv_file, sep=',', decimal='.', na_values=[''])
+        # Read CSV file into a DataFrame, skipping rows with missing data; plot_all.py keeps a parsed copy of the
+        # CSV in the run's frame store, which is used while the CSV is unchanged
+        df = FrameStore(os.path.dirname(csv_file)).read_csv(csv_file, sep=',', decimal='.', na_values=[''])
 
         if df.empty:
             logging.warning(f"No data found in {csv_file}")
@@ -76,6 +88,7 @@ def import_csv_to_influxdb(csv_file, measurement_name, start_time, fields):
         if points:
             # Write data to InfluxDB in smaller batches
             batch_size = 5000
+            failed_batches = 0
             for i in range(0, len(points), batch_size):
                 batch = points[i:i + batch_size]
                 success = client.write_points(batch)
@@ -84,15 +97,17 @@ def import_csv_to_influxdb(csv_file, measurement_name, start_time, fields):
                 # else:
                 #     logging.error(f"Batch {i//batch_size + 1} failed to write.")
                 if not success:
+                    failed_batches += 1
                     logging.error(f"Batch {i//batch_size + 1} failed to write.")
             logging.info(f"Data imported from {csv_file} to InfluxDB.")
+            if not failed_batches:
+                build_cache.save_record(record_file, fingerprint)
         else:
             logging.warning(f"No valid points to write from {csv_file}")
     except Exception as e:
         logging.exception(f"Error importing data from {csv_file}")
 
 def process_directory_structure(aqm_config, cca_config, speed_config, bdp_config, base_path):
-    tasks = []
     for aqm in aqm_config:
         has_ecn = aqm != "fifo"
         logging.info(f"Processing AQM: {aqm}, has_ecn: {has_ecn}")
@@ -127,8 +142,11 @@ def process_directory_structure(aqm_config, cca_config, speed_config, bdp_config
                         file_name_s1 = f"sender_1_{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}"
                         file_name_s2 = f"sender_2_{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}"
 
+                        # Import only the files of this configuration; earlier configurations are already done
+                        tasks = []
+
                         # Load the DataFrame from the CSV file, specifying that the first row is the header
-                        df = pd.read_csv(f'{s1}/ping_active_rtt.csv', header=0)
+                        df = pd.read_csv(f'{s1}/ping_active_rtt.csv', header=0, nrows=1)
                         first_timestamp = df['original_time_stamp'].iloc[0]
                         start_time = pd.to_datetime(first_timestamp, unit='s')
                         tasks.append((f'{s1}/{file_name_s1}_buffer_dropped.csv', f'{file_name_s1}_buffer_dropped', start_time, ['dropped_pkts']))
@@ -4,6 +4,11 @@ import os
 import pandas as pd
 import numpy as np
 
+import build_cache
+
+# Directory containing the poseidon-sender-1/2 outputs and the parsed_data output directory
+DATA_ROOT = "/data2/imtiaz/bbrv3_new"
+
 def calculate_fairness(throughputs):
     """Calculate the Jain's fairness index for given throughputs."""
     if len(throughputs) == 0 or np.sum(throughputs) == 0:
@@ -25,7 +30,7 @@ def calculate_link_utilization(throughputs, total_bandwidth):
     total_throughput = np.sum(throughputs) * 1000000 #converting the throughput to bps
     return total_throughput / total_bandwidth
 
-def main():
+def main(data_root=DATA_ROOT):
     aqm_config = ["fifo", "fq_codel", "red"]
 
     speed_config = [
@@ -51,120 +56,90 @@ def main():
 
     sender_1_output = "poseidon-sender-1_output/output"
     sender_2_output = "poseidon-sender-2_output/output"
-    
-    rows = []
+    runs = range(1, 2)
+
+    def run_directory(sender_output, speed, pair, aqm, bdp, run):
+        return f"{data_root}/{sender_output}/{speed['tag']}_{pair}_{aqm}_{bdp}bdp_{run}"
+
+    def sender_directories(cca_combo, speed, aqm, bdp, run):
+        # Run directories of sender 1 and sender 2 of a CCA pair; sender 2 runs the second CCA
+        return (run_directory(sender_1_output, speed, f"{cca_combo['cca1']}_{cca_combo['cca2']}", aqm, bdp, run),
+                run_directory(sender_2_output, speed, f"{cca_combo['cca2']}_{cca_combo['cca1']}", aqm, bdp, run))
+
+    def read_totals(directory):
+        # (average throughput in Gbps, total retransmissions) of a run from its iperf_totals_per_sender.csv
+        with open(f"{directory}/iperf_totals_per_sender.csv", 'r') as f:
+            lines = f.readlines()
+            measurements = list(map(float, lines[1].replace("\n",'').split(",")))
+        return measurements[0], measurements[1]
+
+    cubic_combo = {"cca1": "cubic", "cca2": "cubic"}
+
+    # Find the outputs whose iperf totals changed since they were written before reading any totals: an output
+    # depends on the totals of its CCA pair and of cubic vs cubic, for every BDP and run
+    code = build_cache.code_version(__file__)
+    stale = []
     for aqm in aqm_config:
         for cca_combo in cca_config:
             for speed in speed_config:
+                inputs = []
                 for bdp in bdp_config:
-                    for run in range(1, 2):
-                        row = {
-                            "aqm": aqm, 
-                            "cca1": cca_combo['cca1'],
-                            "cca2": cca_combo['cca2'],
-                            "speed": speed['tag'], 
-                            "bdp": bdp,
-                            "run": run
-                        }
-
-                        f1 = f"/data2/imtiaz/bbrv3_new/{sender_1_output}/{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-                        f2 = f"/data2/imtiaz/bbrv3_new/{sender_2_output}/{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-
-                        with open(f1, 'r') as f:
-                            lines = f.readlines()
-                            measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                            row["sender_1_throughput"] = measurements[0]
-                            row["sender_1_retransmits"] = measurements[1]
-
-                        with open(f2, 'r') as f:
-                            lines = f.readlines()
-                            measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                            row["sender_2_throughput"] = measurements[0]
-                            row["sender_2_retransmits"] = measurements[1]
-                        
-                        rows.append(row)
-
-    results = pd.DataFrame.from_dict(rows)
-
-    # Calculate the average retransmissions for cubic vs cubic as the baseline
-    cubic_results = results[(results['cca1'] == 'cubic') & (results['cca2'] == 'cubic')]
-    avg_retrans_cubic_vs_cubic = cubic_results[['sender_1_retransmits', 'sender_2_retransmits']].mean().mean()
-
-    agg_results = results.drop(columns=["run"]).groupby(by=["aqm", "cca1", "cca2", "speed", "bdp"]).aggregate("mean")
-    
+                    for run in runs:
+                        for directory in sender_directories(cubic_combo, speed, aqm, bdp, run) + sender_directories(cca_combo, speed, aqm, bdp, run):
+                            inputs += [f"{directory}/iperf_totals_per_sender.csv", f"{directory}/iperf_totals_per_port.csv"]
+                output_dir = f"{data_root}/parsed_data/{cca_combo['cca1']}_{cca_combo['cca2']}"
+                output_file = os.path.join(output_dir, f"{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{speed['tag']}.dat")
+                record_file = build_cache.stage_record(output_dir, os.path.basename(output_file))
+                fingerprint = build_cache.stage_fingerprint(inputs, code)
+                if not build_cache.is_fresh(record_file, fingerprint):
+                    stale.append((aqm, cca_combo, speed, output_file, record_file, fingerprint))
+
     header = ["#BDP", "alg1_mean_throughput", "alg2_mean_throughput", "alg1_mean_retx_packets", "alg2_mean_retx_packets", "fairness_index", "varpi", "vartheta"]
-    
-    for aqm in aqm_config:
-        for cca_combo in cca_config:
-            for speed in speed_config:
-                output_buffer = [header]
-                for bdp in bdp_config:
-                    index = (aqm, cca_combo["cca1"], cca_combo["cca2"], speed["tag"], float(bdp))
-                    data = agg_results.loc[index]
-
-
-                    f1 = f"/data2/imtiaz/bbrv3_new/{sender_1_output}/{speed['tag']}_cubic_cubic_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-                    f2 = f"/data2/imtiaz/bbrv3_new/{sender_2_output}/{speed['tag']}_cubic_cubic_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-
-                    f3 = f"/data2/imtiaz/bbrv3_new/{sender_1_output}/{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-                    f4 = f"/data2/imtiaz/bbrv3_new/{sender_2_output}/{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_sender.csv"
-
-                    with open(f1, 'r') as f:
-                        lines = f.readlines()
-                        measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                        cubic_sender_1_retransmits = measurements[1]
-
-                    with open(f2, 'r') as f:
-                        lines = f.readlines()
-                        measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                        cubic_sender_2_retransmits = measurements[1]
-
-                    with open(f3, 'r') as f:
-                        lines = f.readlines()
-                        measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                        aqm_sender_1_retransmits = measurements[1]
-
-                    with open(f4, 'r') as f:
-                        lines = f.readlines()
-                        measurements = list(map(float, lines[1].replace("\n",'').split(",")))
-                        aqm_sender_2_retransmits = measurements[1]
-
-                    f5 = f"/data2/imtiaz/bbrv3_new/{sender_1_output}/{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_port.csv"
-                    f6 = f"/data2/imtiaz/bbrv3_new/{sender_2_output}/{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}/iperf_totals_per_port.csv"
-                    df3 = pd.read_csv(f5)
-                    df4 = pd.read_csv(f6)
-
-                    # Combining per-port throughputs for fairness calculation
-                    throughput_list = np.concatenate((df3['average_throughput_mbps'].values, df4['average_throughput_mbps'].values))
-                    fairness_index = calculate_fairness(throughput_list)
-
-                    # Calculate varpi
-                    varpi = calculate_retransmission_ratio(aqm_sender_1_retransmits+aqm_sender_2_retransmits, 
-                                                           cubic_sender_1_retransmits+cubic_sender_2_retransmits)
-
-                    # Calculate vartheta
-                    vartheta = calculate_link_utilization(throughput_list, speed["speed"])
-
-                    output_buffer.append([
-                        f"{bdp}BDP",
-                        round(data["sender_1_throughput"], 2),
-                        round(data["sender_2_throughput"], 2),
-                        round(data["sender_1_retransmits"], 2),
-                        round(data["sender_2_retransmits"], 2),
-                        fairness_index,
-                        varpi,
-                        vartheta
-                    ])
-
-                output_dir = f"/data2/imtiaz/bbrv3_new/parsed_data/{cca_combo['cca1']}_{cca_combo['cca2']}"
-                output_file = f"{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{speed['tag']}.dat"
-                abs_output_file = os.path.join(output_dir, output_file)
-                
-                os.makedirs(output_dir, exist_ok=True)
-
-                with open(abs_output_file, "w+") as g:
-                    for line in output_buffer:
-                        g.write(f"{','.join(map(str,line))}\n")
+
+    for aqm, cca_combo, speed, output_file, record_file, fingerprint in stale:
+        output_buffer = [header]
+        for bdp in bdp_config:
+            rows = []
+            for run in runs:
+                directory_1, directory_2 = sender_directories(cca_combo, speed, aqm, bdp, run)
+                sender_1_throughput, sender_1_retransmits = read_totals(directory_1)
+                sender_2_throughput, sender_2_retransmits = read_totals(directory_2)
+                cubic_retransmits = sum(read_totals(directory)[1] for directory in sender_directories(cubic_combo, speed, aqm, bdp, run))
+
+                # Combining per-port throughputs for fairness calculation
+                df1 = pd.read_csv(f"{directory_1}/iperf_totals_per_port.csv")
+                df2 = pd.read_csv(f"{directory_2}/iperf_totals_per_port.csv")
+                throughput_list = np.concatenate((df1['average_throughput_mbps'].values, df2['average_throughput_mbps'].values))
+
+                rows.append({
+                    "sender_1_throughput": sender_1_throughput,
+                    "sender_2_throughput": sender_2_throughput,
+                    "sender_1_retransmits": sender_1_retransmits,
+                    "sender_2_retransmits": sender_2_retransmits,
+                    "fairness_index": calculate_fairness(throughput_list),
+                    # Retransmissions relative to cubic vs cubic at the same AQM, speed and BDP
+                    "varpi": calculate_retransmission_ratio(sender_1_retransmits + sender_2_retransmits, cubic_retransmits),
+                    "vartheta": calculate_link_utilization(throughput_list, speed["speed"]),
+                })
+
+            # Every value is averaged over the runs
+            data = pd.DataFrame(rows).mean()
+            output_buffer.append([
+                f"{bdp}BDP",
+                round(data["sender_1_throughput"], 2),
+                round(data["sender_2_throughput"], 2),
+                round(data["sender_1_retransmits"], 2),
+                round(data["sender_2_retransmits"], 2),
+                data["fairness_index"],
+                data["varpi"],
+                data["vartheta"]
+            ])
+
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with build_cache.atomic_write(output_file) as g:
+            for line in output_buffer:
+                g.write(f"{','.join(map(str,line))}\n")
+        build_cache.save_record(record_file, fingerprint, [output_file])
 
 if __name__ == "__main__":
     main()
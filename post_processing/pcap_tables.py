@@ -0,0 +1,67 @@
+import os
+import operator
+
+import numpy as np
+import pandas as pd
+
+NS_PER_SEC = 1000000000
+
+# Comparison operators accepted in filters, as in pyarrow.parquet.read_table
+FILTER_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+def table_file(directory, name):
+    # Returns the Parquet version of a process_pcap table (extracted_information, rtt, retx) if it was written,
+    # otherwise the CSV
+    parquet_file = os.path.join(directory, f'{name}.parquet')
+    if os.path.exists(parquet_file):
+        return parquet_file
+    return os.path.join(directory, f'{name}.csv')
+
+
+def read_table(file_name, columns=None, filters=None):
+    # Reads a process_pcap table from CSV or Parquet into a DataFrame with the CSV column names.
+    # columns selects the columns to load and filters is a list of (column, operator, value) conditions that must
+    # all hold. For Parquet both are pushed down to the reader, so unused columns and row groups (flows) that
+    # cannot match are never read.
+    filters = filters or []
+    if not file_name.endswith('.parquet'):
+        usecols = None if columns is None else list(dict.fromkeys(list(columns) + [column for column, _, _ in filters]))
+        df = pd.read_csv(file_name, sep=',', usecols=usecols)
+        for column, op, value in filters:
+            df = df[FILTER_OPERATORS[op](df[column], value)]
+        return df if columns is None else df[list(columns)]
+
+    import pyarrow.parquet as pq
+
+    # Parquet stores integer nanoseconds in place of the float original_time_stamp column
+    parquet_columns = None
+    if columns is not None:
+        parquet_columns = ['time_stamp_ns' if column == 'original_time_stamp' else column for column in columns]
+    table = pq.read_table(file_name, columns=parquet_columns, filters=filters or None)
+    df = table.to_pandas()
+    if 'time_stamp_ns' in df.columns:
+        ts_ns = df.pop('time_stamp_ns')
+        df.insert(0, 'original_time_stamp', (ts_ns // NS_PER_SEC).astype('float64') + (ts_ns % NS_PER_SEC) / 1e9)
+    return df if columns is None else df[list(columns)]
+
+
+class FlowIndex:
+    # Groups the rows of a table by flow once: the rows are stably sorted by the flow key (dst_port << 16) |
+    # src_port, as process_pcap orders its tables, and a flow's rows are found with two binary searches
+    # instead of a boolean mask over the whole table. Rows keep their original order and index within a flow.
+
+    def __init__(self, df, keys=('dst_port', 'src_port')):
+        first, second = (df[key].to_numpy() for key in keys)
+        positions = np.flatnonzero(~(pd.isna(first) | pd.isna(second)))
+        codes = (first[positions].astype(np.int64) << 16) | second[positions].astype(np.int64)
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.df = df.iloc[positions[order]]
+
+    def get(self, first, second):
+        # Rows of the flow with the given key values (an empty frame if there are none)
+        code = (int(first) << 16) | int(second)
+        return self.df.iloc[np.searchsorted(self.codes, code, 'left'):np.searchsorted(self.codes, code, 'right')]
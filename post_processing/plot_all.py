@@ -1,22 +1,60 @@
+import argparse
+import csv
 import sys
 import os
-import subprocess
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import cpu_count
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 
-import cufflinks as cf
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
-from plotly.offline import iplot, plot
+import build_cache
+import pcap_tables
+import process_iperf
+import timeseries
+from frame_store import FrameStore
+from pcap_tables import FlowIndex, read_table, table_file
+from process_iperf import IPERF_CSV_FILES, iperf_files, update_iperf_directory
+from timeseries import bucket_values, counter_frame, decimate
+
+# Columns of extracted_information used for plotting, and the destination ports of the experiment flows
+EXTRACTED_COLUMNS = ['original_time_stamp', 'time_stamp_sec', 'src_port', 'dst_port', 'cwnd_bytes', 'ECN', 'ECE_FLAG', 'CWR_FLAG']
+FLOW_PORT_FILTERS = [('dst_port', '>=', 15611), ('dst_port', '<=', 15670)]
+# Width of the intervals retransmissions are summed over (seconds)
+RETX_INTERVAL_SEC = 1
+# Derived per-flow CSV files written next to the plots, <file_name>_<suffix>.csv
+DERIVED_CSV_SUFFIXES = ['rtt', 'retx', 'iperf_cwnd', 'iperf_retx', 'buffer_dropped', 'buffer_overlimit', 'probe_rtt', 'ecn']
+# Combined figures: time axis (seconds), PNG width (inches) and resolution, and how each series is decimated
+# ('minmax' envelopes keep every spike, or 'lttb') to about two points per bin of the time axis. PNG lines are
+# 1.5 pt wide, so bins finer than a point are invisible at any dpi; HTML figures get bins for a 2000 px wide plot.
+PLOT_TIME_RANGE = (0, 120)
+PNG_WIDTH_IN = 8
+PNG_DPI = 600
+PNG_BINS = PNG_WIDTH_IN * 72
+HTML_BINS = 2000
+DECIMATION = 'minmax'
+# Outputs of each configuration: the derived per-flow CSV files and the combined figures as PNG and HTML.
+# matplotlib and plotly are only imported when a figure format is requested.
+OUTPUT_FORMATS = ('csv', 'png', 'html')
+FIGURE_FORMATS = {'png', 'html'}
+
+# Function to import pyplot on first use, on the Agg backend: figures are only saved to files, never shown
+def pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 # Function to read and preprocess the data
 def read_and_preprocess(file_name):
     print(f"Reading and preprocessing: {file_name}")
     try:
         pd.set_option('display.float_format', lambda x: '%.9f' % x)  # Disable scientific notation
-        df = pd.read_csv(file_name, sep=',')
+        # Only the plotted columns and flows are loaded; with Parquet the other row groups are skipped entirely
+        df = read_table(file_name, columns=EXTRACTED_COLUMNS, filters=FLOW_PORT_FILTERS)
     except Exception as e:
         print(f"Error reading {file_name}: {e}")
         return None, None
@@ -55,7 +93,7 @@ def read_and_preprocess(file_name):
 def process_rtt_and_retx(file_name, first_timestamp):
     # print(f"Processing RTT and RETX: {file_name}")
     try:
-        df = pd.read_csv(file_name, sep=',')
+        df = read_table(file_name)
     except Exception as e:
         print(f"Error reading {file_name}: {e}")
         return None
@@ -71,14 +109,14 @@ def process_rtt_and_retx(file_name, first_timestamp):
     df = df.sort_values(by=['dst_port', 'src_port', 'time_stamp_sec'])
     return df
 
-# Function to read and preprocess buffer csv files
-def process_buffer(file_name, first_timestamp):
+# Function to read buffer csv files into the per-sample increments of the dropped and overlimits counters
+def buffer_deltas(file_name, first_timestamp):
     print(f"Processing buffer: {file_name}")
     try:
         df = pd.read_csv(file_name, sep=',')
     except Exception as e:
         print(f"Error reading {file_name}: {e}")
-        return None, None
+        return None
 
     # Ensure 'original_timestamp' is numeric
     df['original_timestamp'] = pd.to_numeric(df['original_timestamp'], errors='coerce')
@@ -90,27 +128,18 @@ def process_buffer(file_name, first_timestamp):
     # Debug: print dataframe after processing
     # print(f"Processed buffer data:\n{df[['original_timestamp', 'time_stamp_sec', 'dropped_pkts', 'overlimits_pkts']].head(10)}")
 
-    buff_dropped = []
-    dropped_pkts = 0
-
-    buff_overlimit = []
-    overlimit_pkts = 0
+    # Per-sample increments of the cumulative counters; the first sample counts from 0 as before
+    return counter_frame(df, 'time_stamp_sec', ['dropped_pkts', 'overlimits_pkts'], initial=0)
 
-    for index, row in df.iterrows(): 
-        time = row['time_stamp_sec']
-        dropped_pkts_count = row['dropped_pkts'] - dropped_pkts
-        dropped_pkts = row['dropped_pkts']
-        buff_dropped.append([time, dropped_pkts_count])
+# Function to read and preprocess buffer csv files
+def process_buffer(file_name, first_timestamp):
+    return split_buffer_deltas(buffer_deltas(file_name, first_timestamp))
 
-        overlimit_pkts_count = row['overlimits_pkts'] - overlimit_pkts
-        overlimit_pkts = row['overlimits_pkts']
-        buff_overlimit.append([time, overlimit_pkts_count])
-    
-    dropped_column_names = ['time_stamp_sec', 'dropped_pkts']
-    buff_dropped_df = pd.DataFrame(buff_dropped, columns=dropped_column_names)
-    
-    overlimit_column_names = ['time_stamp_sec', 'overlimits_pkts']    
-    buff_overlimit_df = pd.DataFrame(buff_overlimit, columns=overlimit_column_names)
+def split_buffer_deltas(deltas):
+    if deltas is None:
+        return None, None
+    buff_dropped_df = deltas[['time_stamp_sec', 'dropped_pkts']]
+    buff_overlimit_df = deltas[['time_stamp_sec', 'overlimits_pkts']]
     
     return buff_dropped_df, buff_overlimit_df
 
@@ -126,26 +155,88 @@ def process_probe_rtt(file_name, first_timestamp):
     # Ensure 'original_time_stamp' is numeric
     df['original_time_stamp'] = pd.to_numeric(df['original_time_stamp'], errors='coerce')
 
+    # A multi-target probe run interleaves several paths; plot the first one (lost probes stay as gaps in rtt_ms)
+    if df['dst_ip'].nunique() > 1:
+        df = df[df['dst_ip'] == df['dst_ip'].iloc[0]].copy()
+
     df['time_stamp'] = (df['original_time_stamp'] - first_timestamp).round(3)
 
     return df
 
-# Function to read and preprocess iperf csv files
-def process_iperf_data(file_name):
-    print(f"Processing iperf data: {file_name}")
+# Function to load the iperf data of a sender directory; its iperf outputs are only parsed (and its iperf_*.csv
+# files rewritten) when they changed since the CSVs were written
+def iperf_frame(directory):
+    print(f"Processing iperf data: {directory}")
     try:
-        df = pd.read_csv(file_name, sep=',')
+        df = update_iperf_directory(directory)
     except Exception as e:
-        print(f"Error reading {file_name}: {e}")
+        print(f"Error processing iperf data in {directory}: {e}")
+        return None
+    if df is None:
+        print(f"No iperf data in {directory}")
+        return None
+
+    # Ports are parsed as strings; plot_df matches them against the integer ports of the pcap tables
+    return df.astype({'src_port': 'int64', 'dst_port': 'int64'})
+
+# Function to parse the iperf outputs of a sender directory and split them into cwnd and retx data
+def process_iperf_data(directory):
+    return split_iperf_frame(iperf_frame(directory))
+
+def split_iperf_frame(df):
+    if df is None:
         return None, None
-    
     df_cwnd = df[['src_port', 'dst_port', 'Time_sec', 'Cwnd_MBytes']]
     df_retx = df[['src_port', 'dst_port', 'Time_sec', 'Retx_pkts']]
 
     return df_cwnd, df_retx
 
+# Version of the preprocessing code, part of the fingerprint of every stored frame; changes to the plotting code
+# keep the stored frames valid
+def preprocessing_version():
+    return build_cache.code_version(read_and_preprocess, process_rtt_and_retx, buffer_deltas, process_probe_rtt,
+                                    iperf_frame, process_iperf, pcap_tables, timeseries)
+
+# Functions to load the preprocessed frames of a run from its frame store; the raw tables are only read and
+# preprocessed again when they (or the anchor timestamp) changed since the frames were stored
+def cached_frame(store, name, inputs, build, **params):
+    fingerprint = build_cache.stage_fingerprint(inputs, preprocessing_version(), **params)
+    return store.load(name, fingerprint, build)
+
+def load_extracted(store, file_name):
+    def build():
+        df, first_timestamp = read_and_preprocess(file_name)
+        return df, {'first_timestamp': None if first_timestamp is None else float(first_timestamp)}
+    df, info = cached_frame(store, 'extracted_information', [file_name], build)
+    return df, info.get('first_timestamp')
+
+def load_rtt_and_retx(store, name, file_name, first_timestamp):
+    return cached_frame(store, name, [file_name], lambda: (process_rtt_and_retx(file_name, first_timestamp), {}),
+                        anchor=first_timestamp)[0]
+
+def load_probe_rtt(store, file_name, first_timestamp):
+    return cached_frame(store, 'probe_rtt', [file_name], lambda: (process_probe_rtt(file_name, first_timestamp), {}),
+                        anchor=first_timestamp)[0]
+
+def load_buffer(store, file_name, first_timestamp):
+    deltas = cached_frame(store, 'buffer', [file_name], lambda: (buffer_deltas(file_name, first_timestamp), {}),
+                          anchor=first_timestamp)[0]
+    return split_buffer_deltas(deltas)
+
+def load_iperf_data(store, directory):
+    inputs = [os.path.join(directory, name) for name in sorted(iperf_files(directory))] if os.path.isdir(directory) else []
+    fingerprint = build_cache.stage_fingerprint(inputs, preprocessing_version())
+    df, _ = store.get('iperf', fingerprint)
+    # The stored frame is only used while the iperf CSVs (read by parser.py) are up to date as well
+    if df is None or not build_cache.is_fresh(*process_iperf.iperf_stage(directory)):
+        df = iperf_frame(directory)
+        if df is not None:
+            store.put('iperf', fingerprint, df)
+    return split_iperf_frame(df)
+
 # Function to plot buffer against time_stamp_sec and save the figure
 def plot_buffer_data(df, path):
+    plt = pyplot()
     fig_name = f'{path}/buffer_status.png'
     
     # Filter DataFrame for rows where 'dropped_pkts' is not equal to 0
@@ -164,6 +255,7 @@ def plot_buffer_data(df, path):
 
 # Function to plot cwnd_bytes against time_stamp_sec and save the figure
 def plot_cwnd_data(df, dst_port, src_port, path):
+    plt = pyplot()
     fig_name = f'{path}/cwnd_dst{dst_port}_src{src_port}.png'
     plt.plot(df['time_stamp_sec'], df['cwnd_bytes'], label=f'dst_port={dst_port}, src_port={src_port}')
     plt.xlim(0, 120)  # Set x-axis limits
@@ -176,6 +268,7 @@ def plot_cwnd_data(df, dst_port, src_port, path):
 
 # Function to plot rtt against time_stamp_sec and save the figure
 def plot_rtt_data(df, dst_port, src_port, path):
+    plt = pyplot()
     fig_name = f'{path}/rtt_dst{src_port}_src{dst_port}.png'
     plt.plot(df['time_stamp_sec'], df['rtt_ms'], label=f'dst_port={src_port}, src_port={dst_port}')
     plt.xlim(0, 120)  # Set x-axis limits
@@ -188,6 +281,7 @@ def plot_rtt_data(df, dst_port, src_port, path):
 
 # Function to plot probed rtt against time_stamp_sec and save the figure
 def plot_probe_rtt(df, path):
+    plt = pyplot()
     fig_name = f'{path}/probed_rtt.png'
     plt.plot(df['time_stamp'], df['rtt_ms'], label='probed_rtt')
     plt.xlim(0, 120)  # Set x-axis limits
@@ -198,23 +292,14 @@ def plot_probe_rtt(df, path):
     plt.savefig(fig_name)  # Save the plot as an image file
     plt.close()  # Close the figure to avoid overlapping plots
 
+# Function to sum retransmissions into RETX_INTERVAL_SEC intervals (t - step, t], labelled by their end t
+def retx_per_interval(df, step=RETX_INTERVAL_SEC):
+    interval_sec, retx_sum_pkts = bucket_values(df['time_stamp_sec'], df['retx_pkts'], width=step)
+    return pd.DataFrame({'interval_sec': interval_sec, 'retx_sum_pkts': retx_sum_pkts})
+
 def plot_retx_data(df, dst_port, src_port, path):
-    retx = []
-    step = 1
-    interval = step
-    retx_sum = 0
-    retx.append([0, retx_sum])
-
-    for index, row in df.iterrows(): 
-        if row['time_stamp_sec'] <= interval:
-            retx_sum += row['retx_pkts']
-        else:
-            retx.append([interval, retx_sum])
-            interval += step
-            retx_sum = 0
-    
-    column_names = ['interval_sec','retx_sum_pkts']
-    retx_df = pd.DataFrame(retx, columns=column_names)
+    plt = pyplot()
+    retx_df = retx_per_interval(df)
 
     fig_name = f'{path}/retx_dst{dst_port}_src{src_port}.png'
     retx_nonzero = retx_df[retx_df['retx_sum_pkts'] != 0]
@@ -227,40 +312,11 @@ def plot_retx_data(df, dst_port, src_port, path):
     plt.savefig(fig_name)  # Save the plot as an image file
     plt.close()  # Close the figure to avoid overlapping plots
 
-
-
-# Function to plot cwnd_bytes, rtt, ece, and retx in a single figure and save the figure
-def plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_list, 
-                       df_iperf_retx_list, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_ecn_list, path, file_name, has_ecn):  
-   
-    num_plots = 7 if not has_ecn else 8
-    fig, axs = plt.subplots(num_plots, 1, sharex=True, figsize=(8, num_plots * 2), constrained_layout=True)
-    
-    flow_counter = 1  # Initialize the flow counter
-    retx_df_list = []
-
-    # Determine max values for y-axes
-    y_max_iperf_cwnd = max([df['Cwnd_MBytes'].max() for df in df_iperf_cwnd_list])
-    y_max_rtt = max([df['rtt_ms'].max() for df in df_rtt_list])
-    y_max_probe_rtt = df_probe_rtt['rtt_ms'].max()
-    y_max_retx = max([df['retx_pkts'].max() for df in df_retx_list])
-    y_max_iperf_retx = max([df['Retx_pkts'].max() for df in df_iperf_retx_list])
-    y_max_buffer_dropped = df_buffer_dropped['dropped_pkts'].max()
-    y_max_buffer_overlimit = df_buffer_overlimit['overlimits_pkts'].max()
-    if has_ecn:
-        y_max_ecn = max([df['ECE_FLAG'].max() for df in df_ecn_list])
-
-
 # Function to plot cwnd_bytes, rtt, ece, and retx in a single figure and save the figure
 def plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_list, 
-                       df_iperf_retx_list, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_ecn_list, path, file_name, has_ecn):  
-    num_plots = 7 if not has_ecn else 8
-    fig, axs = plt.subplots(num_plots, 1, sharex=True, figsize=(8, num_plots * 1.5), constrained_layout=True)
-    
+                       df_iperf_retx_list, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_ecn_list, path, file_name, has_ecn,
+                       renderer=None, formats=OUTPUT_FORMATS):
     flow_counter = 1  # Initialize the flow counter
-    
-    # print(f"df_iperf_cwnd_list head thpt:\n", df_iperf_cwnd_list.head())
-    # print(f"df_iperf_cwnd_list head retx:\n", df_iperf_retx_list.head())
 
     # Determine y-axis limits based on the maximum values across all data
     y_max_iperf_cwnd = max([df['Cwnd_MBytes'].max() for df in df_iperf_cwnd_list]) * 1.1 if df_iperf_cwnd_list else 1
@@ -269,42 +325,34 @@ def plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_li
     y_max_iperf_retx = max([df['Retx_pkts'].max() for df in df_iperf_retx_list]) * 1.1 if df_iperf_retx_list else 1
     y_max_dropped = df_buffer_dropped['dropped_pkts'].max() * 1.1 if not df_buffer_dropped.empty else 1
     y_max_overlimits = df_buffer_overlimit['overlimits_pkts'].max() * 1.1 if not df_buffer_overlimit.empty else 1
-    # if has_ecn:
-    #    y_max_ecn = df_ecn_list['ECE_FLAG'].max() * 1.1 if df_ecn_list else 1
 
-    def safe_set_ylim(ax, y_max):
-        if y_max == 0:
-            ax.set_ylim(0, 1)
-        else:
-            ax.set_ylim(0, y_max)
+    csv_frames = {suffix: [] for suffix in DERIVED_CSV_SUFFIXES}
 
     # Calculate retx_df for each flow
-    retx_dfs = []
-    for i in range(len(df_cwnd_list)):
-        retx = []
-        step = 1
-        interval = step
-        retx_sum = 0
-        retx.append([0, retx_sum])
-
-        for index, row in df_retx_list[i].iterrows(): 
-            if row['time_stamp_sec'] <= interval:
-                retx_sum += row['retx_pkts']
-            else:
-                retx.append([interval, retx_sum])
-                interval += step
-                retx_sum = 0
-
-        column_names = ['interval_sec','retx_sum_pkts']
-        retx_df = pd.DataFrame(retx, columns=column_names)
-        retx_dfs.append(retx_df)
+    retx_dfs = [retx_per_interval(df_retx_list[i]) for i in range(len(df_cwnd_list))]
 
     # Determine the maximum value for y-axis limits
     y_max_retx = max([df['retx_sum_pkts'].max() for df in retx_dfs]) * 1.1 if retx_dfs else 1
 
+    # Panels of the combined figure, top to bottom, each with its traces
+    panels = [
+        {'ylabel': 'MBytes_iperf', 'ymax': y_max_iperf_cwnd, 'traces': []},
+        {'ylabel': 'rtt_msec', 'ymax': y_max_rtt, 'traces': []},
+        {'ylabel': 'probed_rtt_msec', 'ymax': y_max_probe_rtt, 'traces': []},
+    ]
+    if has_ecn:
+        panels.append({'ylabel': 'ECE Flags', 'ymax': 1.1, 'traces': []})
+    panels += [
+        {'ylabel': 'retx_pkts', 'ymax': y_max_retx, 'traces': []},
+        {'ylabel': 'retx_pkts_iperf', 'ymax': y_max_iperf_retx, 'traces': []},
+        {'ylabel': 'dropped_pkts', 'ymax': y_max_dropped, 'traces': []},
+        {'ylabel': 'overlimits_pkts', 'ymax': y_max_overlimits, 'traces': []},
+    ]
+    iperf_cwnd_panel, rtt_panel, probe_rtt_panel = panels[:3]
+    retx_panel, iperf_retx_panel, dropped_panel, overlimits_panel = panels[-4:]
+
     for i in range(len(df_cwnd_list)):
         retx_df = retx_dfs[i]
-        dst_port, src_port = df_cwnd_list[i]['dst_port'].iloc[0], df_cwnd_list[i]['src_port'].iloc[0]
         flow_label = f'Flow #{flow_counter}'  # Create a flow label
 
         # Add a new column 'flow_id' with the current flow counter to each DataFrame
@@ -318,134 +366,160 @@ def plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_li
         if has_ecn:
             df_ecn_list[i]['flow_id'] = flow_counter
 
-        # Save data to separate CSV files for each type
-        df_rtt_list[i][['flow_id', 'time_stamp_sec', 'rtt_ms']].to_csv(
-            os.path.join(path, f'{file_name}_rtt.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_rtt.csv')), index=False)
-        retx_df[['flow_id', 'interval_sec', 'retx_sum_pkts']].to_csv(
-            os.path.join(path, f'{file_name}_retx.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_retx.csv')), index=False)
-        df_iperf_cwnd_list[i][['flow_id', 'Time_sec', 'Cwnd_MBytes']].to_csv(
-            os.path.join(path, f'{file_name}_iperf_cwnd.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_iperf_cwnd.csv')), index=False)
-        df_iperf_retx_list[i][['flow_id', 'Time_sec', 'Retx_pkts']].to_csv(
-            os.path.join(path, f'{file_name}_iperf_retx.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_iperf_retx.csv')), index=False)
-        df_buffer_dropped[['flow_id', 'time_stamp_sec', 'dropped_pkts']].to_csv(
-            os.path.join(path, f'{file_name}_buffer_dropped.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_buffer_dropped.csv')), index=False)
-        df_buffer_overlimit[['flow_id', 'time_stamp_sec', 'overlimits_pkts']].to_csv(
-            os.path.join(path, f'{file_name}_buffer_overlimit.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_buffer_overlimit.csv')), index=False)
-        df_probe_rtt[['flow_id', 'time_stamp', 'rtt_ms']].to_csv(
-            os.path.join(path, f'{file_name}_probe_rtt.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_probe_rtt.csv')), index=False)
+        # Collect the rows of the derived CSV files; each file is written once for all flows below
+        csv_frames['rtt'].append(df_rtt_list[i][['flow_id', 'time_stamp_sec', 'rtt_ms']])
+        csv_frames['retx'].append(retx_df[['flow_id', 'interval_sec', 'retx_sum_pkts']])
+        csv_frames['iperf_cwnd'].append(df_iperf_cwnd_list[i][['flow_id', 'Time_sec', 'Cwnd_MBytes']])
+        csv_frames['iperf_retx'].append(df_iperf_retx_list[i][['flow_id', 'Time_sec', 'Retx_pkts']])
+        csv_frames['buffer_dropped'].append(df_buffer_dropped[['flow_id', 'time_stamp_sec', 'dropped_pkts']])
+        csv_frames['buffer_overlimit'].append(df_buffer_overlimit[['flow_id', 'time_stamp_sec', 'overlimits_pkts']])
+        csv_frames['probe_rtt'].append(df_probe_rtt[['flow_id', 'time_stamp', 'rtt_ms']])
         if has_ecn:
-            df_ecn_list[i][['flow_id', 'time_stamp_sec', 'ECN', 'ECE_FLAG', 'CWR_FLAG']].to_csv(
-                os.path.join(path, f'{file_name}_ecn.csv'), mode='a', header=not os.path.exists(os.path.join(path, f'{file_name}_ecn.csv')), index=False)
-
-        # Plotting data
-        axs[0].plot(df_iperf_cwnd_list[i]['Time_sec'], df_iperf_cwnd_list[i]['Cwnd_MBytes'], label=f'{flow_label}')
-        axs[0].set_ylabel('MBytes_iperf')
-        safe_set_ylim(axs[0], y_max_iperf_cwnd)
-
-        axs[1].plot(df_rtt_list[i]['time_stamp_sec'], df_rtt_list[i]['rtt_ms'], label=f'{flow_label}')
-        axs[1].set_ylabel('rtt_msec')
-        safe_set_ylim(axs[1], y_max_rtt)
-
-        axs[2].plot(df_probe_rtt['time_stamp'], df_probe_rtt['rtt_ms'], label=f'{flow_label}', color='blue')
-        axs[2].set_ylabel('probed_rtt_msec')
-        safe_set_ylim(axs[2], y_max_probe_rtt)
+            csv_frames['ecn'].append(df_ecn_list[i][['flow_id', 'time_stamp_sec', 'ECN', 'ECE_FLAG', 'CWR_FLAG']])
 
+        # Per-flow traces
+        iperf_cwnd_panel['traces'].append(trace(df_iperf_cwnd_list[i]['Time_sec'], df_iperf_cwnd_list[i]['Cwnd_MBytes'], flow_label))
+        rtt_panel['traces'].append(trace(df_rtt_list[i]['time_stamp_sec'], df_rtt_list[i]['rtt_ms'], flow_label))
         if has_ecn:
-            axs[3].plot(df_ecn_list[i]['time_stamp_sec'], df_ecn_list[i]['ECE_FLAG'], label=f'{flow_label} ECE_FLAG', linestyle='--', color='purple')
-            axs[3].set_ylabel('ECE Flags')
-            safe_set_ylim(axs[3], 1.1)
+            panels[3]['traces'].append(trace(df_ecn_list[i]['time_stamp_sec'], df_ecn_list[i]['ECE_FLAG'], f'{flow_label} ECE_FLAG',
+                                             color='purple', dash=True))
+        retx_panel['traces'].append(trace(retx_df['interval_sec'], retx_df['retx_sum_pkts'], flow_label))
+        iperf_retx_panel['traces'].append(trace(df_iperf_retx_list[i]['Time_sec'], df_iperf_retx_list[i]['Retx_pkts'], flow_label))
 
-        axs[3 if not has_ecn else 4].plot(retx_df['interval_sec'], retx_df['retx_sum_pkts'], label=f'{flow_label}')
-        axs[3 if not has_ecn else 4].set_ylabel('retx_pkts')
-        safe_set_ylim(axs[3 if not has_ecn else 4], y_max_retx)
-
-        axs[4 if not has_ecn else 5].plot(df_iperf_retx_list[i]['Time_sec'], df_iperf_retx_list[i]['Retx_pkts'], label=f'{flow_label}')
-        axs[4 if not has_ecn else 5].set_ylabel('retx_pkts_iperf')
-        safe_set_ylim(axs[4 if not has_ecn else 5], y_max_iperf_retx)
-
-        buffer_nonzero = df_buffer_dropped[df_buffer_dropped['dropped_pkts'] != 0]
-        axs[5 if not has_ecn else 6].stem(buffer_nonzero['time_stamp_sec'], buffer_nonzero['dropped_pkts'], linefmt='none', 
-                    markerfmt='*r', basefmt='y', bottom=0, label=f'{flow_label}')
-        axs[5 if not has_ecn else 6].set_ylabel('dropped_pkts')
-        safe_set_ylim(axs[5 if not has_ecn else 6], y_max_dropped)
-        
-        axs[6 if not has_ecn else 7].plot(df_buffer_overlimit['time_stamp_sec'], df_buffer_overlimit['overlimits_pkts'], label=f'{flow_label}', color='orange')
-        axs[6 if not has_ecn else 7].set_ylabel('overlimits_pkts')
-        safe_set_ylim(axs[6 if not has_ecn else 7], y_max_overlimits)
-        
         flow_counter += 1  # Increment the flow counter for the next flow
 
+    # The probe RTT and buffer counters are the same for every flow; they are drawn once
+    if df_cwnd_list:
+        probe_rtt_panel['traces'].append(trace(df_probe_rtt['time_stamp'], df_probe_rtt['rtt_ms'], 'probed_rtt', color='blue'))
+        buffer_nonzero = df_buffer_dropped[df_buffer_dropped['dropped_pkts'] != 0]
+        dropped_panel['traces'].append(trace(buffer_nonzero['time_stamp_sec'], buffer_nonzero['dropped_pkts'], 'dropped_pkts',
+                                             color='red', kind='markers'))
+        overlimits_panel['traces'].append(trace(df_buffer_overlimit['time_stamp_sec'], df_buffer_overlimit['overlimits_pkts'],
+                                                'overlimits_pkts', color='orange'))
+
+    outputs = []
+    if 'csv' in formats:
+        outputs += export_combined_data(csv_frames, path, file_name)
+
+    # Render the figures from series decimated to their pixel budgets, so neither renderer sees millions of points
+    renderer = renderer or Renderer()
+    if 'png' in formats:
+        png_name = f'{path}/{file_name}_combined.png'
+        renderer.submit(render_combined_png, decimate_panels(panels, PNG_BINS), png_name)
+        outputs.append(png_name)
+    if 'html' in formats:
+        html_name = f'{path}/{file_name}_combined.html'
+        renderer.submit(render_combined_html, decimate_panels(panels, HTML_BINS), html_name)
+        outputs.append(html_name)
+    return outputs
+
+# Function to write the derived CSV files, replacing those of an earlier run; the frame store keeps a copy for
+# influxdb_database.py. Returns the files written.
+def export_combined_data(csv_frames, path, file_name):
+    store = FrameStore(path)
+    outputs = []
+    for suffix, frames in csv_frames.items():
+        if frames:
+            csv_file = os.path.join(path, f'{file_name}_{suffix}.csv')
+            store.write_csv(pd.concat(frames), csv_file, index=False)
+            outputs.append(csv_file)
+    return outputs
+
+# Function to describe one trace of a combined figure: a line, a dashed line or markers
+def trace(x, y, label, color=None, dash=False, kind='lines'):
+    return {'x': np.asarray(x, dtype=np.float64), 'y': np.asarray(y, dtype=np.float64), 'label': label,
+            'color': color, 'dash': dash, 'kind': kind}
+
+# Function to decimate every trace to about two points per bin, with `bins` bins across the visible time axis
+def decimate_panels(panels, bins):
+    decimated = []
+    for panel in panels:
+        traces = []
+        for t in panel['traces']:
+            span = t['x'].max() - t['x'].min() if len(t['x']) else 0
+            trace_bins = int(bins * max(1, span / (PLOT_TIME_RANGE[1] - PLOT_TIME_RANGE[0])))
+            x, y = decimate(t['x'], t['y'], trace_bins, DECIMATION)
+            traces.append(dict(t, x=x, y=y))
+        decimated.append(dict(panel, traces=traces))
+    return decimated
+
+# Function to render a combined figure with matplotlib (Agg) and save it as a PNG
+def render_combined_png(panels, fig_name):
+    plt = pyplot()
+
+    num_plots = len(panels)
+    fig, axs = plt.subplots(num_plots, 1, sharex=True, figsize=(PNG_WIDTH_IN, num_plots * 1.5), constrained_layout=True)
+    for ax, panel in zip(axs, panels):
+        for t in panel['traces']:
+            if t['kind'] == 'markers':
+                ax.stem(t['x'], t['y'], linefmt='none', markerfmt='*r', basefmt='y', bottom=0, label=t['label'])
+            else:
+                ax.plot(t['x'], t['y'], label=t['label'], color=t['color'], linestyle='--' if t['dash'] else '-')
+        if panel['traces']:
+            ax.set_ylabel(panel['ylabel'])
+            ax.set_ylim(0, panel['ymax'] if panel['ymax'] != 0 else 1)
+
+    axs[-1].set_xlim(*PLOT_TIME_RANGE)  # Set x-axis limits
+    axs[-1].set_xlabel('time_sec')
+
+    fig.savefig(fig_name, dpi=PNG_DPI)  # Save the plot as an image file
+    plt.close(fig)  # Close the figure to avoid overlapping plots
+
+# Function to render a combined figure with plotly (WebGL traces) and save it as an HTML file that loads
+# plotly.js from a plotly.min.js shared by the figures of the directory
+def render_combined_html(panels, fig_name):
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    num_plots = len(panels)
+    fig = make_subplots(rows=num_plots, cols=1, shared_xaxes=True, subplot_titles=[panel['ylabel'] for panel in panels])
+    for row, panel in enumerate(panels, start=1):
+        for t in panel['traces']:
+            if t['kind'] == 'markers':
+                style = {'marker': dict(symbol='star', size=8, color=t['color'])}
+            else:
+                style = {'line': dict(color=t['color'], dash='dash' if t['dash'] else None)}
+            fig.add_trace(go.Scattergl(x=t['x'], y=t['y'], mode=t['kind'], name=t['label'], **style), row=row, col=1)
+        fig.update_yaxes(range=[0, panel['ymax']], row=row, col=1)
 
-    axs[6 if not has_ecn else 7].set_xlim(0, 120)  # Set x-axis limits
-    axs[6 if not has_ecn else 7].set_xlabel('time_sec')
-    
-    # Move the legend to the upper part of the image
-    # axs[0].legend(loc='lower center', bbox_to_anchor=(0.5, 1.25), ncol=6, fancybox=True, shadow=False)
+    # Set x-axis limits
+    fig.update_xaxes(range=list(PLOT_TIME_RANGE), row=num_plots, col=1, title_text='time_sec', dtick=10)
 
-    fig_name = f'{path}/{file_name}_combined.png'
-    plt.savefig(fig_name, dpi=600)  # Save the plot as an image file
-    plt.close()  # Close the figure to avoid overlapping plots
-    
-    cf.go_offline()  # Enable offline mode for cufflinks
+    # Update the layout and titles
+    fig.update_layout(title_text='Combined Data Plots', showlegend=False)
+    fig.write_html(fig_name, include_plotlyjs='directory', auto_open=False)
+
+# Renders figures inline or, with workers, in Agg-only worker processes: the figures of one sender are then
+# rendered while the data of the next one is prepared. wait() returns once everything submitted is rendered and
+# raises the first rendering error.
+class Renderer:
+    def __init__(self, workers=0):
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=use_agg) if workers else None
+        self.pending = []
+
+    def submit(self, function, *args):
+        if self.executor is None:
+            function(*args)
+        else:
+            self.pending.append(self.executor.submit(function, *args))
 
-    # Create a subplot with shared x-axis
-    fig = make_subplots(rows=num_plots, cols=1, shared_xaxes=True, subplot_titles=(
-        'MBytes_iperf', 'rtt_msec', 'probed_rtt_msec',
-        'ECE Flags' if has_ecn else '', 'retx_pkts', 'retx_pkts_iperf', 'dropped_pkts', 'overlimits_pkts'
-    ))
-    
-    flow_counter = 1  # Initialize the flow counter
-        
-    for i in range(len(df_cwnd_list)):
-        dst_port, src_port = df_cwnd_list[i]['dst_port'].iloc[0], df_cwnd_list[i]['src_port'].iloc[0]
-        flow_label = f'Flow #{flow_counter}'  # Create a flow label
+    def wait(self):
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
 
-        fig.add_trace(go.Scatter(x=df_iperf_cwnd_list[i]['Time_sec'], y=df_iperf_cwnd_list[i]['Cwnd_MBytes'],
-                                 mode='lines', name=flow_label), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df_rtt_list[i]['time_stamp_sec'], y=df_rtt_list[i]['rtt_ms'],
-                                 mode='lines', name=flow_label), row=2, col=1)
-        fig.add_trace(go.Scatter(x=df_probe_rtt['time_stamp'], y=df_probe_rtt['rtt_ms'],
-                                 mode='lines', name=flow_label), row=3, col=1)
-        if has_ecn:
-            fig.add_trace(go.Scatter(x=df_ecn_list[i]['time_stamp_sec'], y=df_ecn_list[i]['ECE_FLAG'],
-                                     mode='lines', name=f'{flow_label} ECE_FLAG', line=dict(dash='dash', color='purple')), row=4, col=1)
-        fig.add_trace(go.Scatter(x=retx_df['interval_sec'], y=retx_df['retx_sum_pkts'],
-                                 mode='lines', name=flow_label), row=5 if has_ecn else 4, col=1)
-        fig.add_trace(go.Scatter(x=df_iperf_retx_list[i]['Time_sec'], y=df_iperf_retx_list[i]['Retx_pkts'],
-                                 mode='lines', name=flow_label), row=6 if has_ecn else 5, col=1)
-        buffer_trace_nonzero = df_buffer_dropped[df_buffer_dropped['dropped_pkts'] != 0]
-        fig.add_trace(go.Scatter(x=buffer_trace_nonzero['time_stamp_sec'], y=buffer_trace_nonzero['dropped_pkts'],
-                                 mode='markers', name=flow_label, marker=dict(symbol='star',
-                                 size=8, color='red')), row=7 if has_ecn else 6, col=1)
-        fig.add_trace(go.Scatter(x=df_buffer_overlimit['time_stamp_sec'], y=df_buffer_overlimit['overlimits_pkts'],
-                                 mode='lines', name=flow_label, line=dict(color='orange')), row=8 if has_ecn else 7, col=1)
+    def cancel(self):
+        # Forgets the renders of a failed configuration, so their errors are not reported for the next one
+        for future in self.pending:
+            future.cancel()
+        self.pending = []
 
-        flow_counter += 1  # Increment the flow counter for the next flow
-    
-    # Set x-axis limits
-    fig.update_xaxes(range=[0, 120], row=num_plots, col=1, title_text='time_sec', dtick=10)
-    
-    # Set y-axis limits
-    fig.update_yaxes(range=[0, y_max_iperf_cwnd], row=1, col=1)
-    fig.update_yaxes(range=[0, y_max_rtt], row=2, col=1)
-    fig.update_yaxes(range=[0, y_max_probe_rtt], row=3, col=1)
-    if has_ecn:
-        fig.update_yaxes(range=[0, None], row=4, col=1)
-    fig.update_yaxes(range=[0, y_max_retx], row=5 if has_ecn else 4, col=1)
-    fig.update_yaxes(range=[0, y_max_iperf_retx], row=6 if has_ecn else 5, col=1)
-    fig.update_yaxes(range=[0, y_max_dropped], row=7 if has_ecn else 6, col=1)
-    fig.update_yaxes(range=[0, y_max_overlimits], row=8 if has_ecn else 7, col=1)
-    
-    # Update the layout and titles
-    fig.update_layout(title_text='Combined Data Plots', showlegend=False)
-    
-    # Save the plot as an HTML file
-    fig_name = f'{path}/{file_name}_combined.html'
-    plot(fig, filename=fig_name, auto_open=False)
+def use_agg():
+    pyplot()
 
 
 def plot_df(df_extracted, df_rtt, df_retx, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_iperf_cwnd, 
-            df_iperf_retx, path, file_name, has_ecn):
+            df_iperf_retx, path, file_name, has_ecn, renderer=None, formats=OUTPUT_FORMATS):
     # Initialize lists to store DataFrames
     df_cwnd_list = []
     df_rtt_list = []
@@ -459,6 +533,12 @@ def plot_df(df_extracted, df_rtt, df_retx, df_buffer_dropped, df_buffer_overlimi
     df_filtered_rtt = df_rtt[(df_rtt['src_port'] >= 15611) & (df_rtt['src_port'] <= 15670)]
     df_filtered_retx = df_retx[(df_retx['dst_port'] >= 15611) & (df_retx['dst_port'] <= 15670)]
 
+    # Index every table by flow once instead of masking the whole table for each flow
+    rtt_flows = FlowIndex(df_filtered_rtt)
+    retx_flows = FlowIndex(df_filtered_retx)
+    iperf_cwnd_flows = FlowIndex(df_iperf_cwnd)
+    iperf_retx_flows = FlowIndex(df_iperf_retx)
+
     # Plot combined cwnd, rtt, and retx for each combination
     for (dst_port, src_port), group_df in df_filtered_extracted.groupby(['dst_port', 'src_port']):
         if has_ecn:
@@ -467,10 +547,11 @@ def plot_df(df_extracted, df_rtt, df_retx, df_buffer_dropped, df_buffer_overlimi
         else:
             df_cwnd = group_df[['dst_port', 'src_port', 'time_stamp_sec', 'cwnd_bytes']]
 
-        df_rtt_group = df_filtered_rtt[(df_filtered_rtt['dst_port'] == src_port) & (df_filtered_rtt['src_port'] == dst_port)]
-        df_retx_group = df_filtered_retx[(df_filtered_retx['dst_port'] == dst_port) & (df_filtered_retx['src_port'] == src_port)]
-        df_iperf_cwnd_group = df_iperf_cwnd[(df_iperf_cwnd['dst_port'] == dst_port) & (df_iperf_cwnd['src_port'] == src_port)]
-        df_iperf_retx_group = df_iperf_retx[(df_iperf_retx['dst_port'] == dst_port) & (df_iperf_retx['src_port'] == src_port)]
+        # RTT samples are taken on the ACKs, which flow in the opposite direction
+        df_rtt_group = rtt_flows.get(src_port, dst_port)
+        df_retx_group = retx_flows.get(dst_port, src_port)
+        df_iperf_cwnd_group = iperf_cwnd_flows.get(dst_port, src_port)
+        df_iperf_retx_group = iperf_retx_flows.get(dst_port, src_port)
 
         if not df_cwnd.empty and not df_rtt_group.empty and not df_iperf_cwnd_group.empty:
             df_cwnd_list.append(df_cwnd)
@@ -481,11 +562,15 @@ def plot_df(df_extracted, df_rtt, df_retx, df_buffer_dropped, df_buffer_overlimi
             if has_ecn:
                 df_ecn_list.append(df_ecn) 
         
-    # Call the function to plot combined data
-    plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_list, 
-                       df_iperf_retx_list, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_ecn_list, path, file_name, has_ecn)
+    # Call the function to plot combined data; returns the files it wrote
+    return plot_combined_data(df_cwnd_list, df_rtt_list, df_retx_list, df_iperf_cwnd_list, 
+                       df_iperf_retx_list, df_buffer_dropped, df_buffer_overlimit, df_probe_rtt, df_ecn_list, path, file_name, has_ecn,
+                       renderer, formats)
 
 # Main script
+DATA_ROOT = "/data2/imtiaz/bbrv3_new"
+MANIFEST_COLUMNS = ['aqm', 'cca1', 'cca2', 'speed', 'bdp', 'run', 'status', 'reason', 'elapsed_sec']
+
 speed_config = [
     {"tag": "1gbps", "speed": 1000000000, "processes": 10, "parallel_streams": 1},
     {"tag": "10gbps", "speed": 10000000000, "processes": 20, "parallel_streams": 5},
@@ -509,102 +594,249 @@ aqm_config = ["fifo", "fq_codel", "red"]
 
 bdp_config = [1, 2, 4]
 
-for aqm in aqm_config:
+# Version of the code producing the plots and derived CSVs, part of every configuration's cache fingerprint
+def code_version():
+    return build_cache.code_version(__file__, process_iperf, pcap_tables, timeseries)
+
+# One task per configuration of the sweep, in the order the nested loops used to visit them
+def sweep_tasks(runs=range(1, 2)):
+    for aqm in aqm_config:
+        for cca_combo in cca_config:
+            for speed in speed_config:
+                for bdp in bdp_config:
+                    for run in runs:
+                        yield {
+                            "cca1": cca_combo['cca1'],
+                            "cca2": cca_combo['cca2'],
+                            "speed": speed['tag'],
+                            "aqm": aqm,
+                            "bdp": bdp,
+                            "run": run
+                        }
+
+# Function to process and plot one configuration; returns (status, reason) for the manifest
+def process_configuration(row, data_root=DATA_ROOT, force=False, renderer=None, formats=OUTPUT_FORMATS):
+    aqm = row['aqm']
     has_ecn = aqm != "fifo"
-    for cca_combo in cca_config:
-        for speed in speed_config:
-            for bdp in bdp_config:
-                for run in range(1, 2):
-                    row = {
-                        "cca1": cca_combo['cca1'],
-                        "cca2": cca_combo['cca2'],
-                        "speed": speed['tag'], 
-                        "aqm": aqm,
-                        "bdp": bdp,
-                        "run": run
-                    }
-
-                    s1 = f"/data2/imtiaz/bbrv3_new/poseidon-sender-1_output/output/{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}"
-                    s2 = f"/data2/imtiaz/bbrv3_new/poseidon-sender-2_output/output/{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}"
-                    r1 = f"/data2/imtiaz/bbrv3_new/poseidon-router-1_output/output/{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}_buffer"
-                    
-                    # Select appropriate buffer file based on AQM
-                    if aqm == "fq_codel":
-                        buffer_file_r1 = f"{r1}/buffer_status_fq_codel.csv"
-                    elif aqm == "red":
-                        buffer_file_r1 = f"{r1}/buffer_status_red.csv"
-                    else:
-                        buffer_file_r1 = f"{r1}/buffer_status.csv"
-                    
-                    file_name_s1 = f"sender_1_{speed['tag']}_{cca_combo['cca1']}_{cca_combo['cca2']}_{aqm}_{bdp}bdp_{run}"
-                    file_name_s2 = f"sender_2_{speed['tag']}_{cca_combo['cca2']}_{cca_combo['cca1']}_{aqm}_{bdp}bdp_{run}"
-                    
-                    # sender 1
-                    s1_command = f'python3 /data2/imtiaz/bbrv3_new/process_iperf.py {s1}'
-                    subprocess.run(s1_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                    # sender 2
-                    s2_command = f'python3 /data2/imtiaz/bbrv3_new/process_iperf.py {s2}'
-                    subprocess.run(s2_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)           
-
-                    # Ensure all necessary files exist and are not empty
-                    files_to_check = [
-                        f"{s1}/extracted_information.csv", f"{s1}/rtt.csv", f"{s1}/retx.csv", f"{s1}/ping_active_rtt.csv", f"{s1}/iperf_data.csv",
-                        f"{s2}/extracted_information.csv", f"{s2}/rtt.csv", f"{s2}/retx.csv", f"{s2}/ping_active_rtt.csv", f"{s2}/iperf_data.csv",
-                        buffer_file_r1
-                    ]
-                    
-                    all_files_exist = all(os.path.exists(f) for f in files_to_check)
-                    all_files_nonempty = all(os.path.getsize(f) > 0 for f in files_to_check)
-
-                    if not all_files_exist or not all_files_nonempty:
-                        print(f"Skipping due to missing or empty files in configuration: {row}")
-                        continue
-
-                    # Read data from the s1 files
-                    extracted_info_file_s1 = f"{s1}/extracted_information.csv"
-                    rtt_file_s1 = f"{s1}/rtt.csv"
-                    retx_file_s1 = f"{s1}/retx.csv"
-                    prob_rtt_file_s1 = f"{s1}/ping_active_rtt.csv"
-                    iperf_file_s1 = f"{s1}/iperf_data.csv"
-
-                    # Read data from the s2 files
-                    extracted_info_file_s2 = f"{s2}/extracted_information.csv"
-                    rtt_file_s2 = f"{s2}/rtt.csv"
-                    retx_file_s2 = f"{s2}/retx.csv"
-                    prob_rtt_file_s2 = f"{s2}/ping_active_rtt.csv"
-                    iperf_file_s2 = f"{s2}/iperf_data.csv"
-
-                    
-                    # Preprocess the data from the s1 file
-                    df_extracted_s1, first_timestamp_s1 = read_and_preprocess(extracted_info_file_s1)
-                    df_rtt_s1 = process_rtt_and_retx(rtt_file_s1, first_timestamp_s1)
-                    df_retx_s1 = process_rtt_and_retx(retx_file_s1, first_timestamp_s1)
-                    df_probe_rtt_s1 = process_probe_rtt(prob_rtt_file_s1, first_timestamp_s1)
-                    df_iperf_cwnd_s1, df_iperf_retx_s1 = process_iperf_data(iperf_file_s1)
-
-                    # Preprocess the data from the s2 files
-                    df_extracted_s2, first_timestamp_s2 = read_and_preprocess(extracted_info_file_s2)
-                    df_rtt_s2 = process_rtt_and_retx(rtt_file_s2, first_timestamp_s1)
-                    df_retx_s2 = process_rtt_and_retx(retx_file_s2, first_timestamp_s1)
-                    df_probe_rtt_s2 = process_probe_rtt(prob_rtt_file_s2, first_timestamp_s1)
-                    df_iperf_cwnd_s2, df_iperf_retx_s2 = process_iperf_data(iperf_file_s2)
-
-                    
-                    print(f"df_iperf_cwnd_list head sender 1:\n", df_iperf_cwnd_s1.head())
-                    print(f"df_iperf_cwnd_list head sender 2:\n", df_iperf_cwnd_s2.head())
-
-                    # Preprocess the data from the r1 files
-                    df_buffer_dropped_r1, df_buffer_overlimit_r1 = process_buffer(buffer_file_r1, first_timestamp_s1)
-
-                    # Plot the data from the s1 files
-                    if df_extracted_s1 is not None and df_rtt_s1 is not None and df_retx_s1 is not None:
-                        plot_df(df_extracted_s1, df_rtt_s1, df_retx_s1, df_buffer_dropped_r1, df_buffer_overlimit_r1, 
-                                df_probe_rtt_s1, df_iperf_cwnd_s1, df_iperf_retx_s1, s1, file_name_s1, has_ecn)
-
-                    # Plot the data from the s2 files
-                    if df_extracted_s2 is not None and df_rtt_s2 is not None and df_retx_s2 is not None:
-                        plot_df(df_extracted_s2, df_rtt_s2, df_retx_s2, df_buffer_dropped_r1, df_buffer_overlimit_r1, 
-                                df_probe_rtt_s2, df_iperf_cwnd_s2, df_iperf_retx_s2, s2, file_name_s2, has_ecn)
-
-print("Processing completed.")
\ No newline at end of file
+    tag = f"{row['speed']}_{row['cca1']}_{row['cca2']}_{aqm}_{row['bdp']}bdp_{row['run']}"
+    tag_s2 = f"{row['speed']}_{row['cca2']}_{row['cca1']}_{aqm}_{row['bdp']}bdp_{row['run']}"
+
+    s1 = f"{data_root}/poseidon-sender-1_output/output/{tag}"
+    s2 = f"{data_root}/poseidon-sender-2_output/output/{tag_s2}"
+    r1 = f"{data_root}/poseidon-router-1_output/output/{tag}_buffer"
+
+    # Select appropriate buffer file based on AQM
+    if aqm == "fq_codel":
+        buffer_file_r1 = f"{r1}/buffer_status_fq_codel.csv"
+    elif aqm == "red":
+        buffer_file_r1 = f"{r1}/buffer_status_red.csv"
+    else:
+        buffer_file_r1 = f"{r1}/buffer_status.csv"
+
+    file_name_s1 = f"sender_1_{tag}"
+    file_name_s2 = f"sender_2_{tag_s2}"
+
+    # Skip the configuration if its inputs and this code are unchanged since it was last plotted
+    inputs = [os.path.join(s, name) for s in (s1, s2) if os.path.isdir(s) for name in sorted(iperf_files(s))]
+    inputs += [table_file(s, table) for s in (s1, s2) for table in ('extracted_information', 'rtt', 'retx')]
+    inputs += [f"{s1}/ping_active_rtt.csv", f"{s2}/ping_active_rtt.csv", buffer_file_r1]
+    record_file = build_cache.stage_record(s1, 'plot_all')
+    fingerprint = build_cache.stage_fingerprint(inputs, code_version(), formats=sorted(formats))
+    if not force and build_cache.is_fresh(record_file, fingerprint):
+        return 'fresh', ''
+
+    # Preprocessed frames of the senders and the router, built once per change of their raw tables
+    store_s1, store_s2, store_r1 = FrameStore(s1), FrameStore(s2), FrameStore(r1)
+
+    # Ensure all necessary files exist and are not empty
+    files_to_check = [
+        table_file(s1, 'extracted_information'), table_file(s1, 'rtt'), table_file(s1, 'retx'), f"{s1}/ping_active_rtt.csv",
+        table_file(s2, 'extracted_information'), table_file(s2, 'rtt'), table_file(s2, 'retx'), f"{s2}/ping_active_rtt.csv",
+        buffer_file_r1
+    ]
+    missing = [f for f in files_to_check if not os.path.exists(f) or os.path.getsize(f) == 0]
+    if missing:
+        return 'skipped', "missing or empty: " + " ".join(missing)
+
+    # Parse the iperf outputs of both senders in-process unless their stored frames and CSVs are current
+    df_iperf_cwnd_s1, df_iperf_retx_s1 = load_iperf_data(store_s1, s1)
+    df_iperf_cwnd_s2, df_iperf_retx_s2 = load_iperf_data(store_s2, s2)
+    if df_iperf_cwnd_s1 is None or df_iperf_cwnd_s2 is None:
+        return 'skipped', "no iperf data: " + " ".join(s for s, df in ((s1, df_iperf_cwnd_s1), (s2, df_iperf_cwnd_s2)) if df is None)
+
+    # Read data from the s1 files
+    extracted_info_file_s1 = table_file(s1, 'extracted_information')
+    rtt_file_s1 = table_file(s1, 'rtt')
+    retx_file_s1 = table_file(s1, 'retx')
+    prob_rtt_file_s1 = f"{s1}/ping_active_rtt.csv"
+
+    # Read data from the s2 files
+    extracted_info_file_s2 = table_file(s2, 'extracted_information')
+    rtt_file_s2 = table_file(s2, 'rtt')
+    retx_file_s2 = table_file(s2, 'retx')
+    prob_rtt_file_s2 = f"{s2}/ping_active_rtt.csv"
+
+    # Preprocess the data from the s1 file
+    df_extracted_s1, first_timestamp_s1 = load_extracted(store_s1, extracted_info_file_s1)
+    df_rtt_s1 = load_rtt_and_retx(store_s1, 'rtt', rtt_file_s1, first_timestamp_s1)
+    df_retx_s1 = load_rtt_and_retx(store_s1, 'retx', retx_file_s1, first_timestamp_s1)
+    df_probe_rtt_s1 = load_probe_rtt(store_s1, prob_rtt_file_s1, first_timestamp_s1)
+
+    # Preprocess the data from the s2 files
+    df_extracted_s2, first_timestamp_s2 = load_extracted(store_s2, extracted_info_file_s2)
+    df_rtt_s2 = load_rtt_and_retx(store_s2, 'rtt', rtt_file_s2, first_timestamp_s1)
+    df_retx_s2 = load_rtt_and_retx(store_s2, 'retx', retx_file_s2, first_timestamp_s1)
+    df_probe_rtt_s2 = load_probe_rtt(store_s2, prob_rtt_file_s2, first_timestamp_s1)
+
+    # Preprocess the data from the r1 files
+    df_buffer_dropped_r1, df_buffer_overlimit_r1 = load_buffer(store_r1, buffer_file_r1, first_timestamp_s1)
+
+    renderer = renderer or Renderer()
+    unplotted = []
+    outputs = []
+    # Plot the data from the s1 files
+    if df_extracted_s1 is not None and df_rtt_s1 is not None and df_retx_s1 is not None:
+        outputs += plot_df(df_extracted_s1, df_rtt_s1, df_retx_s1, df_buffer_dropped_r1, df_buffer_overlimit_r1,
+                df_probe_rtt_s1, df_iperf_cwnd_s1, df_iperf_retx_s1, s1, file_name_s1, has_ecn, renderer, formats)
+    else:
+        unplotted.append(s1)
+
+    # Plot the data from the s2 files
+    if df_extracted_s2 is not None and df_rtt_s2 is not None and df_retx_s2 is not None:
+        outputs += plot_df(df_extracted_s2, df_rtt_s2, df_retx_s2, df_buffer_dropped_r1, df_buffer_overlimit_r1,
+                df_probe_rtt_s2, df_iperf_cwnd_s2, df_iperf_retx_s2, s2, file_name_s2, has_ecn, renderer, formats)
+    else:
+        unplotted.append(s2)
+
+    # The figures of both senders are rendered before the configuration counts as done
+    renderer.wait()
+    if len(unplotted) == 2:
+        return 'skipped', "unreadable tables: " + " ".join(unplotted)
+    if unplotted:
+        return 'done', "unreadable tables: " + " ".join(unplotted)
+    # The iperf CSVs count as outputs too, so the configuration is redone when one of them is removed
+    outputs += [os.path.join(s, name) for s in (s1, s2) for name in IPERF_CSV_FILES if os.path.exists(os.path.join(s, name))]
+    build_cache.save_record(record_file, fingerprint, outputs)
+    return 'done', ''
+
+# Function to read the resident anonymous memory of this process (heap, NumPy and pandas buffers) in bytes.
+# File-backed pages, such as the memory-mapped tables and frames, are not counted: the kernel can drop them.
+def resident_anonymous_bytes():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+# Limits the resident memory of a sweep worker while it runs a task. A thread samples RssAnon every `interval`
+# seconds and, once it exceeds the limit, signals the main thread, which raises a MemoryError in the task. Unlike
+# an address space limit this does not count reserved but untouched memory, and the worker's render processes
+# (started without the thread) are not limited. A task stuck in one long C call only fails when it returns.
+class MemoryWatchdog:
+    def __init__(self, limit_bytes, interval=0.2):
+        self.limit_bytes = limit_bytes
+        self.interval = interval
+        self.active = False
+        signal.signal(signal.SIGUSR1, self.on_signal)
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def __enter__(self):
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            if self.active and resident_anonymous_bytes() > self.limit_bytes:
+                os.kill(os.getpid(), signal.SIGUSR1)
+
+    def on_signal(self, signum, frame):
+        # Runs in the main thread; signals arriving after the task ended are ignored
+        if self.active:
+            self.active = False
+            raise MemoryError(f"resident memory exceeded {self.limit_bytes / 1024 ** 3:g} GiB")
+
+# Renderer and memory watchdog of a sweep worker, set up by init_worker
+worker_renderer = None
+worker_memory_limit = None
+
+# Worker initializer: starts the worker's render processes and, with a memory limit, its watchdog, so one
+# oversized configuration fails with a MemoryError instead of taking the machine (and the other workers) down
+def init_worker(memory_limit_gb, render_workers):
+    global worker_renderer, worker_memory_limit
+    worker_renderer = Renderer(render_workers)
+    if memory_limit_gb:
+        worker_memory_limit = MemoryWatchdog(int(memory_limit_gb * 1024 ** 3))
+
+# Function to run one task in a worker; failures are returned as manifest rows rather than raised
+def run_task(row, data_root, force, formats):
+    start = time.monotonic()
+    try:
+        if worker_memory_limit is None:
+            status, reason = process_configuration(row, data_root, force, worker_renderer, formats)
+        else:
+            with worker_memory_limit:
+                status, reason = process_configuration(row, data_root, force, worker_renderer, formats)
+    except MemoryError as e:
+        status, reason = 'failed', f"MemoryError: {e or 'out of memory'}"
+    except Exception as e:
+        status, reason = 'failed', f"{type(e).__name__}: {e}"
+    finally:
+        worker_renderer.cancel()
+        if 'matplotlib.pyplot' in sys.modules:
+            pyplot().close('all')
+    return dict(row, status=status, reason=reason, elapsed_sec=round(time.monotonic() - start, 1))
+
+def run_sweep(tasks, workers, memory_limit_gb, manifest_file, data_root=DATA_ROOT, force=False, render_workers=1,
+              formats=OUTPUT_FORMATS):
+    # Runs the tasks on a pool of `workers` processes and appends one manifest row per task as it finishes
+    counts = {'done': 0, 'fresh': 0, 'skipped': 0, 'failed': 0}
+    with open(manifest_file, 'w', newline='') as f:
+        manifest = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+        manifest.writeheader()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(memory_limit_gb, render_workers if FIGURE_FORMATS & set(formats) else 0)) as executor:
+            futures = {executor.submit(run_task, row, data_root, force, formats): row for row in tasks}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. killed by the OOM killer); the tasks it took down are recorded as failed
+                    record = dict(futures[future], status='failed', reason=f"worker died: {e}", elapsed_sec='')
+                manifest.writerow(record)
+                f.flush()
+                counts[record['status']] += 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot every configuration of the sweep on a pool of worker processes")
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count() // 2),
+                        help="Configurations processed in parallel (default: half the CPUs)")
+    parser.add_argument("--memory-limit-gb", type=float, default=0,
+                        help="Resident memory limit of each worker in GiB, not counting memory-mapped files and render processes (default: no limit)")
+    parser.add_argument("--manifest", type=str, default="plot_all_manifest.csv",
+                        help="CSV recording the status (done, fresh, skipped, failed) and reason of every configuration")
+    parser.add_argument("--data-root", type=str, default=DATA_ROOT,
+                        help="Directory containing the poseidon-sender-1/2 and poseidon-router-1 outputs")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per configuration")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Processes per worker rendering the figures while the worker prepares the next data (0 renders inline)")
+    parser.add_argument("--formats", type=str, default=','.join(OUTPUT_FORMATS),
+                        help="Comma-separated outputs per configuration: csv (derived per-flow data), png and/or html (combined figures)")
+    parser.add_argument("--force", action='store_true',
+                        help="Re-plot every configuration, even those whose inputs are unchanged since they were last plotted")
+    args = parser.parse_args()
+    formats = args.formats.split(',')
+    if not formats or any(output not in OUTPUT_FORMATS for output in formats):
+        parser.error(f"--formats must be a comma-separated list of {', '.join(OUTPUT_FORMATS)}")
+
+    counts = run_sweep(sweep_tasks(range(1, args.runs + 1)), args.workers, args.memory_limit_gb, args.manifest,
+                       args.data_root, args.force, args.render_workers, formats)
+    print(f"Processing completed: {counts['done']} done, {counts['fresh']} up to date, {counts['skipped']} skipped, "
+          f"{counts['failed']} failed (see {args.manifest}).")
+
+if __name__ == '__main__':
+    main()
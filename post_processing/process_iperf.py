@@ -1,158 +1,278 @@
+import argparse
 import sys
 import os
+import json
+import math
+from multiprocessing import Pool, cpu_count
 import pandas as pd
 import re
 
-def extract_port(line):
-    match = re.search(r'\[\s*(\d+)\]', line)
-    if match:
-        return match.group(1)
-    return None
-
-def extract_src_dst_ports(line):
-    match = re.search(r'local .* port (\d+) connected to .* port (\d+)', line)
-    if match:
-        src_port = match.group(1)
-        dst_port = match.group(2)
-        return src_port, dst_port
-    return None, None
-
-def convert_cwnd_to_mbytes(cwnd_str):
-    cwnd_str = cwnd_str.strip()
-    units = {
-        'GBytes': 1024 * 1024,
-        'MBytes': 1,
-        'KBytes': 1 / 1024,
-        'Bytes': 1 / (1024 * 1024)
-    }
-    cwnd_parts = cwnd_str.split()
-    cwnd_unit = cwnd_parts[-1]
-    if cwnd_unit not in units:
-        raise ValueError(f"Unknown cwnd unit: {cwnd_unit}")
-    cwnd_value = float(cwnd_parts[-2])
-    cwnd = cwnd_value * units[cwnd_unit]
-    return round(cwnd, 2)
-
-def convert_throughput_to_mbps(throughput_str):
-    throughput_str = throughput_str.strip()
-    units = {
-        'Gbits/sec': 1000,
-        'Mbits/sec': 1,
-        'Kbits/sec': 1 / 1000,
-        'bits/sec': 1 / (1000 * 1000)
-    }
-    throughput_parts = throughput_str.split()
-    throughput_unit = throughput_parts[-1]
-    if throughput_unit not in units:
-        raise ValueError(f"Unknown throughput unit: {throughput_unit}")
-    throughput_value = float(throughput_parts[-2])
-    throughput = throughput_value * units[throughput_unit]
-    return round(throughput, 2)
-
-def extract_time_and_data(line):
-    columns = line.split()
-    if len(columns) < 9:
-        raise ValueError(f"Invalid line format: {line.strip()}")
-    time_str = columns[2]
-    time_start, time_end = map(float, time_str.split('-'))
-    time = time_end
-    throughput_str = columns[6] + " " + columns[7]
-    retx = columns[8]
-    cwnd_value_str = columns[9]
-    cwnd_unit = columns[10]
-
-    return time, throughput_str, retx, cwnd_value_str, cwnd_unit
-
-# Initialize an empty DataFrame
-df = pd.DataFrame()
-# Initialize an empty list to store DataFrame chunks
-df_chunks = []
-
-# Get the directory path from the command line argument
-if len(sys.argv) != 2:
-    print("Usage: python script_name.py directory_path")
-    sys.exit(1)
-
-directory = sys.argv[1]
-if not os.path.isdir(directory):
-    print(f"Error: {directory} is not a valid directory.")
-    sys.exit(1)
-
-file_list = [file for file in os.listdir(directory) if file.startswith("iperf_") and file.endswith(".out")]
-
-for filename in file_list:
-    # Clear data for the next iteration
-    port_data = []
+import build_cache
+from build_cache import atomic_write, write_csv
+
+# One grammar for the iperf3 client lines we use: the connection of a stream and its per-interval report, e.g.
+#   [  5] local 10.0.0.1 port 43210 connected to 10.0.0.2 port 15611
+#   [  5]   0.00-1.00   sec   112 MBytes   939 Mbits/sec    0   3.01 MBytes
+# Summary lines ([SUM], [ ID], sender/receiver totals) do not match.
+IPERF_LINE = re.compile(r'\[\s*(\d+)\]\s+(?:local .* port (\d+) connected to .* port (\d+)'
+                        r'|[\d.]+-([\d.]+)\s+sec\s+\S+\s+\S+\s+([\d.]+)\s+(\S+)\s+(\d+)\s+([\d.]+)\s+(\S+)(?:\s|$))')
+CWND_UNITS = {
+    'GBytes': 1024,
+    'MBytes': 1,
+    'KBytes': 1 / 1024,
+    'Bytes': 1 / (1024 * 1024)
+}
+THROUGHPUT_UNITS = {
+    'Gbits/sec': 1000,
+    'Mbits/sec': 1,
+    'Kbits/sec': 1 / 1000,
+    'bits/sec': 1 / (1000 * 1000)
+}
+IPERF_COLUMNS = ['src_port', 'dst_port', 'Time_sec', 'Retx_pkts', 'Cwnd_MBytes', 'Throughput_Mbps']
+# Columns only iperf3's JSON output provides: exact bytes per interval and the kernel's smoothed RTT and RTT variance
+JSON_COLUMNS = ['Bytes', 'Rtt_ms', 'Rttvar_ms']
+# iperf3 client outputs: text (-f m) in iperf_<port>.out, -J or --json-stream in iperf_<port>.json
+IPERF_SUFFIXES = ('.out', '.json')
+# CSV files process_iperf_directory writes into a run directory
+IPERF_CSV_FILES = ['iperf_data.csv', 'iperf_totals_per_port.csv', 'iperf_totals_per_sender.csv']
+
+def parse_iperf_file(file_name):
+    # Parses the interval reports of one iperf3 client text output into column lists, one row per stream and
+    # interval. Ports are kept as strings, as they appear in the output.
+    columns = {name: [] for name in IPERF_COLUMNS}
+    src_ports, dst_ports, times, retx, cwnds, throughputs = (columns[name] for name in IPERF_COLUMNS)
     port_mapping = {}
-    
-    with open(os.path.join(directory, filename), 'r') as f:
+    with open(file_name, 'r') as f:
         for line in f:
-            if '[' in line and ']' in line:
-                port_number = extract_port(line)
-                if port_number and port_number not in port_mapping:
-                    src_port, dst_port = extract_src_dst_ports(line)
-                    if src_port and dst_port:
-                        port_mapping[port_number] = {'src_port': src_port, 'dst_port': dst_port}
-                    continue
-
-                if port_number in port_mapping and '[ ID]' not in line and '[SUM]' not in line:
-                    try:
-                        time, throughput_str, retx, cwnd_value_str, cwnd_unit = extract_time_and_data(line)
-                        cwnd_str = f"{cwnd_value_str} {cwnd_unit}"
-                        cwnd = convert_cwnd_to_mbytes(cwnd_str)
-                        throughput_mbps = convert_throughput_to_mbps(throughput_str)
-
-                        if retx is not None and cwnd_value_str is not None:
-                            src_port = port_mapping[port_number]['src_port']
-                            dst_port = port_mapping[port_number]['dst_port']
-                            # Create a DataFrame chunk for the current data
-                            df_chunk = pd.DataFrame({'src_port': [src_port], 'dst_port': [dst_port], 'Time_sec': [float(time)], 'Retx_pkts': [float(retx)], 'Cwnd_MBytes': [float(cwnd)], 'Throughput_Mbps': [throughput_mbps]})
-                            df_chunks.append(df_chunk)
-                        else:
-                            print(f"If statement: Error processing line: {line.strip()}. Skipping.")
-                    except (IndexError, ValueError) as e:
-                        print(f"Error processing line: {line.strip()}. Skipping. Error: {e}")
-
-# Concatenate all DataFrame chunks into a single DataFrame
-if df_chunks:
-    df = pd.concat(df_chunks, ignore_index=True)
-    print("DataFrame head after concatenation:")
-    print(df.head())
-
-    # Save the entire DataFrame to a single CSV
-    df.to_csv(os.path.join(directory, 'iperf_data.csv'), index=False)
-    print("Saved the detailed data to iperf_data.csv")
-
-    # Calculate the total time
-    total_time_sec = df['Time_sec'].max()
-    print(f"Total time (sec): {total_time_sec}")
-    if total_time_sec == 0:
-        print("Debug: Total time is zero. Skipping throughput calculation.")
+            match = IPERF_LINE.match(line)
+            if match is None:
+                continue
+            stream, src_port, dst_port, time_end, throughput, throughput_unit, retx_pkts, cwnd, cwnd_unit = match.groups()
+            if src_port is not None:
+                port_mapping.setdefault(stream, (src_port, dst_port))
+                continue
+            if stream not in port_mapping:
+                continue
+            if cwnd_unit not in CWND_UNITS or throughput_unit not in THROUGHPUT_UNITS:
+                print(f"Error processing line: {line.strip()}. Skipping. Error: unknown unit")
+                continue
+            src_ports.append(port_mapping[stream][0])
+            dst_ports.append(port_mapping[stream][1])
+            times.append(float(time_end))
+            retx.append(float(retx_pkts))
+            cwnds.append(round(float(cwnd) * CWND_UNITS[cwnd_unit], 2))
+            throughputs.append(round(float(throughput) * THROUGHPUT_UNITS[throughput_unit], 2))
+    return columns
+
+def iter_json_document(f):
+    # Yields ('start', start), then ('interval', interval) for each interval and ('error', message) of an
+    # iperf3 -J document. With ijson the document is read incrementally, one interval object at a time;
+    # without it the whole document is loaded.
+    try:
+        import ijson
+    except ImportError:
+        document = json.load(f)
+        yield 'start', document.get('start', {})
+        for interval in document.get('intervals', []):
+            yield 'interval', interval
+        if 'error' in document:
+            yield 'error', document['error']
+        return
+
+    targets = {'start': 'start', 'intervals.item': 'interval'}
+    builder = None
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == target and event == 'end_map':
+                yield targets[target], builder.value
+                builder = None
+        elif prefix in targets and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            target = prefix
+        elif prefix == 'error' and event == 'string':
+            yield 'error', value
+
+def iter_json_events(f):
+    # Yields the (event, data) pairs of an iperf3 JSON output, either --json-stream (one {"event", "data"}
+    # object per line) or a -J document
+    first_line = f.readline()
+    try:
+        first = json.loads(first_line)
+    except ValueError:
+        first = None
+    if isinstance(first, dict) and 'event' in first:
+        yield first['event'], first.get('data')
+        for line in f:
+            if line.strip():
+                message = json.loads(line)
+                yield message['event'], message.get('data')
+    else:
+        f.seek(0)
+        yield from iter_json_document(f)
+
+def parse_iperf_json(file_name):
+    # Parses the interval reports of one iperf3 -J or --json-stream client output into column lists. Values are
+    # taken unrounded from the JSON: Cwnd_MBytes from snd_cwnd, Throughput_Mbps from bits_per_second, plus the
+    # bytes sent and the RTT and RTT variance (ms) of every interval.
+    columns = {name: [] for name in IPERF_COLUMNS + JSON_COLUMNS}
+    port_mapping = {}
+    with open(file_name, 'rb') as f:
+        for event, data in iter_json_events(f):
+            if event == 'start':
+                for connection in data.get('connected', []):
+                    port_mapping[connection['socket']] = (str(connection['local_port']), str(connection['remote_port']))
+            elif event == 'interval':
+                for stream in data.get('streams', []):
+                    ports = port_mapping.get(stream.get('socket'))
+                    if ports is None:
+                        continue
+                    columns['src_port'].append(ports[0])
+                    columns['dst_port'].append(ports[1])
+                    columns['Time_sec'].append(float(stream['end']))
+                    columns['Retx_pkts'].append(float(stream.get('retransmits', math.nan)))
+                    columns['Cwnd_MBytes'].append(stream.get('snd_cwnd', math.nan) / (1024 * 1024))
+                    columns['Throughput_Mbps'].append(stream['bits_per_second'] / 1e6)
+                    columns['Bytes'].append(stream['bytes'])
+                    columns['Rtt_ms'].append(stream.get('rtt', math.nan) / 1000)
+                    columns['Rttvar_ms'].append(stream.get('rttvar', math.nan) / 1000)
+            elif event == 'error':
+                print(f"iperf3 reported an error in {file_name}: {data}")
+    return columns
+
+def parse_iperf_output(file_name):
+    # Parses an iperf3 client output in any of the formats we store
+    with open(file_name, 'r') as f:
+        is_json = f.read(64).lstrip().startswith('{')
+    return parse_iperf_json(file_name) if is_json else parse_iperf_file(file_name)
+
+def merge_columns(parts):
+    # Concatenates the column lists of several files. The JSON-only columns are kept if any file has them and
+    # filled with NaN for rows parsed from text.
+    names = IPERF_COLUMNS + [name for name in JSON_COLUMNS if any(name in part for part in parts)]
+    columns = {name: [] for name in names}
+    for part in parts:
+        rows = len(part['Time_sec'])
+        for name in names:
+            columns[name].extend(part.get(name, [math.nan] * rows))
+    return columns
+
+def iperf_files(directory):
+    return [file for file in os.listdir(directory) if file.startswith("iperf_") and file.endswith(IPERF_SUFFIXES)]
+
+def totals(df):
+    # Average throughput and total retransmissions per port, and their sums for the sender
+    totals_per_port = df.groupby('src_port').agg(
+        average_throughput_mbps=('Throughput_Mbps', 'mean'),
+        total_retransmissions=('Retx_pkts', 'sum')
+    ).reset_index()
+    totals_per_sender = pd.DataFrame({
+        'average_throughput_gbps': [totals_per_port['average_throughput_mbps'].sum() / 1000],
+        'total_retransmissions': [totals_per_port['total_retransmissions'].sum()],
+    })
+    return totals_per_port, totals_per_sender
+
+def parse_iperf_files(file_names, processes=1):
+    # Parses several iperf3 outputs and merges their columns in the order of file_names. With processes > 1
+    # the files are parsed in a process pool; the result is identical to parsing them one after another.
+    processes = min(processes, len(file_names))
+    if processes > 1:
+        with Pool(processes=processes) as pool:
+            parts = pool.map(parse_iperf_output, file_names)
     else:
-        # Calculate average throughput and total retransmissions per port
-        totals_per_port = df.groupby('src_port').agg(
-            average_throughput_mbps=('Throughput_Mbps', 'mean'),
-            total_retransmissions=('Retx_pkts', 'sum')
-        ).reset_index()
-        print("Totals per port head:")
-        print(totals_per_port.head())
-
-        # Calculate total average throughput and retransmissions per sender
-        total_average_throughput_mbps = totals_per_port['average_throughput_mbps'].sum()
-        total_throughput_gbps = total_average_throughput_mbps / 1000
-        total_retransmissions = totals_per_port['total_retransmissions'].sum()
-
-        # Save the totals per port to a CSV file
-        totals_per_port.to_csv(os.path.join(directory, 'iperf_totals_per_port.csv'), index=False, columns=['src_port', 'average_throughput_mbps', 'total_retransmissions'])
-        print("Saved the totals per port data to iperf_totals_per_port.csv")
-
-        # Save the totals per sender to a CSV file
-        with open(os.path.join(directory, 'iperf_totals_per_sender.csv'), 'w') as f:
+        parts = [parse_iperf_output(file_name) for file_name in file_names]
+    return merge_columns(parts)
+
+def process_iperf_directory(directory, save=True, processes=1):
+    # Parses the iperf3 client outputs of a run directory, using `processes` worker processes. Returns
+    # (iperf_data, totals_per_port, totals_per_sender) as DataFrames; iperf_data is None when there is no
+    # interval data and the totals are None when the run has no duration. With save=True they are also written
+    # to iperf_data.csv, iperf_totals_per_port.csv and iperf_totals_per_sender.csv in the directory.
+    if not os.path.isdir(directory):
+        raise NotADirectoryError(f"{directory} is not a valid directory.")
+
+    columns = parse_iperf_files([os.path.join(directory, filename) for filename in iperf_files(directory)], processes)
+    if not columns['Time_sec']:
+        return None, None, None
+
+    # Build the DataFrame once from the accumulated columns
+    df = pd.DataFrame(columns)
+    if save:
+        write_csv(df, os.path.join(directory, 'iperf_data.csv'), index=False)
+    if df['Time_sec'].max() == 0:
+        return df, None, None
+
+    totals_per_port, totals_per_sender = totals(df)
+    if save:
+        write_csv(totals_per_port, os.path.join(directory, 'iperf_totals_per_port.csv'), index=False, columns=['src_port', 'average_throughput_mbps', 'total_retransmissions'])
+        with atomic_write(os.path.join(directory, 'iperf_totals_per_sender.csv')) as f:
             f.write("average_throughput_gbps,total_retransmissions\n")
-            f.write(f"{total_throughput_gbps},{total_retransmissions}\n")
-        print("Saved the totals per sender data to iperf_totals_per_sender.csv")
+            f.write(f"{totals_per_sender['average_throughput_gbps'].iloc[0]},{totals_per_sender['total_retransmissions'].iloc[0]}\n")
+    return df, totals_per_port, totals_per_sender
+
+def iperf_stage(directory):
+    # Record file and fingerprint of the iperf CSVs of a run directory: the iperf outputs it holds and this code
+    inputs = [os.path.join(directory, name) for name in sorted(iperf_files(directory))]
+    return (build_cache.stage_record(directory, 'process_iperf'),
+            build_cache.stage_fingerprint(inputs, build_cache.code_version(__file__)))
+
+def read_iperf_data(file_name):
+    # Reads iperf_data.csv back as process_iperf_directory returned it (ports as strings, floats exact)
+    return pd.read_csv(file_name, dtype={'src_port': str, 'dst_port': str}, float_precision='round_trip')
+
+def update_iperf_directory(directory, processes=1, force=False):
+    # process_iperf_directory as a cached stage: the iperf outputs are only parsed, and the CSVs only rewritten,
+    # when the outputs (or this code) changed since the CSVs were written or one of the CSVs is gone. This keeps
+    # the mtimes of the totals read by parser.py. Returns iperf_data (None when there is no interval data), read
+    # back from iperf_data.csv when it is up to date.
+    if not os.path.isdir(directory):
+        raise NotADirectoryError(f"{directory} is not a valid directory.")
+    record_file, fingerprint = iperf_stage(directory)
+    data_file = os.path.join(directory, 'iperf_data.csv')
+    if not force and build_cache.is_fresh(record_file, fingerprint):
+        return read_iperf_data(data_file) if os.path.exists(data_file) else None
+
+    df, totals_per_port, _ = process_iperf_directory(directory, processes=processes)
+    written = 0 if df is None else 1 if totals_per_port is None else len(IPERF_CSV_FILES)
+    outputs = [os.path.join(directory, name) for name in IPERF_CSV_FILES]
+    # CSVs of earlier outputs that this run did not write (no interval data or no duration) are removed
+    for output in outputs[written:]:
+        if os.path.exists(output):
+            os.remove(output)
+    build_cache.save_record(record_file, fingerprint, outputs[:written])
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse the iperf3 client outputs of a run directory into iperf_data.csv and the throughput totals")
+    parser.add_argument("directory", type=str, help="Run directory containing the iperf_<port>.out/.json files")
+    parser.add_argument("--processes", type=int, default=max(1, cpu_count() // 2),
+                        help="Worker processes parsing the files in parallel (1 parses them serially)")
+    args = parser.parse_args()
+
+    directory = args.directory
+    try:
+        df, totals_per_port, totals_per_sender = process_iperf_directory(directory, processes=args.processes)
+    except NotADirectoryError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if df is None:
+        print("No valid data to process.")
+    else:
+        print("DataFrame head:")
+        print(df.head())
+        print("Saved the detailed data to iperf_data.csv")
+        print(f"Total time (sec): {df['Time_sec'].max()}")
+        if totals_per_port is None:
+            print("Debug: Total time is zero. Skipping throughput calculation.")
+        else:
+            print("Totals per port head:")
+            print(totals_per_port.head())
+            print("Saved the totals per port data to iperf_totals_per_port.csv")
+            print("Saved the totals per sender data to iperf_totals_per_sender.csv")
 
-else:
-    print("No valid data to process.")
+    print("Script execution completed.")
 
-print("Script execution completed.")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+
+def counter_deltas(values, initial=None, modulus=None):
+    # Per-sample increments of a cumulative counter (sent, dropped, overlimits, requeues, marks, ...).
+    # The first increment is taken against `initial`, or is 0 when initial is None. A decrease means the
+    # counter was reset (qdisc replaced or re-created), and the increment is the new value itself; with a modulus
+    # (e.g. 2**32 for the u32 qdisc counters) a decrease is treated as a wrap-around instead.
+    # NaN samples give NaN increments for themselves and the following sample.
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values.copy()
+    previous = np.empty_like(values)
+    previous[0] = values[0] if initial is None else initial
+    previous[1:] = values[:-1]
+    deltas = values - previous
+    resets = deltas < 0
+    if resets.any():
+        deltas[resets] = deltas[resets] + modulus if modulus is not None else values[resets]
+    return deltas
+
+
+def counter_rates(times, values, initial=None, modulus=None):
+    # Per-second rates of a cumulative counter sampled at `times` (seconds): each increment divided by the time
+    # since the previous sample. The first sample has no interval and gets NaN.
+    times = np.asarray(times, dtype=np.float64)
+    deltas = counter_deltas(values, initial, modulus)
+    intervals = np.empty_like(times)
+    intervals[:1] = np.nan
+    intervals[1:] = np.diff(times)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = deltas / intervals
+    rates[~(intervals > 0)] = np.nan
+    return rates
+
+
+def counter_frame(df, time_column, counters, initial=None, modulus=None, rates=False):
+    # DataFrame of the increments of the cumulative counter columns of df next to time_column, with a
+    # <counter>_per_sec column for each counter when rates is set
+    times = df[time_column].to_numpy(dtype=np.float64)
+    frame = {time_column: times}
+    for counter in counters:
+        values = df[counter].to_numpy(dtype=np.float64)
+        frame[counter] = counter_deltas(values, initial, modulus)
+        if rates:
+            frame[f'{counter}_per_sec'] = counter_rates(times, values, initial, modulus)
+    return pd.DataFrame(frame)
+
+
+def bucket_index(times, width, start=0):
+    # Index k of the time bucket (start + (k - 1) * width, start + k * width] of each time; times at or before
+    # start fall into bucket 0
+    buckets = np.ceil((np.asarray(times, dtype=np.float64) - start) / width)
+    return np.maximum(np.nan_to_num(buckets, nan=-1), 0).astype(np.int64)
+
+
+def bucket_values(times, values=None, width=1, how='sum', start=0, buckets=None):
+    # Aggregates values into consecutive time buckets of `width` seconds with np.bincount. how is 'sum', 'mean'
+    # or 'count' (values may be omitted for 'count'). Returns (labels, aggregates) for buckets 0 .. buckets - 1,
+    # by default up to the bucket of the last time, where the label of bucket k is its end, start + k * width.
+    # Buckets without samples are 0 for sum and count and NaN for mean; NaN values and times are ignored.
+    times = np.asarray(times, dtype=np.float64)
+    valid = ~np.isnan(times)
+    if values is not None:
+        values = np.asarray(values)
+        valid &= ~pd.isna(values)
+    index = bucket_index(times[valid], width, start)
+    if buckets is None:
+        buckets = int(index.max()) + 1 if len(index) else 1
+    inside = index < buckets
+    index = index[inside]
+    labels = start + np.arange(buckets) * width
+
+    counts = np.bincount(index, minlength=buckets)
+    if how == 'count':
+        return labels, counts
+    weights = values[valid][inside]
+    sums = np.bincount(index, weights=weights.astype(np.float64), minlength=buckets)
+    if how == 'sum':
+        return labels, sums.astype(weights.dtype) if np.issubdtype(weights.dtype, np.integer) else sums
+    if how == 'mean':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return labels, np.where(counts > 0, sums / counts, np.nan)
+    raise ValueError(f"Unknown aggregation: {how}")
+
+
+def bucket_frame(df, time_column, value_columns, width=1, how='sum', by=None, label='interval_sec', start=0):
+    # Buckets the value columns of df by time_column, per group of the `by` columns (e.g. a flow's
+    # ['dst_port', 'src_port']) when given. Every group gets the same buckets, from 0 to the last bucket of the
+    # whole frame, so groups without samples in a bucket still have a row for it.
+    times = df[time_column].to_numpy(dtype=np.float64)
+    valid_times = times[~np.isnan(times)]
+    buckets = int(bucket_index(valid_times, width, start).max()) + 1 if len(valid_times) else 1
+    if by is None:
+        frame = {}
+        for column in value_columns:
+            frame[label], frame[column] = bucket_values(times, df[column].to_numpy(), width, how, start, buckets)
+        return pd.DataFrame(frame, columns=[label] + list(value_columns))
+
+    # One bincount over group * buckets + bucket covers all groups at once
+    codes, groups = pd.factorize(pd.MultiIndex.from_frame(df[list(by)]) if len(by) > 1 else df[by[0]], sort=True)
+    valid = (codes >= 0) & ~np.isnan(times)
+    index = np.full(len(times), np.nan)
+    index[valid] = codes[valid] * buckets + bucket_index(times[valid], width, start)
+    frame = {}
+    for column in value_columns:
+        # Times are replaced by the combined index, so bucket_values sees one bucket of width 1 per (group, bucket)
+        _, frame[column] = bucket_values(index, df[column].to_numpy(), 1, how, 0, len(groups) * buckets)
+    keys = pd.DataFrame(list(groups), columns=list(by)) if len(by) > 1 else pd.DataFrame({by[0]: groups})
+    result = keys.loc[keys.index.repeat(buckets)].reset_index(drop=True)
+    result[label] = np.tile(start + np.arange(buckets) * width, len(groups))
+    for column in value_columns:
+        result[column] = frame[column]
+    return result
+
+
+def minmax_decimate(x, y, bins):
+    # Reduces the series (x, y) to the minimum and maximum of each of `bins` equal-width x bins, plus the first and
+    # last points: drawn at one bin per pixel column, the envelope (and every spike) looks the same as the full
+    # series. Points stay in x order. NaN y values break lines, so the first NaN of each bin is kept as well.
+    # Returns (x, y) unchanged when there are no more than 2 * bins + 2 points.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= 2 * bins + 2:
+        return x, y
+    if np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+    span = x[-1] - x[0]
+    index = np.zeros(len(x), dtype=np.int64) if not span > 0 else \
+        np.minimum(((x - x[0]) / span * bins).astype(np.int64), bins - 1)
+
+    # Bins are contiguous runs of points, as x is sorted; the first point of a bin equal to its minimum (maximum)
+    # is kept. NaN never compares equal, so bins of only NaN values keep no extremes.
+    segment = np.cumsum(np.r_[False, index[1:] != index[:-1]])
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    selected = [[0, len(x) - 1]]
+    for reduce, fill in ((np.minimum, np.inf), (np.maximum, -np.inf)):
+        extremes = reduce.reduceat(np.where(np.isnan(y), fill, y), starts)
+        hits = np.flatnonzero(y == extremes[segment])
+        selected.append(hits[np.unique(segment[hits], return_index=True)[1]])
+    gaps = np.flatnonzero(np.isnan(y))
+    if len(gaps):
+        selected.append(gaps[np.unique(index[gaps], return_index=True)[1]])
+    keep = np.unique(np.concatenate(selected))
+    return x[keep], y[keep]
+
+
+def lttb_decimate(x, y, points):
+    # Largest-Triangle-Three-Buckets downsampling of (x, y) to `points` points: the first and last points plus, for
+    # each of points - 2 buckets, the point forming the largest triangle with the previously selected point and
+    # the mean of the next bucket. Keeps the visual shape with fewer points than minmax_decimate, but a bucket can
+    # drop a spike next to a larger one. NaN points are dropped.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[finite], y[finite]
+    if points < 3 or len(x) <= points:
+        return x, y
+    if np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+
+    edges = np.linspace(1, len(x) - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, len(x) - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2] if bucket + 2 < len(edges) else len(x)
+        next_x = x[next_start:max(next_end, next_start + 1)].mean()
+        next_y = y[next_start:max(next_end, next_start + 1)].mean()
+        # Twice the area of the triangle (previous, candidate, next bucket mean) for every candidate of the bucket
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return x[keep], y[keep]
+
+
+DECIMATORS = {'minmax': minmax_decimate, 'lttb': lambda x, y, bins: lttb_decimate(x, y, 2 * bins)}
+
+
+def decimate(x, y, bins, how='minmax'):
+    # Downsamples a series to about 2 * bins points (one bin per pixel column) with min/max envelopes or LTTB
+    return DECIMATORS[how](x, y, bins)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts import their sibling modules by name, as when they are run from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('FABRIC_scripts', 'post_processing'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
@@ -0,0 +1,111 @@
+import random
+import socket
+import struct
+
+# Small writer of synthetic captures for the pcap tests: IPv4/TCP frames over the link types tcpdump produces,
+# written as classic pcap (microsecond or nanosecond, either byte order) or pcapng
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+TCP_FLAGS = {'F': 0x01, 'S': 0x02, 'R': 0x04, 'P': 0x08, 'A': 0x10, 'U': 0x20, 'E': 0x40, 'C': 0x80, 'N': 0x100}
+
+
+def tcp_flags(letters):
+    return sum(TCP_FLAGS[letter] for letter in letters)
+
+
+def ipv4_tcp(src, dst, sport, dport, seq, ack, flags, window=65535, payload=b'', options=b'', fragment=0):
+    options += b'\0' * (-len(options) % 4)
+    tcp = struct.pack('!HHIIHHHH', sport, dport, seq, ack, (((20 + len(options)) // 4) << 12) | flags, window, 0, 0) + options
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp) + len(payload), 0, fragment, 64, socket.IPPROTO_TCP, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return ip + tcp + payload
+
+
+def ipv4_udp(src, dst, sport, dport, payload=b''):
+    udp = struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, socket.IPPROTO_UDP, 0,
+                       socket.inet_aton(src), socket.inet_aton(dst)) + udp
+
+
+def ethernet(packet, vlans=(), ethertype=0x0800):
+    header = b'\x02\0\0\0\0\x02' + b'\x02\0\0\0\0\x01'
+    for vlan in vlans:
+        header += struct.pack('!HH', 0x8100, vlan)
+    return header + struct.pack('!H', ethertype) + packet
+
+
+def linux_sll(packet):
+    return struct.pack('!HHH8sH', 0, 1, 6, b'\x02\0\0\0\0\x01\0\0', 0x0800) + packet
+
+
+def frame(linktype, packet, vlans=()):
+    if linktype == LINKTYPE_ETHERNET:
+        return ethernet(packet, vlans)
+    if linktype == LINKTYPE_LINUX_SLL:
+        return linux_sll(packet)
+    return packet
+
+
+def write_pcap(path, records, linktype=LINKTYPE_ETHERNET, nano=False, endian='<', truncate_last=0):
+    # records: (ts_ns, frame bytes[, wire length]); truncate_last cuts bytes off the end of the file, as a capture
+    # interrupted in the middle of a record
+    data = struct.pack(endian + 'IHHiIII', 0xA1B23C4D if nano else 0xA1B2C3D4, 2, 4, 0, 0, 262144, linktype)
+    for record in records:
+        ts_ns, payload = record[:2]
+        wirelen = record[2] if len(record) > 2 else len(payload)
+        fraction = ts_ns % 1000000000 if nano else (ts_ns % 1000000000) // 1000
+        data += struct.pack(endian + 'IIII', ts_ns // 1000000000, fraction, len(payload), wirelen) + payload
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) - truncate_last])
+
+
+def _pcapng_block(block_type, body):
+    body += b'\0' * (-len(body) % 4)
+    length = 12 + len(body)
+    return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+
+def write_pcapng(path, records, linktype=LINKTYPE_ETHERNET, tsresol=9):
+    # One section and interface with if_tsresol = 10^-tsresol, records as enhanced packet blocks
+    units = 10 ** (9 - tsresol)
+    data = _pcapng_block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+    data += _pcapng_block(1, struct.pack('<HHI', linktype, 0, 262144) + struct.pack('<HHB3x', 9, 1, tsresol) + b'\0' * 4)
+    for record in records:
+        ts_ns, payload = record[:2]
+        wirelen = record[2] if len(record) > 2 else len(payload)
+        ts = ts_ns // units
+        data += _pcapng_block(6, struct.pack('<IIIII', 0, ts >> 32, ts & 0xFFFFFFFF, len(payload), wirelen) + payload)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def sample_packets(count=500, seed=1, start_ns=1700000000 * 1000000000):
+    # A reproducible mix of IPv4 packets between two hosts: TCP segments of several flows in both directions with
+    # assorted flags, options and payloads, plus some UDP datagrams and non-first IP fragments that decoders skip.
+    # Returns (ts_ns, IP packet, is_tcp) tuples in capture order.
+    rng = random.Random(seed)
+    packets = []
+    ts_ns = start_ns
+    sequence = {}
+    for _ in range(count):
+        ts_ns += rng.randrange(1, 500000)
+        sport, dport = 40000 + rng.randrange(4), 15611 + rng.randrange(2)
+        kind = rng.random()
+        if kind < 0.03:
+            packets.append((ts_ns, ipv4_udp('10.0.0.1', '10.0.1.1', 5000, 5001, b'abc'), False))
+        elif kind < 0.05:
+            packets.append((ts_ns, ipv4_tcp('10.0.0.1', '10.0.1.1', sport, dport, 1, 0, 0x10, payload=b'y' * 40, fragment=10), False))
+        elif kind < 0.55:
+            seq = sequence.get((sport, dport), rng.randrange(1 << 32))
+            payload = b'x' * rng.choice([0, 0, 100, 1448])
+            flags = tcp_flags(rng.choice(['PA', 'A', 'PA', 'SA', 'FA', 'PAE', 'PAC', 'AEC', 'S', 'R']))
+            packets.append((ts_ns, ipv4_tcp('10.0.0.1', '10.0.1.1', sport, dport, seq, 555, flags, rng.randrange(65536), payload), True))
+            sequence[(sport, dport)] = (seq + len(payload)) & 0xFFFFFFFF
+        else:
+            options = b'\x01\x01\x08\x0a' + struct.pack('!II', 1, 2)
+            packets.append((ts_ns, ipv4_tcp('10.0.1.1', '10.0.0.1', dport, sport, 777, sequence.get((sport, dport), 0),
+                                            tcp_flags('A'), 500, options=options), True))
+    return packets
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import tc_netlink
+
+# Records the fixtures of test_tc_netlink.py: the raw rtnetlink replies to one QdiscSampler dump of an interface,
+# and `tc -s qdisc show` of the same interface taken right after. Counters must not move in between, so stop the
+# traffic and let the queues drain first. The committed fixtures were recorded as root on two ifb devices with
+#   tc qdisc replace dev ifb0 root handle 1: tbf rate 10mbit burst 32kbit latency 50ms
+#   tc qdisc add dev ifb0 parent 1:1 handle 10: pfifo limit 20
+#   tc qdisc replace dev ifb1 root handle 1: tbf rate 10mbit burst 32kbit latency 50ms
+# and UDP traffic to 127.0.0.1 redirected from the ingress of lo to them (mirred egress redirect dev ifb0/ifb1).
+# Usage: python tests/record_qdisc_fixtures.py <interface> [<fixture directory>]
+
+
+class RecordingSocket:
+    # Passes calls through to the netlink socket and keeps every reply as received
+    def __init__(self, sock):
+        self.sock = sock
+        self.replies = []
+
+    def send(self, data):
+        return self.sock.send(data)
+
+    def recv_into(self, buffer):
+        size = self.sock.recv_into(buffer)
+        self.replies.append(bytes(buffer[:size]))
+        return size
+
+    def close(self):
+        self.sock.close()
+
+
+def record(interface, directory):
+    with tc_netlink.QdiscSampler(interface) as sampler:
+        sampler.sock = RecordingSocket(sampler.sock)
+        sampler.sample()
+        replies = sampler.sock.replies
+    output = subprocess.check_output(["tc", "-s", "qdisc", "show", "dev", interface], universal_newlines=True)
+    with open(os.path.join(directory, f'qdisc_{interface}.json'), 'w') as f:
+        json.dump({'interface': interface, 'ifindex': sampler.ifindex, 'replies': [reply.hex() for reply in replies]}, f, indent=1)
+    with open(os.path.join(directory, f'qdisc_{interface}.txt'), 'w') as f:
+        f.write(output)
+
+
+if __name__ == '__main__':
+    record(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(__file__), 'fixtures'))
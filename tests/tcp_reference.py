@@ -0,0 +1,135 @@
+import os
+import sys
+
+from pcap_builder import LINKTYPE_ETHERNET, frame, ipv4_tcp, tcp_flags, write_pcap
+
+# Reference capture for the TCP tracker: short conversations that each exercise one tcp.analysis heuristic.
+# Every packet is annotated with what the tracker should report for it, and the same capture is what
+# check_tcp_analysis.py compares against tshark. Regenerate the committed copy with
+#   python tests/tcp_reference.py tests/fixtures/tcp_reference.pcap
+
+MS = 1000000
+START_NS = 1700000000 * 1000000000
+MSS = 1448
+
+CLIENT = '10.0.0.1'
+SERVER = '10.0.1.1'
+
+
+class Packet:
+    __slots__ = ('ts_ns', 'data', 'scenario', 'retransmission', 'rtt_ms')
+
+    def __init__(self, ts_ns, data, scenario, retransmission, rtt_ms):
+        self.ts_ns = ts_ns
+        self.data = data
+        self.scenario = scenario
+        self.retransmission = retransmission
+        self.rtt_ms = rtt_ms
+
+
+class Connection:
+    # Builds the packets of one connection; seq/ack are tracked per side so a scenario only states what it sends
+    def __init__(self, packets, scenario, sport, dport, client_isn, server_isn, start_ms):
+        self.packets = packets
+        self.scenario = scenario
+        self.ports = {'client': (sport, dport), 'server': (dport, sport)}
+        self.addresses = {'client': (CLIENT, SERVER), 'server': (SERVER, CLIENT)}
+        self.next = {'client': client_isn, 'server': server_isn}
+        self.start_ms = start_ms
+
+    def send(self, side, at_ms, flags='A', length=0, seq=None, ack=None, retransmission=False, rtt_ms=None, window=65535):
+        other = 'server' if side == 'client' else 'client'
+        seq = self.next[side] if seq is None else seq
+        ack = self.next[other] if ack is None else ack
+        src, dst = self.addresses[side]
+        sport, dport = self.ports[side]
+        data = ipv4_tcp(src, dst, sport, dport, seq & 0xFFFFFFFF, ack & 0xFFFFFFFF, tcp_flags(flags), window, b'x' * length)
+        self.packets.append(Packet(START_NS + round((self.start_ms + at_ms) * MS), data, self.scenario, retransmission, rtt_ms))
+        end = seq + length + (1 if 'S' in flags or 'F' in flags else 0)
+        self.next[side] = max(self.next[side], end)
+        return seq
+
+    def handshake(self, rtt_ms=20):
+        self.send('client', 0, 'S')
+        self.send('server', rtt_ms / 2, 'SA', rtt_ms=rtt_ms / 2)
+        self.send('client', rtt_ms, 'A', rtt_ms=rtt_ms / 2)
+
+
+def reference_packets():
+    # Packets of all scenarios in capture order
+    packets = []
+
+    # In-order data, each segment acknowledged separately: one ACK RTT per segment, no retransmissions
+    c = Connection(packets, 'in_order', 40000, 5201, 1000, 5000, 0)
+    c.handshake()
+    for index in range(3):
+        c.send('client', 30 + index, 'PA', MSS)
+    for index in range(3):
+        c.send('server', 45 + index, ack=1001 + (index + 1) * MSS, rtt_ms=15)
+
+    # A segment resent after a timeout is a retransmission; the ACK of the resent data gives the RTT of the
+    # segment that ends at the acknowledged sequence number
+    c = Connection(packets, 'timeout', 40001, 5201, 20000, 9000, 5)
+    c.handshake()
+    first = c.send('client', 30, 'PA', MSS)
+    c.send('client', 31, 'PA', MSS)
+    c.send('client', 300, 'PA', MSS, seq=first, retransmission=True)
+    c.send('server', 310, rtt_ms=279)
+
+    # Three duplicate ACKs for a lost segment, then its fast retransmission within 20 ms of the last one
+    c = Connection(packets, 'fast_retransmission', 40002, 5201, 30000, 9000, 10)
+    c.handshake()
+    lost = None
+    for index in range(4):
+        seq = c.send('client', 30 + index, 'PA', MSS)
+        lost = seq if index == 1 else lost
+    c.send('server', 45, ack=lost, rtt_ms=15)
+    for index in range(3):
+        c.send('server', 46 + index, ack=lost)
+    c.send('client', 50, 'PA', MSS, seq=lost, retransmission=True)
+    c.send('server', 62, rtt_ms=29)
+
+    # Two segments arriving swapped within the handshake RTT are out of order, not a retransmission
+    c = Connection(packets, 'out_of_order', 40003, 5201, 40000, 9000, 15)
+    c.handshake()
+    base = c.next['client']
+    c.send('client', 30, 'PA', MSS, seq=base + MSS)
+    c.send('client', 31, 'PA', MSS, seq=base)
+    c.send('server', 45, ack=base + 2 * MSS, rtt_ms=15)
+
+    # A keep-alive (one byte below the next sequence number) is not a retransmission
+    c = Connection(packets, 'keep_alive', 40004, 5201, 50000, 9000, 20)
+    c.handshake()
+    c.send('client', 30, 'PA', MSS)
+    c.send('server', 45, rtt_ms=15)
+    c.send('client', 1000, 'A', 1, seq=c.next['client'] - 1)
+    c.send('server', 1010)
+
+    # Resending data the receiver already acknowledged is a spurious retransmission, which tshark reports separately
+    c = Connection(packets, 'spurious', 40005, 5201, 60000, 9000, 25)
+    c.handshake()
+    first = c.send('client', 30, 'PA', MSS)
+    c.send('server', 45, rtt_ms=15)
+    c.send('client', 300, 'PA', MSS, seq=first)
+    c.send('server', 310)
+
+    # Sequence numbers that wrap around 2^32 in the middle of the data, then a FIN exchange
+    c = Connection(packets, 'wraparound', 40006, 5201, (1 << 32) - 2000, 9000, 30)
+    c.handshake()
+    for index in range(3):
+        c.send('client', 30 + index, 'PA', MSS)
+    c.send('server', 45, rtt_ms=13)
+    c.send('client', 50, 'FA')
+    c.send('server', 60, 'FA', rtt_ms=10)
+    c.send('client', 70, rtt_ms=10)
+
+    packets.sort(key=lambda packet: packet.ts_ns)
+    return packets
+
+
+def write_reference_capture(path):
+    write_pcap(path, [(packet.ts_ns, frame(LINKTYPE_ETHERNET, packet.data)) for packet in reference_packets()], nano=True)
+
+
+if __name__ == '__main__':
+    write_reference_capture(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'fixtures', 'tcp_reference.pcap'))
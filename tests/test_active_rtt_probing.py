@@ -0,0 +1,94 @@
+import csv
+import io
+import select
+import socket
+import time
+
+import pytest
+
+import active_rtt_probing
+
+
+def loopback_prober():
+    try:
+        return active_rtt_probing.IcmpProber('127.0.0.1')
+    except OSError as e:
+        pytest.skip(f"no ICMP socket: {e}")
+
+
+def probe(prober, count):
+    # Sends `count` probes and returns the (seq, rtt_ns) of their replies
+    replies = []
+    for seq in range(count):
+        prober.send(seq)
+    deadline = time.monotonic() + 2
+    while len(replies) < count and time.monotonic() < deadline:
+        select.select([prober], [], [], 0.1)
+        replies += prober.receive()
+    return replies
+
+
+def test_kernel_timestamps_on_both_ends():
+    with loopback_prober() as prober:
+        if not prober.kernel_timestamps:
+            pytest.skip("SO_TIMESTAMPING is not supported")
+        prober.send(70000)
+        time.sleep(0.05)
+        prober.read_send_timestamps()
+        send_ns, sched_ns, snd_ns, tskey = prober.sent[70000 & 0xFFFF]
+        assert tskey == 0 and prober.next_tskey == 1
+        assert send_ns <= sched_ns <= snd_ns < send_ns + 50000000
+
+        (seq, rtt_ns), = prober.receive()
+        assert seq == 70000 & 0xFFFF
+        assert 0 < rtt_ns < 50000000
+        assert prober.sent == {} and prober.tskeys == {}
+
+
+@pytest.mark.parametrize('kernel_timestamps', [True, False])
+def test_replies_are_matched_by_sequence_number(kernel_timestamps):
+    with loopback_prober() as prober:
+        if not kernel_timestamps:
+            # Userspace clock readings on both ends
+            prober.sock.setsockopt(socket.SOL_SOCKET, active_rtt_probing.SO_TIMESTAMPING, 0)
+            prober.kernel_timestamps = False
+        replies = probe(prober, 5)
+        assert sorted(seq for seq, _ in replies) == list(range(5))
+        assert all(0 < rtt_ns < 100000000 for _, rtt_ns in replies)
+        assert prober.sent == {} and prober.tskeys == {}
+
+
+class FakeProber:
+    dst_ip = '10.0.0.2'
+
+    def __init__(self):
+        self.replies = []
+        self.forgotten = []
+
+    def send(self, seq):
+        return 1700000000 * 1000000000 + seq * 1000000
+
+    def receive(self):
+        replies, self.replies = self.replies, []
+        return replies
+
+    def forget(self, seq):
+        self.forgotten.append(seq)
+
+
+def test_rows_are_written_in_send_order_with_losses():
+    prober = FakeProber()
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=active_rtt_probing.FIELDNAMES)
+    target = active_rtt_probing.ProbeTarget(prober, '10.0.0.1', writer, 1700000000.0)
+    for _ in range(3):
+        target.send()
+    prober.replies = [(2, 1500000), (0, 2345678)]
+    target.on_readable()
+    assert output.getvalue().count('\n') == 1  # Probe 1 holds up probe 2 until it is answered or times out
+
+    target.flush(time.monotonic_ns() + 2 * 1000000000)
+    rows = list(csv.DictReader(io.StringIO(output.getvalue()), fieldnames=active_rtt_probing.FIELDNAMES))
+    assert [(row['seq'], row['rtt_ms'], row['lost']) for row in rows] == [('0', '2.346', '0'), ('1', '', '1'), ('2', '1.5', '0')]
+    assert rows[1]['time_stamp'] == '0.001'
+    assert prober.forgotten == [1] and target.lost == 1
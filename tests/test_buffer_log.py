@@ -0,0 +1,78 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+import buffer_log
+import qdisc_stats
+
+FIELDS = qdisc_stats.buffer_status_fields('red')
+MIN_TIMESTAMP = 1700000000.25
+MIN_MONOTONIC_NS = 5 * 10 ** 9
+
+
+def samples(count):
+    # (original_timestamp, monotonic_ns, buffer_status) of a sampler taking one sample per millisecond
+    for index in range(count):
+        status = {field: index * 7 + position for position, field in enumerate(FIELDS[2:])}
+        yield MIN_TIMESTAMP + index / 1000, MIN_MONOTONIC_NS + index * 1000000 + 123, status
+
+
+def write_log(log_file, count, **options):
+    with buffer_log.BufferStatusLog(log_file, FIELDS, MIN_TIMESTAMP, MIN_MONOTONIC_NS, batch_records=16, **options) as log:
+        for sample in samples(count):
+            log.append(*sample)
+    return log
+
+
+@pytest.mark.parametrize('count', [0, 1, 16, 40])
+def test_log_round_trip(tmp_path, count):
+    log_file = str(tmp_path / 'buffer.bin')
+    assert write_log(log_file, count, expected_records=100).records == count
+    header, records = buffer_log.read_log(log_file)
+    assert header == {'fields': FIELDS, 'min_timestamp': MIN_TIMESTAMP, 'min_monotonic_ns': MIN_MONOTONIC_NS}
+    assert len(records) == count
+    for record, (original_timestamp, monotonic_ns, status) in zip(records, samples(count)):
+        assert record['original_timestamp'] == original_timestamp and record['monotonic_ns'] == monotonic_ns
+        assert {name: int(record[name]) for name in status} == status
+
+    csv_file = str(tmp_path / 'buffer.csv')
+    assert buffer_log.log_to_csv(log_file, csv_file) == count
+    with open(csv_file, newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == FIELDS
+    for row, (original_timestamp, monotonic_ns, status) in zip(rows[1:], samples(count)):
+        assert float(row[0]) == original_timestamp
+        assert row[1] == "{:.3f}".format((monotonic_ns - MIN_MONOTONIC_NS) / 1e9)
+        assert [int(value) for value in row[2:]] == list(status.values())
+
+
+def test_log_of_a_killed_sampler(tmp_path):
+    # Flushed batches survive; preallocated zeros and a partial record at the end are dropped
+    log_file = str(tmp_path / 'buffer.bin')
+    log = buffer_log.BufferStatusLog(log_file, FIELDS, MIN_TIMESTAMP, MIN_MONOTONIC_NS, expected_records=100, batch_records=16)
+    for sample in samples(20):
+        log.append(*sample)
+    log.file.close()
+    assert len(buffer_log.read_log(log_file)[1]) == 16
+    with open(log_file, 'r+b') as f:
+        f.truncate(log.data_offset + 16 * log.dtype.itemsize + 5)
+    np.testing.assert_array_equal(buffer_log.read_log(log_file)[1]['monotonic_ns'],
+                                  [monotonic_ns for _, monotonic_ns, _ in samples(16)])
+
+
+def test_convert_logs(tmp_path):
+    logs = [buffer_log.BufferStatusLog(str(tmp_path / f'{name}.bin'), FIELDS, MIN_TIMESTAMP, MIN_MONOTONIC_NS)
+            for name in ('busy', 'idle')]
+    for sample in samples(3):
+        logs[0].append(*sample)
+    buffer_log.convert_logs(logs, write_empty=False)
+    assert sorted(os.listdir(tmp_path)) == ['busy.csv']
+
+
+def test_rejects_other_files(tmp_path):
+    other = tmp_path / 'other.bin'
+    other.write_bytes(b'not a log')
+    with pytest.raises(ValueError):
+        buffer_log.read_log(str(other))
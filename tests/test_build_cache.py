@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import build_cache
+
+
+def test_stage_is_fresh_until_an_input_or_output_changes(tmp_path):
+    source, output = tmp_path / 'input.csv', tmp_path / 'output.csv'
+    source.write_text("a\n1\n")
+    output.write_text("b\n2\n")
+    record_file = build_cache.stage_record(str(tmp_path), 'stage')
+    fingerprint = build_cache.stage_fingerprint([str(source)], 'code-1', option=1)
+    assert not build_cache.is_fresh(record_file, fingerprint)
+    build_cache.save_record(record_file, fingerprint, [str(output)])
+    assert build_cache.is_fresh(record_file, build_cache.stage_fingerprint([str(source)], 'code-1', option=1))
+
+    assert not build_cache.is_fresh(record_file, build_cache.stage_fingerprint([str(source)], 'code-2', option=1))
+    assert not build_cache.is_fresh(record_file, build_cache.stage_fingerprint([str(source)], 'code-1', option=2))
+    source.write_text("a\n1\n2\n")
+    assert not build_cache.is_fresh(record_file, build_cache.stage_fingerprint([str(source)], 'code-1', option=1))
+    build_cache.save_record(record_file, build_cache.stage_fingerprint([str(source)], 'code-1', option=1), [str(output)])
+    os.remove(output)
+    assert not build_cache.is_fresh(record_file, build_cache.stage_fingerprint([str(source)], 'code-1', option=1))
+
+
+def test_content_hash_ignores_mtime(tmp_path):
+    source = tmp_path / 'input.csv'
+    source.write_text("a\n1\n")
+    fingerprint = build_cache.stage_fingerprint([str(source)], 'code', content_hash=True)
+    os.utime(source, ns=(1, 1))
+    assert build_cache.stage_fingerprint([str(source)], 'code', content_hash=True) == fingerprint
+    assert build_cache.stage_fingerprint([str(source)], 'code') != build_cache.stage_fingerprint(
+        [str(source)], 'code', content_hash=True)
+    assert build_cache.file_fingerprint(str(tmp_path / 'missing.csv')) is None
+
+
+def test_atomic_write_keeps_the_old_file_on_errors(tmp_path):
+    output = tmp_path / 'output.csv'
+    output.write_text("old\n")
+    with pytest.raises(RuntimeError):
+        with build_cache.atomic_write(str(output)) as f:
+            f.write("partial")
+            raise RuntimeError("interrupted")
+    assert output.read_text() == "old\n" and os.listdir(tmp_path) == ['output.csv']
+    with build_cache.atomic_write(str(output)) as f:
+        f.write("new\n")
+    assert output.read_text() == "new\n"
@@ -0,0 +1,93 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import build_cache
+import frame_store
+import plot_all
+from frame_store import FrameStore
+
+pytest.importorskip('pyarrow')
+
+
+def frame():
+    return pd.DataFrame({'src_port': np.array([15611, 15611, 40002], dtype=np.int64),
+                         'time_stamp_sec': [0.0, 0.125, 1e-9], 'cwnd_bytes': [14480.0, np.nan, 28960.0],
+                         'dst_ip': ['10.0.1.1', '10.0.1.1', '10.0.2.1']})
+
+
+def test_round_trip(tmp_path):
+    source = tmp_path / 'rtt.csv'
+    source.write_text("x\n")
+    fingerprint = build_cache.stage_fingerprint([str(source)], 'code', anchor=1700000000.5)
+    store = FrameStore(str(tmp_path))
+    assert store.get('rtt', fingerprint) == (None, None)
+
+    store.put('rtt', fingerprint, frame(), {'first_timestamp': 1700000000.5})
+    store.put('retx', fingerprint, frame().iloc[:1])
+    df, info = FrameStore(str(tmp_path)).get('rtt', fingerprint)
+    pd.testing.assert_frame_equal(df, frame())
+    assert info == {'first_timestamp': 1700000000.5}
+    with open(tmp_path / frame_store.STORE_DIRECTORY / frame_store.META_FILE) as f:
+        assert {name: entry['rows'] for name, entry in json.load(f)['frames'].items()} == {'rtt': 3, 'retx': 1}
+
+    # Another anchor or a changed input make the stored frame stale
+    assert store.get('rtt', build_cache.stage_fingerprint([str(source)], 'code', anchor=1700000001.5)) == (None, None)
+    source.write_text("x\ny\n")
+    assert store.get('rtt', build_cache.stage_fingerprint([str(source)], 'code', anchor=1700000000.5)) == (None, None)
+
+
+def test_load_builds_once(tmp_path):
+    store = FrameStore(str(tmp_path))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return frame(), {'rows': 3}
+    for _ in range(2):
+        df, info = store.load('extracted_information', {'inputs': {}}, build)
+        pd.testing.assert_frame_equal(df, frame())
+        assert info == {'rows': 3}
+    assert len(builds) == 1
+
+    # Frames that could not be built are not stored
+    assert store.load('probe_rtt', {'inputs': {}}, lambda: (None, {})) == (None, {})
+    assert not os.path.exists(store.frame_file('probe_rtt'))
+
+
+def test_csv_copies(tmp_path, monkeypatch):
+    csv_file = str(tmp_path / 'sender_1_rtt.csv')
+    store = FrameStore(str(tmp_path))
+    store.write_csv(frame().set_index('src_port'), csv_file)
+    monkeypatch.setattr(frame_store.pd, 'read_csv', None)
+    pd.testing.assert_frame_equal(store.read_csv(csv_file), frame().set_index('src_port').reset_index(drop=True))
+    monkeypatch.undo()
+
+    # A CSV changed by someone else is parsed again
+    with open(csv_file, 'a') as f:
+        f.write("15612,2.0,1448.0,10.0.1.1\n")
+    assert len(store.read_csv(csv_file)) == 4
+
+
+def test_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_store, 'feather_module', lambda: None)
+    store = FrameStore(str(tmp_path))
+    store.put('rtt', {'inputs': {}}, frame())
+    assert store.get('rtt', {'inputs': {}}) == (None, None)
+    assert not os.path.exists(tmp_path / frame_store.STORE_DIRECTORY)
+
+
+def test_plot_all_frames_follow_the_anchor(tmp_path):
+    probe_file = tmp_path / 'ping_active_rtt.csv'
+    probe_file.write_text("original_time_stamp,time_stamp,src_ip,dst_ip,rtt_ms,seq,lost\n"
+                          "1700000000.25,0.0,10.0.0.1,10.0.1.1,1.5,0,0\n"
+                          "1700000000.5,0.25,10.0.0.1,10.0.2.1,2.5,0,0\n"
+                          "1700000001.25,1.0,10.0.0.1,10.0.1.1,,1,1\n")
+    store = FrameStore(str(tmp_path))
+    df = plot_all.load_probe_rtt(store, str(probe_file), 1700000000.0)
+    assert df['time_stamp'].tolist() == [0.25, 1.25]
+    pd.testing.assert_frame_equal(plot_all.load_probe_rtt(store, str(probe_file), 1700000000.0), df)
+    assert plot_all.load_probe_rtt(store, str(probe_file), 1700000001.0)['time_stamp'].tolist() == [-0.75, 0.25]
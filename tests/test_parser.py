@@ -0,0 +1,66 @@
+import builtins
+import os
+
+import parser as sweep_parser
+
+AQMS = ['fifo', 'fq_codel', 'red']
+SPEEDS = ['1gbps', '10gbps', '25gbps', '40gbps']
+PAIRS = ['bbr1_cubic', 'bbr2_cubic', 'bbr3_cubic', 'htcp_cubic', 'cubic_cubic', 'bbr1_bbr1', 'bbr2_bbr2', 'bbr3_bbr3', 'htcp_htcp']
+
+
+def write_totals(directory, throughput_gbps, retransmits, ports=(15611, 15612)):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'iperf_totals_per_sender.csv'), 'w') as f:
+        f.write(f"average_throughput_gbps,total_retransmissions\n{throughput_gbps},{retransmits}\n")
+    with open(os.path.join(directory, 'iperf_totals_per_port.csv'), 'w') as f:
+        f.write("src_port,average_throughput_mbps,total_retransmissions\n")
+        for port in ports:
+            f.write(f"{port},{throughput_gbps * 1000 / len(ports)},{retransmits / len(ports)}\n")
+
+
+def write_sweep(data_root):
+    # iperf totals of run 1 of every configuration, for both senders
+    for number, aqm in enumerate(AQMS):
+        for speed in SPEEDS:
+            for bdp in (1, 2, 4):
+                for pair in PAIRS:
+                    cca1, cca2 = pair.split('_')
+                    write_totals(f"{data_root}/poseidon-sender-1_output/output/{speed}_{pair}_{aqm}_{bdp}bdp_1", 0.4 + bdp / 10, 100 + number)
+                    write_totals(f"{data_root}/poseidon-sender-2_output/output/{speed}_{cca2}_{cca1}_{aqm}_{bdp}bdp_1", 0.3, 50 * bdp)
+
+
+def outputs(data_root):
+    return {name: os.stat(os.path.join(root, name)).st_mtime_ns
+            for root, _, names in os.walk(os.path.join(data_root, 'parsed_data')) for name in names if name.endswith('.dat')}
+
+
+def test_only_outputs_with_changed_totals_are_recomputed(tmp_path, monkeypatch):
+    data_root = str(tmp_path)
+    write_sweep(data_root)
+    sweep_parser.main(data_root)
+    written = outputs(data_root)
+    assert len(written) == len(AQMS) * len(SPEEDS) * len(PAIRS)
+    with open(f"{data_root}/parsed_data/bbr1_cubic/bbr1_cubic_red_1gbps.dat") as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith("#BDP,alg1_mean_throughput")
+    # Sender 1: 0.5 Gbps and 102 retransmissions, sender 2: 0.3 Gbps and 50; cubic vs cubic has 152 as well
+    assert lines[1] == "1BDP,0.5,0.3,102.0,50.0,0.9411764705882353,1.0,0.8"
+
+    # Up to date: no iperf totals are read at all
+    opened = []
+    real_open = builtins.open
+
+    def tracking_open(file, *args, **kwargs):
+        opened.append(str(file))
+        return real_open(file, *args, **kwargs)
+    monkeypatch.setattr(builtins, 'open', tracking_open)
+    sweep_parser.main(data_root)
+    assert not [name for name in opened if name.endswith('.csv')]
+    assert outputs(data_root) == written
+    monkeypatch.undo()
+
+    # New totals of one run only redo the output of its configuration
+    write_totals(f"{data_root}/poseidon-sender-1_output/output/10gbps_bbr2_cubic_fifo_2bdp_1", 0.6, 300)
+    sweep_parser.main(data_root)
+    changed = {name for name, mtime in outputs(data_root).items() if written[name] != mtime}
+    assert changed == {'bbr2_cubic_fifo_10gbps.dat'}
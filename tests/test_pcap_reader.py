@@ -0,0 +1,122 @@
+import functools
+import struct
+
+import numpy as np
+import pytest
+
+import pcap_reader
+import process_pcap
+from pcap_builder import (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, frame, ipv4_tcp, sample_packets, tcp_flags,
+                          write_pcap, write_pcapng)
+
+CAPTURES = {
+    'ethernet': dict(linktype=LINKTYPE_ETHERNET),
+    'vlan': dict(linktype=LINKTYPE_ETHERNET, vlans=(10, 20)),
+    'sll': dict(linktype=LINKTYPE_LINUX_SLL),
+    'raw': dict(linktype=LINKTYPE_RAW),
+    'nanosecond': dict(linktype=LINKTYPE_ETHERNET, nano=True),
+    'big-endian': dict(linktype=LINKTYPE_ETHERNET, nano=True, endian='>'),
+    'truncated': dict(linktype=LINKTYPE_ETHERNET, truncate_last=30),
+    'pcapng': dict(linktype=LINKTYPE_ETHERNET, pcapng=True),
+}
+
+
+def write_capture(path, packets, linktype, vlans=(), pcapng=False, **options):
+    records = [(ts_ns, frame(linktype, packet, vlans)) for ts_ns, packet, _ in packets]
+    if pcapng:
+        write_pcapng(path, records, linktype)
+    else:
+        write_pcap(path, records, linktype, **options)
+
+
+def expected_columns(packets, nano=False, pcapng=False, truncate_last=0, **_):
+    # The packet columns the decoders should produce, taken from the headers the builder wrote
+    if truncate_last:
+        packets = packets[:-1]
+    rows = []
+    for pkt_num, (ts_ns, packet, is_tcp) in enumerate(packets, start=1):
+        if not is_tcp:
+            continue
+        src, dst = struct.unpack_from('!II', packet, 12)
+        sport, dport, seq, ack, offset_flags, window = struct.unpack_from('!HHIIHH', packet, 20)
+        payload = len(packet) - 20 - (offset_flags >> 12) * 4
+        rows.append((pkt_num, ts_ns if nano or pcapng else ts_ns // 1000 * 1000, src, dst, sport, dport, seq, ack, offset_flags & 0x01FF,
+                     window, payload, payload))
+    return pcap_reader.concat_packet_columns([process_pcap.packet_columns(rows)])
+
+
+def assert_same_columns(actual, expected):
+    assert list(actual) == list(pcap_reader.PACKET_DTYPES)
+    for name, dtype in pcap_reader.PACKET_DTYPES.items():
+        assert actual[name].dtype == dtype, name
+        np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+
+@pytest.mark.parametrize('capture', sorted(CAPTURES))
+@pytest.mark.parametrize('decoder', [pcap_reader.iter_pcap_columns, pcap_reader.iter_packet_batches])
+def test_decoders_match_the_written_headers(tmp_path, capture, decoder):
+    packets = sample_packets(300)
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_capture(pcap_file, packets, **CAPTURES[capture])
+    columns = pcap_reader.concat_packet_columns(decoder(pcap_file, 64))
+    assert_same_columns(columns, expected_columns(packets, **CAPTURES[capture]))
+
+
+@pytest.mark.parametrize('capture', sorted(CAPTURES))
+def test_scapy_decoder_agrees(tmp_path, capture):
+    pytest.importorskip('scapy')
+    packets = sample_packets(200)
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_capture(pcap_file, packets, **CAPTURES[capture])
+    expected = pcap_reader.read_pcap_columns(pcap_file)
+    assert_same_columns(pcap_reader.concat_packet_columns(process_pcap.iter_packets_scapy(pcap_file, 64)), expected)
+
+
+def test_header_fields(tmp_path):
+    pcap_file = str(tmp_path / 'capture.pcap')
+    packet = ipv4_tcp('192.168.1.2', '10.0.0.9', 5201, 43210, 4000000000, 17, tcp_flags('PAE'), 1024, b'z' * 100,
+                      options=b'\x01\x01\x08\x0a' + b'\0' * 8)
+    # The second frame is captured header-only, as in the archives: the wire length still gives the segment size
+    headers = frame(LINKTYPE_ETHERNET, packet)[:14 + 20 + 32]
+    write_pcap(pcap_file, [(5 * 10 ** 9 + 1000, frame(LINKTYPE_ETHERNET, packet)), (6 * 10 ** 9, headers, 14 + len(packet))])
+    for decoder in (pcap_reader.read_pcap_columns, pcap_reader.read_pcap_columns_streaming):
+        columns = decoder(pcap_file)
+        assert columns['pkt_num'].tolist() == [1, 2]
+        assert columns['ts_ns'].tolist() == [5 * 10 ** 9 + 1000, 6 * 10 ** 9]
+        assert pcap_reader.format_ipv4(columns['src_ip']).tolist() == ['192.168.1.2'] * 2
+        assert pcap_reader.format_ipv4(columns['dst_ip']).tolist() == ['10.0.0.9'] * 2
+        assert columns['seq'].tolist() == [4000000000] * 2
+        assert pcap_reader.TCP_FLAG_STRINGS[columns['flags'][0]] == 'PAE'
+        assert columns['payload_length'].tolist() == [100, 100]
+        assert columns['segment_size'].tolist() == [100, 100]
+
+
+def test_empty_and_header_only_captures(tmp_path):
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_pcap(pcap_file, [])
+    for decoder in (pcap_reader.iter_pcap_columns, pcap_reader.iter_packet_batches):
+        assert list(decoder(pcap_file)) == []
+    assert_same_columns(pcap_reader.read_pcap_columns(pcap_file), pcap_reader.concat_packet_columns([]))
+
+
+
+@pytest.mark.parametrize('capture', sorted(CAPTURES))
+def test_header_walk_counts_the_decoded_packets(tmp_path, capture):
+    packets = sample_packets(300)
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_capture(pcap_file, packets, **CAPTURES[capture])
+    count = len(expected_columns(packets, **CAPTURES[capture])['ts_ns'])
+    assert pcap_reader.count_ipv4_tcp_records(pcap_file) == count
+    assert len(pcap_reader.read_pcap_columns(pcap_file)['ts_ns']) == count
+
+
+def test_archives_decode_like_the_capture(tmp_path):
+    packets = sample_packets(300)
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_capture(pcap_file, packets, linktype=LINKTYPE_ETHERNET, vlans=(7,))
+    archive_file = str(tmp_path / 'capture.pcap.gz')
+    assert pcap_reader.write_header_archive(pcap_file, archive_file) == len(packets)
+    expected = pcap_reader.read_pcap_columns(pcap_file)
+    assert pcap_reader.count_ipv4_tcp_records(archive_file) == len(expected['ts_ns'])
+    for decoder in (pcap_reader.iter_pcap_columns, functools.partial(pcap_reader.iter_packet_batches, batch_size=50)):
+        assert_same_columns(pcap_reader.concat_packet_columns(decoder(archive_file)), expected)
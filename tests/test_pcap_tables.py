@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pcap_reader
+import pcap_tables
+import process_pcap
+from pcap_builder import LINKTYPE_ETHERNET, frame, sample_packets, write_pcap
+
+
+@pytest.fixture(scope='module')
+def table_directory(tmp_path_factory):
+    # The three tables of a synthetic capture, written both as CSV and as Parquet
+    pytest.importorskip('pyarrow')
+    directory = str(tmp_path_factory.mktemp('tables'))
+    pcap_file = os.path.join(directory, 'capture.pcap')
+    write_pcap(pcap_file, [(ts_ns, frame(LINKTYPE_ETHERNET, packet)) for ts_ns, packet, _ in sample_packets(600)])
+    result, = process_pcap.process_pcap_range((0, 1), [pcap_file], 'numpy', 'builtin', 0)
+    anchors = {}
+    for name, column_names in process_pcap.TABLES:
+        process_pcap.save_merged_tables(result[name], column_names, os.path.join(directory, name), ('csv', 'parquet'), anchors)
+    return directory
+
+
+@pytest.mark.parametrize('name', [name for name, _ in process_pcap.TABLES])
+def test_parquet_reads_back_like_the_csv(table_directory, name):
+    csv = pcap_tables.read_table(os.path.join(table_directory, name + '.csv'))
+    parquet = pcap_tables.read_table(pcap_tables.table_file(table_directory, name))
+    assert list(parquet.columns) == list(csv.columns)
+    assert len(csv) > 0
+    if name == 'extracted_information':
+        # Parquet keeps the flag bits that the CSV spells out as letters
+        assert [pcap_reader.TCP_FLAG_STRINGS[bits] for bits in parquet.pop('tcp_flags')] == csv.pop('tcp_flags').fillna('').tolist()
+    for column in csv.columns:
+        if column in ('src_ip', 'dst_ip'):
+            assert parquet[column].astype(str).tolist() == csv[column].tolist(), column
+        else:
+            # The float seconds rebuilt from integer nanoseconds are bit-identical to the ones in the CSV
+            np.testing.assert_array_equal(parquet[column].astype(float), csv[column].astype(float), err_msg=column)
+
+
+def test_parquet_row_groups_hold_one_flow(table_directory):
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(os.path.join(table_directory, 'extracted_information.parquet'))
+    flows = set()
+    for index in range(parquet_file.num_row_groups):
+        group = parquet_file.read_row_group(index, columns=['src_port', 'dst_port']).to_pandas()
+        assert len(group.drop_duplicates()) == 1
+        flows.add(tuple(group.iloc[0]))
+    assert len(flows) == parquet_file.num_row_groups
+
+
+def test_filters_and_columns_match_between_formats(table_directory):
+    columns = ['original_time_stamp', 'dst_port', 'rtt_ms']
+    filters = [('src_port', '==', 15611), ('dst_port', '>=', 40002)]
+    csv = pcap_tables.read_table(os.path.join(table_directory, 'rtt.csv'), columns, filters)
+    parquet = pcap_tables.read_table(os.path.join(table_directory, 'rtt.parquet'), columns, filters)
+    assert len(csv) > 0 and list(parquet.columns) == columns
+    pd.testing.assert_frame_equal(parquet.reset_index(drop=True), csv.reset_index(drop=True), check_dtype=False)
+
+
+def test_flow_index_matches_masking(table_directory):
+    df = pcap_tables.read_table(os.path.join(table_directory, 'extracted_information.csv'))
+    df = df.sample(frac=1, random_state=5)  # Flow order must not matter
+    flows = pcap_tables.FlowIndex(df)
+    pairs = df[['dst_port', 'src_port']].drop_duplicates().itertuples(index=False)
+    for dst_port, src_port in pairs:
+        pd.testing.assert_frame_equal(flows.get(dst_port, src_port), df[(df['dst_port'] == dst_port) & (df['src_port'] == src_port)])
+    assert flows.get(1, 2).empty and list(flows.get(1, 2).columns) == list(df.columns)
+
+    # Rows with a missing port belong to no flow; other key columns can be given
+    df = pd.DataFrame({'dst_port': [15611, np.nan, 15611], 'src_port': [40001, 40001, 40001], 'seq': [1, 2, 3]})
+    assert pcap_tables.FlowIndex(df).get(15611, 40001)['seq'].tolist() == [1, 3]
+    assert pcap_tables.FlowIndex(df, keys=('src_port', 'seq')).get(40001, 2)['dst_port'].isna().all()
@@ -0,0 +1,55 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+import plot_all
+
+
+@pytest.fixture
+def watchdog():
+    handler = signal.getsignal(signal.SIGUSR1)
+    yield lambda limit_bytes: plot_all.MemoryWatchdog(limit_bytes, interval=0.01)
+    signal.signal(signal.SIGUSR1, handler)
+
+
+def test_memory_watchdog_fails_the_task(watchdog):
+    limit = watchdog(plot_all.resident_anonymous_bytes() + 64 * 1024 ** 2)
+    with limit:
+        time.sleep(0.05)  # Below the limit
+    held = []
+    with pytest.raises(MemoryError, match="resident memory exceeded"):
+        with limit:
+            held.append(np.ones(128 * 1024 ** 2, dtype=np.uint8))  # Touched, so resident
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                time.sleep(0.01)
+    assert not limit.active
+    held.clear()
+    time.sleep(0.05)  # No signal once the task is over
+
+
+def test_memory_watchdog_ignores_reserved_memory(watchdog):
+    # An untouched allocation reserves address space without making it resident
+    limit = watchdog(plot_all.resident_anonymous_bytes() + 64 * 1024 ** 2)
+    with limit:
+        buffer = np.empty(1024 ** 3, dtype=np.uint8)
+        time.sleep(0.1)
+    del buffer
+
+
+def test_configuration_with_missing_tables_is_skipped_before_parsing_iperf(tmp_path, monkeypatch):
+    row = {'aqm': 'fifo', 'cca1': 'bbr1', 'cca2': 'cubic', 'speed': '1gbps', 'bdp': 1, 'run': 1}
+    for sender, tag in (('poseidon-sender-1', '1gbps_bbr1_cubic_fifo_1bdp_1'), ('poseidon-sender-2', '1gbps_cubic_bbr1_fifo_1bdp_1')):
+        directory = tmp_path / f'{sender}_output' / 'output' / tag
+        directory.mkdir(parents=True)
+        (directory / 'iperf_15611.out').write_text("")
+
+    def parse(directory):
+        raise AssertionError(f"parsed the iperf outputs of {directory}")
+    monkeypatch.setattr(plot_all, 'update_iperf_directory', parse)
+    status, reason = plot_all.process_configuration(row, str(tmp_path), formats=['csv'])
+    assert status == 'skipped' and reason.startswith("missing or empty: ")
+    assert sorted(os.listdir(directory)) == ['iperf_15611.out']
@@ -0,0 +1,157 @@
+import math
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+import process_iperf
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'iperf')
+
+
+def rows(columns, names=process_iperf.IPERF_COLUMNS):
+    return list(zip(*(columns[name] for name in names)))
+
+
+def test_text_output():
+    # iperf3 -c 10.0.1.1 -p 15611 -P 2 -t 2 -f m: interval lines of both streams, [SUM] and summary lines skipped
+    columns = process_iperf.parse_iperf_output(os.path.join(FIXTURES, 'iperf_15611.out'))
+    assert list(columns) == process_iperf.IPERF_COLUMNS
+    assert rows(columns) == [
+        ('43210', '15611', 1.0, 0.0, 3.01, 939.0),
+        ('43212', '15611', 1.0, 2.0, 0.5, 461.0),
+        ('43210', '15611', 2.0, 12.0, 1.5, 933.0),
+        ('43212', '15611', 2.0, 0.0, 0.62, 472.0),
+    ]
+
+
+def test_text_units(tmp_path):
+    output = tmp_path / 'iperf_15620.out'
+    output.write_text(
+        "[  5] local 10.0.0.1 port 50000 connected to 10.0.1.1 port 15620\n"
+        "[  4] 0.00-1.00 sec 1.2 GBytes 9.38 Gbits/sec 1 2.50 GBytes\n"  # stream without a connection line
+        "[  5]   0.00-1.00   sec  1.09 GBytes  9.38 Gbits/sec    3   1.00 GBytes\n"
+        "[  5]   1.00-2.00   sec  62.5 KBytes   512 Kbits/sec    0   2048 Bytes\n"
+        "[  5]   2.00-3.00   sec  0.00 Bytes  0.00 bits/sec    0   1.00 TBytes\n"  # unknown unit
+    )
+    columns = process_iperf.parse_iperf_output(str(output))
+    assert rows(columns) == [('50000', '15620', 1.0, 3.0, 1024.0, 9380.0), ('50000', '15620', 2.0, 0.0, 0.0, 0.51)]
+
+
+def test_output_without_intervals(tmp_path):
+    output = tmp_path / 'iperf_15621.out'
+    output.write_text("iperf3: error - unable to connect to server: Connection refused\n")
+    assert process_iperf.parse_iperf_output(str(output)) == {name: [] for name in process_iperf.IPERF_COLUMNS}
+
+
+@pytest.fixture(params=['ijson', 'json'])
+def json_parser(request, monkeypatch):
+    # Runs a test with the incremental ijson reader of -J documents and with the json.load fallback
+    if request.param == 'ijson':
+        pytest.importorskip('ijson')
+    else:
+        monkeypatch.setitem(sys.modules, 'ijson', None)
+    return request.param
+
+
+def test_json_document(json_parser):
+    # iperf3 -c 10.0.1.1 -p 15612 -t 2 -J
+    columns = process_iperf.parse_iperf_output(os.path.join(FIXTURES, 'iperf_15612.json'))
+    assert list(columns) == process_iperf.IPERF_COLUMNS + process_iperf.JSON_COLUMNS
+    assert rows(columns, ['src_port', 'dst_port', 'Time_sec', 'Retx_pkts', 'Bytes', 'Rtt_ms', 'Rttvar_ms']) == [
+        ('43300', '15612', 1.000041, 0.0, 117440512, 1.52, 0.21),
+        ('43300', '15612', 2.000035, 7.0, 116391936, 2.875, 0.644),
+    ]
+    assert columns['Cwnd_MBytes'] == [3156480 / 2 ** 20, 1.5]
+    assert columns['Throughput_Mbps'] == pytest.approx([939.4856, 931.1411], abs=1e-4)
+
+
+def test_json_stream():
+    # iperf3 -c 10.0.1.1 -p 15613 -t 2 --json-stream
+    columns = process_iperf.parse_iperf_output(os.path.join(FIXTURES, 'iperf_15613.json'))
+    assert rows(columns, ['src_port', 'dst_port', 'Time_sec', 'Retx_pkts', 'Bytes', 'Rtt_ms']) == [
+        ('43400', '15613', 1.00003, 3.0, 52428800, 9.8),
+        ('43400', '15613', 2.000012, 0.0, 0, 9.9),
+    ]
+    assert columns['Throughput_Mbps'][1] == 0
+
+
+def test_json_error(json_parser, tmp_path, capsys):
+    output = tmp_path / 'iperf_15622.json'
+    output.write_text('{\n\t"start":\t{\n\t\t"connected":\t[]\n\t},\n\t"intervals":\t[],\n\t"end":\t{},\n'
+                      '\t"error":\t"unable to connect to server: Connection refused"\n}\n')
+    assert process_iperf.parse_iperf_output(str(output))['Time_sec'] == []
+    assert "unable to connect to server" in capsys.readouterr().out
+
+
+def test_merge_fills_json_columns_of_text_rows():
+    text = process_iperf.parse_iperf_output(os.path.join(FIXTURES, 'iperf_15611.out'))
+    document = process_iperf.parse_iperf_output(os.path.join(FIXTURES, 'iperf_15612.json'))
+    columns = process_iperf.merge_columns([text, document])
+    assert list(columns) == process_iperf.IPERF_COLUMNS + process_iperf.JSON_COLUMNS
+    assert columns['src_port'] == text['src_port'] + document['src_port']
+    assert all(math.isnan(value) for value in columns['Rtt_ms'][:4]) and columns['Rtt_ms'][4:] == document['Rtt_ms']
+    assert list(process_iperf.merge_columns([text, text])) == process_iperf.IPERF_COLUMNS
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_run_directory(tmp_path, processes):
+    for name in ('iperf_15611.out', 'iperf_15612.json', 'iperf_15613.json'):
+        shutil.copy(os.path.join(FIXTURES, name), tmp_path)
+    (tmp_path / 'iperf_15611.log').write_text("not an iperf output\n")
+    df, totals_per_port, totals_per_sender = process_iperf.process_iperf_directory(str(tmp_path), processes=processes)
+
+    file_names = [os.path.join(tmp_path, name) for name in process_iperf.iperf_files(str(tmp_path))]
+    serial = process_iperf.merge_columns([process_iperf.parse_iperf_output(file_name) for file_name in file_names])
+    pd.testing.assert_frame_equal(df, pd.DataFrame(serial))
+    assert len(df) == 8
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'iperf_data.csv', dtype={'src_port': str, 'dst_port': str}), df)
+
+    per_port = totals_per_port.set_index('src_port')
+    assert list(per_port.index) == ['43210', '43212', '43300', '43400']
+    assert per_port.loc['43210', 'average_throughput_mbps'] == 936.0
+    assert per_port['total_retransmissions'].tolist() == [12.0, 2.0, 7.0, 3.0]
+    assert totals_per_sender['total_retransmissions'].iloc[0] == 24.0
+    assert totals_per_sender['average_throughput_gbps'].iloc[0] == pytest.approx(per_port['average_throughput_mbps'].sum() / 1000)
+    with open(tmp_path / 'iperf_totals_per_sender.csv') as f:
+        assert f.readline() == "average_throughput_gbps,total_retransmissions\n"
+
+
+def test_directory_without_intervals(tmp_path):
+    (tmp_path / 'iperf_15621.out').write_text("iperf3: error - unable to connect to server: Connection refused\n")
+    assert process_iperf.process_iperf_directory(str(tmp_path)) == (None, None, None)
+    with pytest.raises(NotADirectoryError):
+        process_iperf.process_iperf_directory(str(tmp_path / 'iperf_15621.out'))
+
+
+def csv_mtimes(directory):
+    return {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in process_iperf.IPERF_CSV_FILES}
+
+
+def test_update_only_rewrites_stale_csvs(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(FIXTURES, 'iperf_15611.out'), tmp_path)
+    shutil.copy(os.path.join(FIXTURES, 'iperf_15612.json'), tmp_path)
+    parsed = process_iperf.update_iperf_directory(str(tmp_path))
+    mtimes = csv_mtimes(tmp_path)
+
+    # Up to date: nothing is parsed or written, and iperf_data.csv reads back as parsed
+    monkeypatch.setattr(process_iperf, 'parse_iperf_files', None)
+    pd.testing.assert_frame_equal(process_iperf.update_iperf_directory(str(tmp_path)), parsed)
+    assert csv_mtimes(tmp_path) == mtimes
+    monkeypatch.undo()
+
+    # A removed CSV or a changed iperf output makes the stage run again
+    os.remove(tmp_path / 'iperf_totals_per_port.csv')
+    process_iperf.update_iperf_directory(str(tmp_path))
+    assert os.path.exists(tmp_path / 'iperf_totals_per_port.csv')
+    with open(tmp_path / 'iperf_15612.json', 'w') as f:
+        f.write('{"start": {"connected": []}, "intervals": [], "error": "interrupt - the client has terminated"}\n')
+    assert len(process_iperf.update_iperf_directory(str(tmp_path))) == 4
+
+    # Without interval data the CSVs of earlier outputs are removed rather than left stale
+    os.remove(tmp_path / 'iperf_15611.out')
+    assert process_iperf.update_iperf_directory(str(tmp_path)) is None
+    assert not any(name.endswith('.csv') for name in os.listdir(tmp_path))
+    assert process_iperf.update_iperf_directory(str(tmp_path)) is None
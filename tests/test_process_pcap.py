@@ -0,0 +1,176 @@
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pcap_reader
+import process_pcap
+from pcap_builder import LINKTYPE_ETHERNET, frame, sample_packets, write_pcap
+
+
+def write_chunks(directory, chunks=3, count=400):
+    # A run split into tcpdump -C style chunks: capture.pcap, capture.pcap1, ...
+    packets = sample_packets(count)
+    os.makedirs(directory, exist_ok=True)
+    size = -(-len(packets) // chunks)
+    for number in range(chunks):
+        name = 'capture.pcap' + (str(number) if number else '')
+        write_pcap(os.path.join(directory, name), [(ts_ns, frame(LINKTYPE_ETHERNET, packet))
+                                                   for ts_ns, packet, _ in packets[number * size:(number + 1) * size]])
+    return process_pcap.sorted_pcap_files(directory)
+
+
+def write_tables(pcap_files, directory, decoder='numpy'):
+    results = process_pcap.process_pcap_range((0, len(pcap_files)), pcap_files, decoder, 'builtin', 0)
+    anchors = {}
+    for name, column_names in process_pcap.TABLES:
+        runs = [run for result in results for run in result[name]]
+        process_pcap.save_merged_tables(runs, column_names, os.path.join(directory, name), anchors=anchors)
+    return {name: open(os.path.join(directory, name + '.csv')).read() for name, _ in process_pcap.TABLES}
+
+
+def test_batches_are_bounded(tmp_path):
+    pcap_file = str(tmp_path / 'capture.pcap')
+    write_pcap(pcap_file, [(ts_ns, frame(LINKTYPE_ETHERNET, packet)) for ts_ns, packet, _ in sample_packets(300)])
+    for decoder in (pcap_reader.iter_pcap_columns, pcap_reader.iter_packet_batches):
+        batches = list(decoder(pcap_file, 16))
+        assert max(len(batch['ts_ns']) for batch in batches) <= 16
+        whole = pcap_reader.concat_packet_columns(batches)
+        for name, values in pcap_reader.read_pcap_columns_streaming(pcap_file).items():
+            np.testing.assert_array_equal(whole[name], values)
+
+
+@pytest.mark.parametrize('decoder', ['numpy', 'stream'])
+def test_tables_do_not_depend_on_the_batch_size(tmp_path, monkeypatch, decoder):
+    pcap_files = write_chunks(str(tmp_path / 'pcap'))
+    expected = write_tables(pcap_files, str(tmp_path), decoder)
+    monkeypatch.setitem(process_pcap.DECODERS, decoder, functools.partial(process_pcap.DECODERS[decoder], batch_size=7))
+    assert write_tables(pcap_files, str(tmp_path), decoder) == expected
+    assert expected['retx'].count('\n') > 1 and expected['rtt'].count('\n') > 1
+
+
+def reference_merge(chunks):
+    # What the merge has to produce: every flow's rows concatenated in run order, then stably sorted by time
+    flows = []
+    for key in sorted(set().union(*(process_pcap.flow_runs(chunk) for chunk in chunks))):
+        parts = [chunk for chunk in chunks if key in process_pcap.flow_runs(chunk)]
+        flow = {name: np.concatenate([part[name][slice(*process_pcap.flow_runs(part)[key])] for part in parts]) for name in parts[0]}
+        order = np.argsort(flow['original_time_stamp'], kind='stable')
+        flows.append({name: values[order] for name, values in flow.items()})
+    return flows
+
+
+@pytest.mark.parametrize('block_rows', [1, 3, 50, 100000])
+def test_merge_streams_flows_in_time_order(block_rows):
+    rng = np.random.default_rng(5)
+    chunks = []
+    for number in range(4):
+        rows = 60 + 20 * number
+        # Coarse timestamps so runs overlap in time and tie within and across runs
+        chunks.append(process_pcap.sort_by_flow({
+            'original_time_stamp': rng.integers(0, 30, rows).astype(np.float64) + number * 5,
+            'src_port': rng.integers(40000, 40003, rows).astype(np.uint16),
+            'dst_port': np.full(rows, 5201, dtype=np.uint16),
+            'row': np.arange(rows) + 1000 * number,
+        }))
+    pieces = list(process_pcap.iter_merged_flows(chunks, block_rows))
+    # A run is only read past block_rows rows to get beyond a block of equal timestamps
+    ties = max(np.unique(chunk['original_time_stamp'], return_counts=True)[1].max() for chunk in chunks)
+    assert all(len(piece['row']) <= len(chunks) * (block_rows + ties) for piece in pieces)
+    expected = np.concatenate([flow['row'] for flow in reference_merge(chunks)])
+    np.testing.assert_array_equal(np.concatenate([piece['row'] for piece in pieces]), expected)
+
+
+def test_spilled_runs_write_the_same_tables(tmp_path):
+    pcap_files = write_chunks(str(tmp_path / 'pcap'))
+    expected = write_tables(pcap_files, str(tmp_path))
+    spill_directory = tmp_path / 'spill'
+    spill_directory.mkdir()
+    results = process_pcap.process_pcap_range((0, len(pcap_files)), pcap_files, 'numpy', 'builtin', 0, str(spill_directory))
+    assert all(isinstance(run, str) for result in results for runs in result.values() for run in runs)
+    results = process_pcap.load_results(results)
+    anchors = {}
+    for name, column_names in process_pcap.TABLES:
+        runs = [run for result in results for run in result[name]]
+        process_pcap.save_merged_tables(runs, column_names, str(tmp_path / name), anchors=anchors)
+        assert open(str(tmp_path / (name + '.csv'))).read() == expected[name]
+
+
+@pytest.mark.parametrize('processes', [2, 3, 6])
+def test_parallel_ranges_match_a_serial_pass(tmp_path, processes):
+    pcap_files = write_chunks(str(tmp_path / 'pcap'), chunks=6, count=900)
+    results = [result for chunk_range in process_pcap.chunk_ranges(len(pcap_files), processes)
+               for result in process_pcap.process_pcap_range(chunk_range, pcap_files, 'numpy', 'builtin', 1.0)]
+    assert process_pcap.validate_against_serial(pcap_files, results) == 0
+
+
+def test_validation_reports_flow_state_lost_at_chunk_boundaries(tmp_path):
+    # Without the overlap window each worker starts with a cold tracker, which the serial pass shows up
+    pcap_files = write_chunks(str(tmp_path / 'pcap'), chunks=6, count=900)
+    results = [result for chunk_range in process_pcap.chunk_ranges(len(pcap_files), 3)
+               for result in process_pcap.process_pcap_range(chunk_range, pcap_files, 'numpy', 'builtin', 0)]
+    assert process_pcap.validate_against_serial(pcap_files, results) > 0
+
+
+def test_archive_replaces_the_capture_and_reprocesses_identically(tmp_path):
+    run_directory = str(tmp_path / 'run')
+    write_chunks(os.path.join(run_directory, 'pcap'))
+    process_pcap.main(run_directory, analysis='builtin', keep_pcap='archive')
+    assert not os.path.exists(os.path.join(run_directory, 'pcap'))
+    with open(os.path.join(run_directory, process_pcap.ARCHIVE_DIRECTORY, process_pcap.ARCHIVE_MANIFEST)) as f:
+        manifest = json.load(f)
+    assert manifest['tables']['extracted_information'] == sum(chunk['tcp_packets'] for chunk in manifest['chunks'])
+    tables = {name: open(os.path.join(run_directory, name + '.csv')).read() for name, _ in process_pcap.TABLES}
+
+    process_pcap.main(run_directory, analysis='builtin', pcap_directory=process_pcap.ARCHIVE_DIRECTORY)
+    assert os.path.exists(os.path.join(run_directory, process_pcap.ARCHIVE_DIRECTORY, process_pcap.ARCHIVE_MANIFEST))
+    assert {name: open(os.path.join(run_directory, name + '.csv')).read() for name in tables} == tables
+
+
+def test_capture_is_kept_when_a_table_misses_rows(tmp_path, monkeypatch):
+    run_directory = str(tmp_path / 'run')
+    write_chunks(os.path.join(run_directory, 'pcap'))
+    save_merged_tables = process_pcap.save_merged_tables
+
+    def drop_last_run(chunks, column_names, table_path, outputs=('csv',), anchors=None):
+        if table_path.endswith('extracted_information'):
+            chunks = chunks[:-1]
+        return save_merged_tables(chunks, column_names, table_path, outputs, anchors)
+
+    monkeypatch.setattr(process_pcap, 'save_merged_tables', drop_last_run)
+    process_pcap.main(run_directory, analysis='builtin')
+    assert len(os.listdir(os.path.join(run_directory, 'pcap'))) == 3
+    assert not any(name.startswith('.process_pcap-') for name in os.listdir(run_directory))
+
+
+def test_tshark_analysis_warns_about_chunk_boundaries(tmp_path, monkeypatch, capsys):
+    run_directory = str(tmp_path / 'run')
+    write_chunks(os.path.join(run_directory, 'pcap'))
+    with pytest.raises(ValueError):
+        process_pcap.main(run_directory, analysis='tshark', validate=True)
+
+    # Stands in for tshark finding nothing; the workers are forked with the patched functions
+    monkeypatch.setattr(process_pcap, 'analyze_retx_from_pcap', lambda pcap_file: [])
+    monkeypatch.setattr(process_pcap, 'analyze_rtt_from_pcap', lambda pcap_file: [])
+    process_pcap.main(run_directory, analysis='tshark', keep_pcap='keep')
+    assert "tshark analyzes each of the 3 pcap chunks on its own" in capsys.readouterr().out
+    process_pcap.main(run_directory, keep_pcap='keep')
+    assert "Warning" not in capsys.readouterr().out
+
+
+def test_retx_and_rtt_share_the_time_base_of_the_packets(tmp_path):
+    run_directory = str(tmp_path / 'run')
+    write_chunks(os.path.join(run_directory, 'pcap'))
+    process_pcap.main(run_directory)
+    tables = {name: pd.read_csv(os.path.join(run_directory, name + '.csv')) for name, _ in process_pcap.TABLES}
+    packets = tables['extracted_information']
+    keys = ['original_time_stamp', 'src_port', 'dst_port']
+    for name in ('retx', 'rtt'):
+        rows = tables[name].merge(packets[keys + ['time_stamp_sec']], on=keys, suffixes=('', '_packet'))
+        assert len(rows) == len(tables[name]) > 0
+        assert (rows['time_stamp_sec'] == rows['time_stamp_sec_packet']).all(), name
+        # A table's first row of a port is not that port's first packet, so anchoring at it would shift the times
+        assert (rows.groupby('dst_port')['time_stamp_sec'].min() > 0).any()
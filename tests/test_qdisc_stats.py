@@ -0,0 +1,59 @@
+import os
+
+import qdisc_stats
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# tc -s qdisc show output of the AQM setups of the experiments (iproute2 formatting, counters made up)
+RED_OUTPUT = """\
+qdisc tbf 1: root refcnt 2 rate 1Gbit burst 125000b lat 10ms
+ Sent 1234567 bytes 890 pkt (dropped 12, overlimits 34 requeues 1)
+ backlog 1.5Kb 1p requeues 1
+qdisc red 2: parent 1:1 limit 400000b min 30000b max 90000b ecn adaptive
+ Sent 1234497 bytes 889 pkt (dropped 12, overlimits 30 requeues 0)
+ backlog 15140b 10p requeues 0
+  marked 30 early 4 pdrop 8 other 0
+"""
+FQ_CODEL_OUTPUT = """\
+qdisc fq_codel 8001: root refcnt 2 limit 10240p flows 1024 quantum 1514 target 5ms interval 100ms memory_limit 32Mb ecn drop_batch 64
+ Sent 6137196 bytes 52436 pkt (dropped 3, overlimits 0 requeues 2)
+ backlog 2Mb 1400p requeues 2
+  maxpacket 1514 drop_overlimit 0 new_flow_count 47 ecn_mark 5 drop_overmemory 0
+  new_flows_len 1 old_flows_len 2
+"""
+
+
+def test_red_output():
+    tbf, red = qdisc_stats.parse_tc_qdisc(RED_OUTPUT)
+    assert tbf == {'kind': 'tbf', 'handle': '1', 'parent': 'root', 'bytes': 1234567, 'packets': 890, 'drops': 12,
+                   'overlimits': 34, 'requeues': 1, 'backlog': 1536, 'qlen': 1}
+    assert red == {'kind': 'red', 'handle': '2', 'parent': '1:1', 'bytes': 1234497, 'packets': 889, 'drops': 12, 'overlimits': 30,
+                   'requeues': 0, 'backlog': 15140, 'qlen': 10, 'marked': 30, 'early': 4, 'pdrop': 8, 'other': 0}
+    assert qdisc_stats.last_qdisc([tbf, red]) is red
+    assert qdisc_stats.last_qdisc([tbf, red], 'tbf') is tbf
+    assert qdisc_stats.last_qdisc([tbf], 'red') is None
+
+
+def test_fq_codel_output():
+    fq_codel, = qdisc_stats.parse_tc_qdisc(FQ_CODEL_OUTPUT)
+    assert fq_codel['handle'] == '8001' and fq_codel['parent'] == 'root'
+    assert fq_codel['backlog'] == 2 * 1024 ** 2 and fq_codel['qlen'] == 1400
+    status = qdisc_stats.buffer_status(fq_codel)
+    assert list(status) == qdisc_stats.buffer_status_fields('fq_codel')[2:]
+    assert status == {'sent_pkts': 52436, 'dropped_pkts': 3, 'overlimits_pkts': 0, 'backlog_pkts': 1400, 'requeues_pkts': 2,
+                      'sent_bytes': 6137196, 'backlog_bytes': 2 * 1024 ** 2, 'maxpacket': 1514, 'drop_overlimit': 0, 'ecn_mark': 5,
+                      'new_flow_count': 47, 'new_flows_len': 1, 'old_flows_len': 2, 'ce_mark': 0, 'memory_used': 0,
+                      'drop_overmemory': 0}
+
+
+def test_recorded_output():
+    with open(os.path.join(FIXTURES, 'qdisc_ifb0.txt')) as f:
+        tbf, pfifo = qdisc_stats.parse_tc_qdisc(f.read())
+    assert (tbf['kind'], tbf['parent'], pfifo['kind'], pfifo['handle'], pfifo['parent']) == ('tbf', 'root', 'pfifo', '10', '1:1')
+    assert pfifo['drops'] > 0 and tbf['overlimits'] > 0
+    assert list(qdisc_stats.buffer_status(pfifo)) == qdisc_stats.buffer_status_fields()[2:]
+
+
+def test_empty_and_unrelated_lines():
+    assert qdisc_stats.parse_tc_qdisc('') == []
+    assert qdisc_stats.parse_tc_qdisc('Cannot find device "ifb9"\n') == []
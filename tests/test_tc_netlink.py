@@ -0,0 +1,103 @@
+import json
+import os
+import socket
+import struct
+
+import pytest
+
+import qdisc_stats
+import tc_netlink
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class ReplaySocket:
+    # Stands in for the rtnetlink socket, answering every dump request with the recorded replies
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = []
+
+    def send(self, data):
+        self.requests.append(data)
+        self.pending = list(self.replies)
+        return len(data)
+
+    def recv_into(self, buffer):
+        reply = self.pending.pop(0)
+        buffer[:len(reply)] = reply
+        return len(reply)
+
+    def close(self):
+        pass
+
+
+def replay_sampler(monkeypatch, ifindex, replies):
+    monkeypatch.setattr(tc_netlink.socket, 'if_nametoindex', lambda interface: ifindex)
+    sampler = tc_netlink.QdiscSampler('recorded')
+    sampler.sock.close()
+    sampler.sock = ReplaySocket(replies)
+    return sampler
+
+
+@pytest.mark.parametrize('interface', ['ifb0', 'ifb1'])
+def test_recorded_dump_matches_tc(monkeypatch, interface):
+    with open(os.path.join(FIXTURES, f'qdisc_{interface}.json')) as f:
+        recorded = json.load(f)
+    with open(os.path.join(FIXTURES, f'qdisc_{interface}.txt')) as f:
+        expected = qdisc_stats.parse_tc_qdisc(f.read())
+    sampler = replay_sampler(monkeypatch, recorded['ifindex'], [bytes.fromhex(reply) for reply in recorded['replies']])
+    qdiscs = sampler.sample()
+
+    # The request asks for a dump of the qdiscs of the interface
+    length, message_type, flags, sequence, _ = tc_netlink.NLMSG_HEADER.unpack_from(sampler.sock.requests[0])
+    assert (length, message_type, flags, sequence) == (len(sampler.sock.requests[0]), tc_netlink.RTM_GETQDISC,
+                                                       tc_netlink.NLM_F_REQUEST | tc_netlink.NLM_F_DUMP, 1)
+    assert [qdisc['kind'] for qdisc in qdiscs] == [qdisc['kind'] for qdisc in expected]
+    for qdisc, tc_qdisc in zip(qdiscs, expected):
+        assert qdisc['ifindex'] == recorded['ifindex']
+        assert {key: qdisc[key] for key in tc_qdisc} == tc_qdisc
+    assert any(qdisc['drops'] for qdisc in qdiscs)
+
+    # A second sample sends a new sequence number; replies to the old one are not accepted as its answer
+    sampler.sock.replies = [bytes.fromhex(reply) for reply in recorded['replies']]
+    with pytest.raises(IndexError):
+        sampler.sample()
+
+
+def attribute(attribute_type, payload):
+    return tc_netlink.RTATTR_HEADER.pack(4 + len(payload), attribute_type) + payload + b'\0' * (-len(payload) % 4)
+
+
+def qdisc_message(sequence, ifindex, kind, handle, parent, xstats):
+    # An RTM_NEWQDISC message laid out like the kernel's (struct tcmsg, TCA_KIND, TCA_STATS2 with gnet_stats_basic,
+    # gnet_stats_queue and the qdisc's xstats struct)
+    stats = (attribute(tc_netlink.TCA_STATS_BASIC, struct.pack('=QI', 123456789012, 4242) + b'\0' * 4)
+             + attribute(tc_netlink.TCA_STATS_PKT64, struct.pack('=Q', 4242))
+             + attribute(tc_netlink.TCA_STATS_QUEUE, struct.pack('=IIIII', 3, 4500, 17, 2, 99))
+             + attribute(tc_netlink.TCA_STATS_APP, xstats))
+    body = (tc_netlink.TCMSG.pack(socket.AF_UNSPEC, ifindex, handle, parent, 1)
+            + attribute(tc_netlink.TCA_KIND, kind.encode() + b'\0') + attribute(tc_netlink.TCA_STATS2, stats))
+    return tc_netlink.NLMSG_HEADER.pack(16 + len(body), tc_netlink.RTM_NEWQDISC, 2, sequence, 0) + body
+
+
+def test_aqm_extended_statistics(monkeypatch):
+    red = struct.pack('=IIII', 5, 6, 7, 8)
+    fq_codel = struct.pack('=I', tc_netlink.FQ_CODEL_XSTATS_TYPE_QDISC) + struct.pack('=IIIIIIIII', 1514, 1, 2, 3, 4, 5, 6, 7, 8)
+    done = tc_netlink.NLMSG_HEADER.pack(20, tc_netlink.NLMSG_DONE, 2, 1, 0) + b'\0' * 4
+    replies = [qdisc_message(1, 7, 'red', 0x20000, 0x10001, red) + qdisc_message(1, 8, 'red', 0x20000, 0x10001, red),
+               qdisc_message(1, 7, 'fq_codel', 0x100000, tc_netlink.TC_H_ROOT, fq_codel) + done]
+    red_qdisc, fq_codel_qdisc = replay_sampler(monkeypatch, 7, replies).sample()
+
+    assert red_qdisc == {'ifindex': 7, 'kind': 'red', 'handle': '2', 'parent': '1:1', 'bytes': 123456789012, 'packets': 4242,
+                         'qlen': 3, 'backlog': 4500, 'drops': 17, 'requeues': 2, 'overlimits': 99,
+                         'early': 5, 'pdrop': 6, 'other': 7, 'marked': 8}
+    assert fq_codel_qdisc['handle'] == '10' and fq_codel_qdisc['parent'] == 'root'
+    assert {field: fq_codel_qdisc[field] for field in qdisc_stats.AQM_FIELDS['fq_codel']} == dict(
+        zip(qdisc_stats.AQM_FIELDS['fq_codel'], [1514, 1, 2, 3, 4, 5, 6, 7, 8]))
+
+
+def test_netlink_errors_are_raised(monkeypatch):
+    error = tc_netlink.NLMSG_HEADER.pack(36, tc_netlink.NLMSG_ERROR, 0, 1, 0) + struct.pack('=i', -19) + b'\0' * 16
+    with pytest.raises(OSError) as raised:
+        replay_sampler(monkeypatch, 7, [error]).sample()
+    assert raised.value.errno == 19
@@ -0,0 +1,38 @@
+import os
+import shutil
+
+import pytest
+
+import check_tcp_analysis
+from tcp_reference import reference_packets, write_reference_capture
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+REFERENCE_CAPTURE = os.path.join(FIXTURES, 'tcp_reference.pcap')
+SCENARIOS = sorted({packet.scenario for packet in reference_packets()})
+
+
+def test_reference_capture_is_up_to_date(tmp_path):
+    write_reference_capture(str(tmp_path / 'tcp_reference.pcap'))
+    with open(REFERENCE_CAPTURE, 'rb') as committed, open(tmp_path / 'tcp_reference.pcap', 'rb') as generated:
+        assert committed.read() == generated.read()
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_tracker_scenarios(scenario):
+    values = check_tcp_analysis.builtin_values(REFERENCE_CAPTURE)
+    for frame, packet in enumerate(reference_packets(), start=1):
+        if packet.scenario != scenario:
+            continue
+        assert (frame in values['retx']) == packet.retransmission, f"frame {frame}"
+        assert values['rtt'].get(frame) == packet.rtt_ms, f"frame {frame}"
+
+
+def test_tracker_matches_tshark():
+    # Uses tshark outputs recorded with check_tcp_analysis.py --record when present, tshark itself otherwise
+    if os.path.exists(check_tcp_analysis.expected_file(REFERENCE_CAPTURE, FIXTURES, 'retx')):
+        expected_directory = FIXTURES
+    elif shutil.which('tshark'):
+        expected_directory = None
+    else:
+        pytest.skip("no recorded tshark outputs and tshark is not installed")
+    assert check_tcp_analysis.compare(REFERENCE_CAPTURE, expected_directory) == []
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import timeseries
+
+
+def noisy_series(points, seed=7):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(0.0005, 0.0015, points))
+    y = rng.normal(100, 5, points)
+    y[rng.choice(points, 20, replace=False)] += 500  # Spikes
+    return x, y
+
+
+@pytest.mark.parametrize('bins', [1, 7, 100, 1000])
+def test_minmax_keeps_the_envelope_of_every_bin(bins):
+    x, y = noisy_series(20000)
+    dx, dy = timeseries.minmax_decimate(x, y, bins)
+    assert len(dx) <= 2 * bins + 2 and np.all(np.diff(dx) > 0)
+    assert (dx[0], dx[-1]) == (x[0], x[-1])
+    kept = np.isin(x, dx)
+    np.testing.assert_array_equal(y[kept], dy)
+
+    # Same extremes per bin as grouping the full series
+    index = np.minimum(((x - x[0]) / (x[-1] - x[0]) * bins).astype(np.int64), bins - 1)
+    full = pd.Series(y).groupby(index).agg(['min', 'max'])
+    decimated = pd.Series(dy).groupby(index[kept]).agg(['min', 'max'])
+    pd.testing.assert_frame_equal(decimated, full)
+
+
+def test_minmax_short_unsorted_and_gapped_series():
+    x, y = np.arange(10.0), np.arange(10.0)
+    dx, dy = timeseries.minmax_decimate(x, y, 4)
+    np.testing.assert_array_equal(dx, x)
+
+    order = np.random.default_rng(1).permutation(1000)
+    x, y = np.arange(1000.0)[order], np.sin(np.arange(1000.0) / 50)[order]
+    y[x == 500] = np.nan
+    dx, dy = timeseries.minmax_decimate(x, y, 10)
+    assert np.all(np.diff(dx) > 0)
+    assert 500 in dx and np.isnan(dy[dx == 500]).all()  # The gap still breaks the line
+
+    # All points at one time fall into a single bin
+    dx, dy = timeseries.minmax_decimate(np.zeros(100), np.arange(100.0), 10)
+    assert sorted(dy) == [0, 99]
+
+
+def test_lttb():
+    x, y = noisy_series(5000)
+    dx, dy = timeseries.lttb_decimate(x, y, 200)
+    assert len(dx) == 200 and np.all(np.diff(dx) > 0)
+    assert (dx[0], dx[-1]) == (x[0], x[-1])
+    np.testing.assert_array_equal(y[np.isin(x, dx)], dy)
+
+    # A lone spike in a flat series forms the largest triangle of its bucket
+    y = np.ones(1000)
+    y[437] = 50
+    y[10] = np.nan
+    dx, dy = timeseries.lttb_decimate(np.arange(1000.0), y, 20)
+    assert 437 in dx and dy.max() == 50 and not np.isnan(dy).any()
+
+    dx, dy = timeseries.lttb_decimate(np.arange(5.0), np.arange(5.0), 2)
+    assert len(dx) == 5
+
+
+def test_decimate_targets_two_points_per_bin():
+    x, y = noisy_series(20000)
+    assert len(timeseries.decimate(x, y, 50, 'lttb')[0]) == 100
+    assert 50 <= len(timeseries.decimate(x, y, 50)[0]) <= 102
+
+
+def test_counter_deltas():
+    # A reset (qdisc re-created) restarts from the new value; NaN samples spoil their own and the next increment
+    values = [10, 15, 15, 3, 8, np.nan, 20, 26]
+    np.testing.assert_array_equal(timeseries.counter_deltas(values), [0, 5, 0, 3, 5, np.nan, np.nan, 6])
+    np.testing.assert_array_equal(timeseries.counter_deltas(values, initial=4)[:2], [6, 5])
+    np.testing.assert_array_equal(timeseries.counter_deltas([2 ** 32 - 2, 3], modulus=2 ** 32), [0, 5])
+    assert len(timeseries.counter_deltas([])) == 0
+
+    # Same as pandas diff on a counter without resets
+    counter = np.cumsum(np.random.default_rng(3).integers(0, 1000, 500)).astype(np.float64)
+    np.testing.assert_array_equal(timeseries.counter_deltas(counter), pd.Series(counter).diff().fillna(0))
+
+
+def test_counter_rates_and_frame():
+    times = [0.0, 0.5, 1.5, 1.5, 2.5]
+    np.testing.assert_array_equal(timeseries.counter_rates(times, [0, 10, 30, 40, 40]), [np.nan, 20, 20, np.nan, 0])
+    df = pd.DataFrame({'time_stamp': times, 'dropped_pkts': [0, 10, 30, 40, 40], 'other': 1})
+    frame = timeseries.counter_frame(df, 'time_stamp', ['dropped_pkts'], rates=True)
+    assert list(frame) == ['time_stamp', 'dropped_pkts', 'dropped_pkts_per_sec']
+    assert frame['dropped_pkts'].tolist() == [0, 10, 20, 10, 0]
+
+
+def test_bucket_values():
+    # Bucket k covers (k - 1, k]; times at or before the start fall into bucket 0
+    times = [0.0, 0.2, 1.0, 1.01, 3.5, np.nan]
+    labels, sums = timeseries.bucket_values(times, [1, 2, 3, 4, 5, 6])
+    np.testing.assert_array_equal(labels, [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(sums, [1, 5, 4, 0, 5])
+    assert sums.dtype == np.int64
+    np.testing.assert_array_equal(timeseries.bucket_values(times, how='count')[1], [1, 2, 1, 0, 1])
+    np.testing.assert_array_equal(timeseries.bucket_values(times, [1, 2, 3, 4, 5, 6], how='mean')[1], [1, 2.5, 4, np.nan, 5])
+    np.testing.assert_array_equal(timeseries.bucket_values(times, [1, 2, 3, 4, 5, 6], buckets=2)[1], [1, 5])
+    with pytest.raises(ValueError):
+        timeseries.bucket_values(times, [1, 2, 3, 4, 5, 6], how='max')
+
+
+def test_bucket_frame_per_flow_matches_groupby():
+    rng = np.random.default_rng(11)
+    df = pd.DataFrame({'dst_port': rng.choice([15611, 15612, 15613], 2000), 'src_port': rng.choice([40001, 40002], 2000),
+                       'time_stamp_sec': rng.uniform(0, 30, 2000), 'retx': 1})
+    frame = timeseries.bucket_frame(df, 'time_stamp_sec', ['retx'], width=2, by=['dst_port', 'src_port'])
+    assert len(frame) == 6 * 16
+    expected = df.assign(interval_sec=np.ceil(df['time_stamp_sec'] / 2) * 2).groupby(
+        ['dst_port', 'src_port', 'interval_sec'])['retx'].sum()
+    nonempty = frame[frame['retx'] > 0].set_index(['dst_port', 'src_port', 'interval_sec'])['retx']
+    pd.testing.assert_series_equal(nonempty, expected, check_dtype=False, check_index_type=False)